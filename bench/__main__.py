@@ -0,0 +1,240 @@
+"""
+Throughput benchmark for the sync engines against loopback stand-in servers.
+
+    python -m bench run --trees tiny,deep --scale 0.01 --latency 0.04 --out a.json
+    python -m bench startup --repeat 20 --out s.json
+    python -m bench replies --out r.json
+    python -m bench compare a.json b.json
+
+Every (engine, tree) case runs in a freshly spawned process, so CPU time and
+peak RSS belong to the client alone; the servers live in this process.
+``startup`` times fresh interpreters through the command line entry point,
+``replies`` the control reply reader and parsers against the old ones.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bench.cases import ENGINES, USER, PASSWD, run_case
+from bench.trees import TREES, make_tree
+
+def expected(kind, params):
+    if kind == 'deep':
+        count = params['depth'] * params['files_per_level']
+    else:
+        count = params['files']
+    return count, count * params['size']
+
+
+def git_revision():
+    try:
+        rev = subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], stderr=subprocess.DEVNULL) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return rev + ('-dirty' if dirty else '')
+
+
+def start_servers(engines, root, latency, rate, tls=None):
+    from bench.servers import FTPStandIn, SFTPStandIn, server_context
+    servers = {}
+    if {'syncdir', 'asyncftp'} & set(engines):
+        context = server_context(*tls) if tls else None
+        servers['ftp'] = FTPStandIn(root, USER, PASSWD, latency=latency, rate=rate, context=context)
+    if 'sftp' in engines:
+        servers['sftp'] = SFTPStandIn(root, USER, PASSWD, latency=latency, rate=rate)
+    addresses = {kind: server.start() for kind, server in servers.items()}
+    return servers, addresses
+
+
+def cmd_run(args):
+    engines = args.engines.split(',')
+    kinds = args.trees.split(',')
+    base = args.tree_dir or os.path.join(tempfile.gettempdir(), 'ftpa4-bench-trees')
+    os.makedirs(base, exist_ok=True)
+    ctx = multiprocessing.get_context('spawn')
+    tls = None
+    if args.tls:
+        from bench.servers import self_signed
+        tls = self_signed(base)
+    results = []
+    for kind in kinds:
+        root, params = make_tree(base, kind, args.scale)
+        servers, addresses = start_servers(engines, root, args.latency, args.rate, tls)
+        try:
+            for engine in engines:
+                host, port = addresses['sftp' if engine == 'sftp' else 'ftp']
+                for attempt in range(args.repeat):
+                    local = tempfile.mkdtemp(prefix=f'bench-{engine}-{kind}-', dir=args.work)
+                    try:
+                        with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+                            future = pool.submit(run_case, engine, host, port, '/', local, tls and tls[0])
+                            result = future.result(timeout=args.timeout)
+                    finally:
+                        shutil.rmtree(local, ignore_errors=True)
+                    files, size = expected(kind, params)
+                    result.update(engine=engine, tree=kind, attempt=attempt,
+                                  expected_files=files, expected_bytes=size,
+                                  complete=result['files'] == files)
+                    results.append(result)
+                    print(f"{engine:9} {kind:6} {result['files_per_s']:10.1f} files/s "
+                          f"{result['mb_per_s']:9.2f} MB/s  rss {result['peak_rss_kb']} KiB"
+                          + (f"  ERROR {result['error']}" if result['error'] else ''),
+                          file=sys.stderr)
+        finally:
+            for server in servers.values():
+                server.stop()
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': {
+            'scale': args.scale, 'latency': args.latency, 'rate': args.rate, 'tls': args.tls,
+            'trees': {kind: make_tree(base, kind, args.scale)[1] for kind in kinds},
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fd:
+            fd.write(text + '\n')
+    else:
+        print(text)
+
+
+# interpreter alone, argument parsing, and each backend with what it imports
+STARTUP = {
+    'python': ['-c', 'pass'],
+    'help': ['-m', 'sftpc', 'sync', 'ftp', '--help'],
+    'ftp': ['-c', 'from sftpc.cli import backend; backend("ftp")'],
+    'sftp': ['-c', 'from sftpc.cli import backend; backend("sftp")'],
+    'everything': ['-c', 'import dotenv, sftpc.sync_ftp, sftpc.sync_sftp, sftpc.shard, sftpc.mirrors, sftpc.watch'],
+}
+
+
+def cmd_startup(args):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cases = {}
+    for name, command in STARTUP.items():
+        times = []
+        for _ in range(args.repeat):
+            then = time.perf_counter()
+            subprocess.run([sys.executable, *command], cwd=root, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - then)
+        times.sort()
+        cases[name] = {'min_ms': times[0] * 1000, 'median_ms': times[len(times) // 2] * 1000, 'runs': len(times)}
+        print(f"{name:10} {cases[name]['min_ms']:8.1f} ms min {cases[name]['median_ms']:8.1f} ms median",
+              file=sys.stderr)
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'startup': cases,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fd:
+            fd.write(text + '\n')
+    else:
+        print(text)
+
+
+def cmd_replies(args):
+    from bench import replies
+    cases = replies.run(args.count, args.repeat)
+    for name, case in cases.items():
+        print(f"{name:15} {case['legacy_ns']:8.0f} ns legacy {case['current_ns']:8.0f} ns current "
+              f"(x{case['legacy_ns'] / case['current_ns']:.2f})", file=sys.stderr)
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'replies': cases,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fd:
+            fd.write(text + '\n')
+    else:
+        print(text)
+
+
+def best(results):
+    table = {}
+    for result in results:
+        key = (result['engine'], result['tree'])
+        if key not in table or result['seconds'] < table[key]['seconds']:
+            table[key] = result
+    return table
+
+
+def cmd_compare(args):
+    with open(args.old) as fd:
+        old = json.load(fd)
+    with open(args.new) as fd:
+        new = json.load(fd)
+    print(f"old {old.get('revision')}  new {new.get('revision')}")
+    before, after = best(old.get('results', [])), best(new.get('results', []))
+    for key in sorted(set(before) & set(after)):
+        a, b = before[key], after[key]
+        ratios = []
+        for field in ('files_per_s', 'mb_per_s'):
+            ratio = b[field] / a[field] if a[field] else float('inf')
+            ratios.append(f"{field} {a[field]:.1f} -> {b[field]:.1f} (x{ratio:.2f})")
+        rss = f"rss {a['peak_rss_kb']} -> {b['peak_rss_kb']} KiB"
+        print(f"{key[0]:9} {key[1]:6} " + '; '.join(ratios) + '; ' + rss)
+    for name in STARTUP:
+        if name in old.get('startup', {}) and name in new.get('startup', {}):
+            a, b = old['startup'][name]['min_ms'], new['startup'][name]['min_ms']
+            print(f"startup   {name:10} {a:.1f} -> {b:.1f} ms (x{b / a:.2f})")
+    for name in sorted(set(old.get('replies', {})) & set(new.get('replies', {}))):
+        a, b = old['replies'][name]['current_ns'], new['replies'][name]['current_ns']
+        print(f"replies   {name:15} {a:.0f} -> {b:.0f} ns (x{b / a:.2f})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help='run the benchmark matrix and emit JSON')
+    run.add_argument('--engines', default=','.join(ENGINES))
+    run.add_argument('--trees', default=','.join(TREES))
+    run.add_argument('--scale', type=float, default=1.0,
+                     help='multiplies file count (tiny, large) or depth (deep)')
+    run.add_argument('--latency', type=float, default=0.0, help='one-way seconds added by the shim')
+    run.add_argument('--rate', type=int, default=None, help='bytes/s cap per direction in the shim')
+    run.add_argument('--tls', action='store_true', help='explicit FTPS against a self-signed stand-in')
+    run.add_argument('--repeat', type=int, default=1)
+    run.add_argument('--timeout', type=float, default=None, help='seconds allowed per case')
+    run.add_argument('--tree-dir', default=None, help='where synthetic trees are cached')
+    run.add_argument('--work', default=None, help='scratch directory for downloads')
+    run.add_argument('--out', default=None)
+    run.set_defaults(func=cmd_run)
+    startup = sub.add_parser('startup', help='time interpreter start through the sftpc entry point')
+    startup.add_argument('--repeat', type=int, default=20)
+    startup.add_argument('--out', default=None)
+    startup.set_defaults(func=cmd_startup)
+    replies = sub.add_parser('replies', help='microbenchmark control reply reading and parsing')
+    replies.add_argument('--count', type=int, default=20000, help='replies per timed run')
+    replies.add_argument('--repeat', type=int, default=5)
+    replies.add_argument('--out', default=None)
+    replies.set_defaults(func=cmd_replies)
+    compare = sub.add_parser('compare', help='compare two result files')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.set_defaults(func=cmd_compare)
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
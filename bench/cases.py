@@ -0,0 +1,113 @@
+import asyncio
+import contextlib
+import logging
+import os
+import posixpath
+import resource
+import time
+import traceback
+
+ENGINES = ('syncdir', 'asyncftp', 'sftp')
+USER = PASSWD = 'bench'
+
+
+def tls_context(cafile):
+    if cafile is None:
+        return None
+    from bench.servers import client_context
+    return client_context(cafile)
+
+
+def engine_syncdir(host, port, remote, local, cafile=None):
+    from sftpc.ftpdirsync import Client
+    from sftpc.utils import SyncDir
+    client = Client(context=tls_context(cafile))
+    client.connect(host, port)
+    client.login(USER, PASSWD)
+    sync = SyncDir(local, remote, client)
+    sync.traverse()
+    sync.run()
+    client.quit()
+    return client.stats
+
+
+def engine_asyncftp(host, port, remote, local, cafile=None):
+    from sftpc.async_ftplib import AsyncFTP
+
+    async def walk():
+        ftp = AsyncFTP(context=tls_context(cafile))
+        await ftp.connect(host, port)
+        await ftp.login(USER, PASSWD)
+        stack = [(remote, local)]
+        while stack:
+            rdir, ldir = stack.pop()
+            os.makedirs(ldir, exist_ok=True)
+            files = []
+            for name, facts in await ftp.mlsd(rdir):
+                rpath, lpath = posixpath.join(rdir, name), os.path.join(ldir, name)
+                if facts.get('type') == 'dir':
+                    stack.append((rpath, lpath))
+                elif facts.get('type') == 'file':
+                    files.append((rpath, lpath))
+            if files:
+                await ftp.get_many(files)
+        await ftp.quit()
+        return ftp.stats
+
+    return asyncio.run(walk())
+
+
+def engine_sftp(host, port, remote, local, cafile=None):
+    from sftpc import aio_sftp
+    asyncio.run(aio_sftp.run_client(host, port, USER, PASSWD, local, remote))
+
+
+def measure_tree(path):
+    files = size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return files, size
+
+
+def peak_rss_kb():
+    # ru_maxrss survives exec and would report the spawning parent's peak
+    try:
+        with open('/proc/self/status') as fd:
+            for line in fd:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(engine, host, port, remote, local, cafile=None):
+    logging.disable(logging.INFO)
+    error = stats = None
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    then = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+            stats = globals()['engine_' + engine](host, port, remote, local, cafile)
+    except BaseException as exc:
+        error = ''.join(traceback.format_exception_only(type(exc), exc)).strip()
+    seconds = time.perf_counter() - then
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    files, size = measure_tree(local)
+    result = {
+        'seconds': seconds,
+        'files': files,
+        'bytes': size,
+        'files_per_s': files / seconds if seconds else 0.0,
+        'mb_per_s': size / seconds / 1e6 if seconds else 0.0,
+        'cpu_user': after.ru_utime - before.ru_utime,
+        'cpu_sys': after.ru_stime - before.ru_stime,
+        'peak_rss_kb': peak_rss_kb(),
+        'error': error,
+    }
+    if stats is not None and stats.tls_handshakes:
+        result.update(tls_handshakes=stats.tls_handshakes, tls_resumed=stats.tls_resumed,
+                      tls_time=stats.tls_time)
+    return result
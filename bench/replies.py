@@ -0,0 +1,167 @@
+"""
+Microbenchmarks of control reply reading and parsing.
+
+``legacy_*`` are the text-mode reader and ``parse*`` helpers the clients
+used before ``sftpc.replies``, kept here to measure against.
+"""
+import io
+import logging
+import re
+import time
+
+from sftpc import replies
+
+CRLF = '\r\n'
+
+# both readers log like the clients do: the old one every line, the new one every reply
+logger = logging.getLogger(__name__)
+
+# what a sync mostly reads: transfers, passive mode, directories, features
+SAMPLES = [
+    b'150 Opening BINARY mode data connection for file.bin (1048576 bytes)\r\n',
+    b'226 Transfer complete\r\n',
+    b'227 Entering Passive Mode (127,0,0,1,200,10).\r\n',
+    b'229 Entering Extended Passive Mode (|||6446|)\r\n',
+    b'257 "/srv/ftp/some ""quoted"" directory/with a longer name" is the current directory\r\n',
+    b'200 Type set to I\r\n',
+    b'211-Features:\r\n MDTM\r\n SIZE\r\n MLST type*;size*;modify*;unique*;\r\n REST STREAM\r\n'
+    b' EPSV\r\n HASH SHA-256*;SHA-1;MD5\r\n UTF8\r\n AUTH TLS\r\n PBSZ\r\n PROT\r\n211 End\r\n',
+]
+
+
+class legacy_rx:
+    _150_re = None
+    _227_re = None
+
+
+def legacy_reader(data):
+    # what socket.makefile('r') builds over the connection
+    return io.TextIOWrapper(io.BufferedReader(io.BytesIO(data)), 'utf8')
+
+
+def legacy_getline(file):
+    line = file.readline(2**24 + 1)
+    if not line:
+        raise EOFError
+    if line[-2:] == CRLF:
+        line = line[:-2]
+    elif line[-1:] in CRLF:
+        line = line[:-1]
+    logger.debug(line)
+    return line
+
+
+def legacy_getmultiline(file):
+    line = legacy_getline(file)
+    if line[3:4] == '-':
+        code = line[:3]
+        while True:
+            nextline = legacy_getline(file)
+            line += '\n' + nextline
+            if nextline[:3] == code and nextline[3:4] != '-':
+                break
+    return line
+
+
+def legacy_parse150(resp):
+    if resp[:3] != '150': raise Exception(resp)
+    if legacy_rx._150_re is None: legacy_rx._150_re = re.compile(r"150 .* \((\d+) bytes\)", re.IGNORECASE | re.ASCII)
+    m = legacy_rx._150_re.match(resp)
+    if not m: return None
+    return int(m.group(1))
+
+
+def legacy_parse227(resp):
+    if resp[:3] != '227':  raise Exception(resp)
+    if legacy_rx._227_re is None: legacy_rx._227_re = re.compile(r'(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)', re.ASCII)
+    m = legacy_rx._227_re.search(resp)
+    if not m:  raise Exception(resp)
+    numbers = m.groups()
+    host = '.'.join(numbers[:4])
+    port = (int(numbers[4]) << 8) + int(numbers[5])
+    return host, port
+
+
+def legacy_parse229(resp, peer):
+    if resp[:3] != '229': raise Exception(resp)
+    left = resp.find('(')
+    if left < 0: raise Exception(resp)
+    right = resp.find(')', left + 1)
+    if right < 0:  raise Exception(resp)
+    if resp[left + 1] != resp[right - 1]:  raise Exception(resp)
+    parts = resp[left + 1:right].split(resp[left+1])
+    if len(parts) != 5: raise Exception(resp)
+    host = peer[0]
+    port = int(parts[3])
+    return host, port
+
+
+def legacy_parse257(resp):
+    if resp[:3] != '257': raise Exception(resp)
+    if resp[3:5] != ' "': return ''
+    dirname = ''
+    i, n = 5, len(resp)
+    while i < n:
+        c, i = resp[i], i+1
+        if c == '"':
+            if i >= n or resp[i] != '"':
+                break
+            i = i+1
+        dirname += c
+    return dirname
+
+
+LEGACY = {'150': legacy_parse150, '227': legacy_parse227, '229': lambda resp: legacy_parse229(resp, ('h', 0)),
+          '257': legacy_parse257}
+CURRENT = {'150': replies.parse150, '227': replies.parse227, '229': lambda resp: replies.parse229(resp, ('h', 0)),
+           '257': replies.parse257}
+
+
+def read_legacy(data, count):
+    file = legacy_reader(data)
+    for _ in range(count):
+        legacy_getmultiline(file)
+
+
+def read_current(data, count):
+    reader = replies.ReplyReader(io.BufferedReader(io.BytesIO(data)))
+    for _ in range(count):
+        logger.debug(reader.read())
+
+
+def parse_all(parser, line, count):
+    for _ in range(count):
+        parser(line)
+
+
+def timed(function, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        then = time.perf_counter()
+        function(*args)
+        seconds = time.perf_counter() - then
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def run(count=20000, repeat=5):
+    """ns per reply of reading, and of each parser, old against new, best of ``repeat``."""
+    data = b''.join(SAMPLES[i % len(SAMPLES)] for i in range(count))
+    single = b''.join(SAMPLES[:-1]) * (count // (len(SAMPLES) - 1))
+    cases = {
+        'read_mixed': (read_legacy, read_current, (data, count)),
+        'read_single': (read_legacy, read_current, (single, count // (len(SAMPLES) - 1) * (len(SAMPLES) - 1))),
+        'read_multiline': (read_legacy, read_current, (SAMPLES[-1] * count, count)),
+    }
+    results = {}
+    for name, (old, new, args) in cases.items():
+        a, b = timed(old, *args, repeat=repeat), timed(new, *args, repeat=repeat)
+        results[name] = {'legacy_ns': a / args[1] * 1e9, 'current_ns': b / args[1] * 1e9}
+    for sample in SAMPLES:
+        line = sample.decode().rstrip('\r\n')
+        code = line[:3]
+        if code in LEGACY:
+            a = timed(parse_all, LEGACY[code], line, count, repeat=repeat)
+            b = timed(parse_all, CURRENT[code], line, count, repeat=repeat)
+            results['parse' + code] = {'legacy_ns': a / count * 1e9, 'current_ns': b / count * 1e9}
+    return results
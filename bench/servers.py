@@ -0,0 +1,506 @@
+import asyncio
+import hashlib
+import os
+import posixpath
+import socket
+import socketserver
+import ssl
+import subprocess
+import threading
+import time
+import zlib
+
+from bench.shim import Shim
+
+CRLF = b'\r\n'
+
+# HASH algorithm names as in draft-bryan-ftpext-hash
+HASHES = {'SHA-256': 'sha256', 'SHA-1': 'sha1', 'MD5': 'md5', 'CRC32': 'crc32'}
+
+
+def self_signed(directory, host='127.0.0.1'):
+    """Write a throwaway certificate for ``host`` and return (certfile, keyfile)."""
+    certfile = os.path.join(directory, 'standin-cert.pem')
+    keyfile = os.path.join(directory, 'standin-key.pem')
+    if not os.path.exists(certfile):
+        subprocess.run([
+            'openssl', 'req', '-x509', '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1',
+            '-nodes', '-days', '30', '-subj', '/CN=localhost',
+            '-addext', f'subjectAltName=DNS:localhost,IP:{host}',
+            '-keyout', keyfile, '-out', certfile,
+        ], check=True, capture_output=True)
+    return certfile, keyfile
+
+
+def server_context(certfile, keyfile):
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+def client_context(certfile):
+    return ssl.create_default_context(cafile=certfile)
+
+
+def file_digest(path, algorithm):
+    if algorithm == 'crc32':
+        value = 0
+        with open(path, 'rb') as fd:
+            for block in iter(lambda: fd.read(1 << 20), b''):
+                value = zlib.crc32(block, value)
+        return '%08X' % value
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fd:
+        for block in iter(lambda: fd.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def mlsx_facts(path, st):
+    kind = 'dir' if os.path.isdir(path) else 'file'
+    modify = time.strftime('%Y%m%d%H%M%S', time.gmtime(st.st_mtime))
+    return f"type={kind};size={st.st_size};modify={modify};unique={st.st_dev:x}U{st.st_ino:x};"
+
+
+class FTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough of RFC 959/3659 to drive ``Client`` and ``AsyncFTP``.
+
+    Commands are read and answered strictly in order, so clients may pipeline
+    them the way a real single-threaded session server would accept.
+    """
+
+    def setup(self):
+        # like production servers, answer replies without Nagle delays
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().setup()
+        self.cwd = '/'
+        self.rest = None
+        self.pasv = None
+        self.user = None
+        self.prot = 'C'
+        self.hash = 'SHA-256'
+        self.rename_from = None
+
+    @property
+    def root(self):
+        return self.server.root
+
+    def reply(self, line):
+        self.wfile.write(line.encode('utf8') + CRLF)
+        self.wfile.flush()
+
+    def handle(self):
+        with self.server.lock:
+            refuse = self.server.max_connections is not None and self.server.active >= self.server.max_connections
+            if not refuse:
+                self.server.active += 1
+        if refuse:
+            self.reply('421 Too many connections from this IP')
+            return
+        try:
+            self.session()
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def session(self):
+        self.reply('220 FTPa4 stand-in ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            line = line.decode('utf8').rstrip('\r\n')
+            cmd, _, arg = line.partition(' ')
+            method = getattr(self, 'ftp_' + cmd.upper(), None)
+            if method is None:
+                self.reply('502 Command not implemented')
+                continue
+            try:
+                if method(arg) is False:
+                    break
+            except OSError as exc:
+                self.reply(f'550 {exc.strerror or exc}')
+        self.close_pasv()
+
+    def resolve(self, arg):
+        virtual = posixpath.normpath(posixpath.join(self.cwd, arg or '.'))
+        if not virtual.startswith('/'):
+            virtual = '/' + virtual
+        return virtual, os.path.join(self.root, virtual.lstrip('/'))
+
+    def close_pasv(self):
+        if self.pasv is not None:
+            sock, shim = self.pasv
+            sock.close()
+            if shim is not None:
+                shim.close()
+            self.pasv = None
+
+    def open_data(self):
+        if self.pasv is None:
+            self.reply('425 Use PASV or EPSV first')
+            return None
+        sock, _ = self.pasv
+        sock.settimeout(30)
+        try:
+            conn, _ = sock.accept()
+        finally:
+            self.close_pasv()
+        conn.settimeout(30)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.prot == 'P':
+            conn = self.server.context.wrap_socket(conn, server_side=True)
+        return conn
+
+    def close_data(self, conn):
+        if isinstance(conn, ssl.SSLSocket):
+            try: conn.unwrap()
+            except OSError: pass
+        conn.close()
+
+    def ftp_AUTH(self, arg):
+        if self.server.context is None or arg.upper() not in ('TLS', 'SSL'):
+            self.reply('504 AUTH not supported')
+            return
+        self.reply('234 AUTH TLS successful')
+        self.request = self.connection = self.server.context.wrap_socket(self.request, server_side=True)
+        self.rfile = self.request.makefile('rb')
+        self.wfile = self.request.makefile('wb')
+
+    def ftp_PBSZ(self, arg):
+        self.reply('200 PBSZ=0')
+
+    def ftp_PROT(self, arg):
+        if arg.upper() not in ('C', 'P'):
+            self.reply('536 PROT level not supported')
+            return
+        self.prot = arg.upper()
+        self.reply(f'200 Protection level set to {self.prot}')
+
+    def ftp_USER(self, arg):
+        self.user = arg
+        self.reply('331 Password required')
+
+    def ftp_PASS(self, arg):
+        if (self.user, arg) != (self.server.user, self.server.passwd):
+            self.reply('530 Login incorrect')
+            return
+        self.reply('230 Logged in')
+
+    def ftp_QUIT(self, arg):
+        self.reply('221 Goodbye')
+        return False
+
+    def ftp_NOOP(self, arg):
+        self.reply('200 NOOP ok')
+
+    def ftp_SYST(self, arg):
+        self.reply('215 UNIX Type: L8')
+
+    def ftp_TYPE(self, arg):
+        self.reply(f'200 Type set to {arg}')
+
+    def ftp_OPTS(self, arg):
+        option, _, value = arg.partition(' ')
+        if option.upper() == 'HASH' and 'HASH' in self.server.hashes:
+            if value.upper() not in HASHES:
+                self.reply('501 Unknown algorithm')
+                return
+            self.hash = value.upper()
+            self.reply(f'200 {self.hash}')
+            return
+        self.reply('200 OK')
+
+    def ftp_FEAT(self, arg):
+        self.wfile.write(b'211-Features:\r\n')
+        feats = ['MLST type*;size*;modify*;unique*;', 'SIZE', 'MDTM', 'REST STREAM', 'UTF8', 'EPSV']
+        for name in self.server.hashes:
+            if name == 'HASH':
+                feats.append('HASH ' + ';'.join(n + '*' * (n == self.hash) for n in HASHES))
+            else:
+                feats.append(name)
+        for feat in feats:
+            self.wfile.write(b' ' + feat.encode() + CRLF)
+        self.reply('211 End')
+
+    def hashed_file(self, command, arg):
+        if command not in self.server.hashes:
+            self.reply('502 Command not implemented')
+            return None
+        _, real = self.resolve(arg)
+        if not os.path.isfile(real):
+            self.reply('550 Not a regular file')
+            return None
+        return real
+
+    def ftp_HASH(self, arg):
+        real = self.hashed_file('HASH', arg)
+        if real is not None:
+            size = os.path.getsize(real)
+            digest = file_digest(real, HASHES[self.hash])
+            self.reply(f'213 {self.hash} 0-{size} {digest} {arg}')
+
+    def ftp_XSHA1(self, arg):
+        real = self.hashed_file('XSHA1', arg)
+        if real is not None:
+            self.reply('213 ' + file_digest(real, 'sha1'))
+
+    def ftp_XMD5(self, arg):
+        real = self.hashed_file('XMD5', arg)
+        if real is not None:
+            self.reply('251 ' + file_digest(real, 'md5'))
+
+    def ftp_XCRC(self, arg):
+        real = self.hashed_file('XCRC', arg)
+        if real is not None:
+            self.reply('250 ' + file_digest(real, 'crc32'))
+
+    def ftp_PWD(self, arg):
+        self.reply('257 "%s" is the current directory' % self.cwd.replace('"', '""'))
+
+    def ftp_CWD(self, arg):
+        virtual, real = self.resolve(arg)
+        if not os.path.isdir(real):
+            self.reply('550 No such directory')
+            return
+        self.cwd = virtual
+        self.reply('250 OK')
+
+    def ftp_CDUP(self, arg):
+        return self.ftp_CWD('..')
+
+    def ftp_SIZE(self, arg):
+        _, real = self.resolve(arg)
+        if not os.path.isfile(real):
+            self.reply('550 Not a regular file')
+            return
+        self.reply(f'213 {os.path.getsize(real)}')
+
+    def ftp_MDTM(self, arg):
+        _, real = self.resolve(arg)
+        st = os.stat(real)
+        self.reply('213 ' + time.strftime('%Y%m%d%H%M%S', time.gmtime(st.st_mtime)))
+
+    def ftp_DELE(self, arg):
+        _, real = self.resolve(arg)
+        if not os.path.isfile(real):
+            self.reply('550 Not a regular file')
+            return
+        os.remove(real)
+        self.reply('250 Deleted')
+
+    def ftp_RNFR(self, arg):
+        _, real = self.resolve(arg)
+        if not os.path.exists(real):
+            self.reply('550 No such file or directory')
+            return
+        self.rename_from = real
+        self.reply('350 Ready for RNTO')
+
+    def ftp_RNTO(self, arg):
+        source, self.rename_from = self.rename_from, None
+        if source is None:
+            self.reply('503 RNFR first')
+            return
+        _, real = self.resolve(arg)
+        os.rename(source, real)
+        self.reply('250 Renamed')
+
+    def ftp_MKD(self, arg):
+        virtual, real = self.resolve(arg)
+        os.mkdir(real)
+        self.reply('257 "%s" created' % virtual.replace('"', '""'))
+
+    def ftp_RMD(self, arg):
+        _, real = self.resolve(arg)
+        os.rmdir(real)
+        self.reply('250 Removed')
+
+    def ftp_REST(self, arg):
+        self.rest = int(arg)
+        self.reply(f'350 Restarting at {self.rest}')
+
+    def listen_pasv(self):
+        self.close_pasv()
+        host = self.request.getsockname()[0]
+        sock = socket.create_server((host, 0), backlog=1)
+        port = sock.getsockname()[1]
+        shim = None
+        if self.server.latency or self.server.rate:
+            shim = Shim((host, port), self.server.latency, self.server.rate, host=host, once=True)
+            port = shim.port
+        self.pasv = (sock, shim)
+        return host, port
+
+    def ftp_PASV(self, arg):
+        host, port = self.listen_pasv()
+        bits = host.split('.') + [str(port >> 8), str(port & 0xff)]
+        self.reply('227 Entering Passive Mode (%s)' % ','.join(bits))
+
+    def ftp_EPSV(self, arg):
+        _, port = self.listen_pasv()
+        self.reply(f'229 Entering Extended Passive Mode (|||{port}|)')
+
+    def ftp_RETR(self, arg):
+        _, real = self.resolve(arg)
+        if not os.path.isfile(real):
+            self.close_pasv()
+            self.reply('550 No such file')
+            return
+        size = os.path.getsize(real)
+        offset, self.rest = self.rest or 0, None
+        self.reply(f'150 Opening BINARY mode data connection for {arg} ({size} bytes)')
+        conn = self.open_data()
+        if conn is None:
+            return
+        with open(real, 'rb') as fd:
+            if size - offset > 0:
+                conn.sendfile(fd, offset)
+        self.close_data(conn)
+        self.reply('226 Transfer complete')
+
+    def send_lines(self, lines):
+        self.reply('150 Here comes the listing')
+        conn = self.open_data()
+        if conn is None:
+            return
+        conn.sendall(b''.join(line.encode('utf8') + CRLF for line in lines))
+        self.close_data(conn)
+        self.reply('226 Directory send OK')
+
+    def ftp_MLSD(self, arg):
+        virtual, real = self.resolve(arg)
+        if os.path.isfile(real):
+            # RFC 3659: MLSD only lists directories, as pyftpdlib and proftpd enforce
+            self.close_pasv()
+            self.reply('501 Not a directory')
+            return
+        if not os.path.isdir(real):
+            self.close_pasv()
+            self.reply('550 No such directory')
+            return
+        lines = [
+            mlsx_facts(real, os.stat(real)).replace('type=dir', 'type=cdir') + ' .',
+            mlsx_facts(real, os.stat(real)).replace('type=dir', 'type=pdir') + ' ..',
+        ]
+        with os.scandir(real) as it:
+            for entry in it:
+                lines.append(mlsx_facts(entry.path, entry.stat()) + ' ' + entry.name)
+        self.send_lines(lines)
+
+    def ftp_NLST(self, arg):
+        _, real = self.resolve(arg)
+        self.send_lines(sorted(os.listdir(real)))
+
+
+class FTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    Threaded loopback FTP server exporting ``root``, optionally with FTPS.
+
+    ``latency`` and ``rate`` put a ``Shim`` in front of the control port and
+    of every passive data port, so both channels see the shaped link.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    handler = FTPHandler
+
+    def __init__(self, root, user='bench', passwd='bench', host='127.0.0.1', latency=0.0, rate=None, context=None,
+                 max_connections=None, hashes=('HASH', 'XSHA1', 'XMD5', 'XCRC')):
+        self.root = os.path.abspath(root)
+        # file hash commands advertised in FEAT and answered
+        self.hashes = hashes
+        # like a per-IP limit: sessions beyond it are refused with 421
+        self.max_connections = max_connections
+        self.active = 0
+        self.lock = threading.Lock()
+        self.user = user
+        self.passwd = passwd
+        self.latency = latency
+        self.rate = rate
+        # a server-side ssl.SSLContext enables AUTH TLS / PROT P
+        self.context = context
+        super().__init__((host, 0), self.handler)
+        self.shim = None
+        if latency or rate:
+            self.shim = Shim(self.server_address, latency, rate, host=host)
+
+    @property
+    def address(self):
+        if self.shim is not None:
+            return self.shim.address
+        return self.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self.address
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.shim is not None:
+            self.shim.close()
+
+
+class SFTPStandIn:
+    """Loopback asyncssh SFTP server chrooted at ``root``, run on its own loop."""
+
+    def __init__(self, root, user='bench', passwd='bench', host='127.0.0.1', latency=0.0, rate=None):
+        self.root = os.path.abspath(root)
+        self.user = user
+        self.passwd = passwd
+        self.host = host
+        self.latency = latency
+        self.rate = rate
+        self.loop = None
+        self.shim = None
+        self.server_address = None
+
+    def start(self):
+        import asyncssh
+
+        ready = threading.Event()
+        root, user, passwd = self.root, self.user, self.passwd
+
+        class Server(asyncssh.SSHServer):
+            def password_auth_supported(self):
+                return True
+
+            def validate_password(self, username, password):
+                return (username, password) == (user, passwd)
+
+        def sftp_factory(chan):
+            return asyncssh.SFTPServer(chan, chroot=root)
+
+        async def serve():
+            key = asyncssh.generate_private_key('ssh-ed25519')
+            self.acceptor = await asyncssh.listen(
+                self.host, 0, server_factory=Server, server_host_keys=[key],
+                sftp_factory=sftp_factory, allow_scp=False)
+            self.server_address = self.acceptor.sockets[0].getsockname()[:2]
+            ready.set()
+            await self.acceptor.wait_closed()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(serve())
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        if self.latency or self.rate:
+            self.shim = Shim(self.server_address, self.latency, self.rate, host=self.host)
+        return self.address
+
+    @property
+    def address(self):
+        if self.shim is not None:
+            return self.shim.address
+        return self.server_address
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.acceptor.close)
+        if self.shim is not None:
+            self.shim.close()
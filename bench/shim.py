@@ -0,0 +1,107 @@
+import socket
+import threading
+import time
+from collections import deque
+
+CHUNK = 1 << 16
+
+
+class Shim:
+    """
+    TCP forwarder that adds one-way latency and an optional bandwidth cap.
+
+    Parameters
+    ----------
+    target : tuple
+        (host, port) every accepted connection is forwarded to.
+    latency : float
+        seconds added in each direction.
+    rate : int
+        bytes per second per direction, ``None`` for unlimited.
+    once : bool
+        stop listening after the first accepted connection.
+    """
+
+    def __init__(self, target, latency=0.0, rate=None, host='127.0.0.1', once=False):
+        self.target = target
+        self.latency = latency
+        self.rate = rate
+        self.once = once
+        self.sock = socket.create_server((host, 0))
+        self.address = self.sock.getsockname()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.address[1]
+
+    def serve(self):
+        while True:
+            try:
+                down, _ = self.sock.accept()
+            except OSError:
+                return
+            try:
+                up = socket.create_connection(self.target)
+            except OSError:
+                down.close()
+                continue
+            for sock in (up, down):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            Pipe(down, up, self.latency, self.rate)
+            Pipe(up, down, self.latency, self.rate)
+            if self.once:
+                self.close()
+                return
+
+    def close(self):
+        try: self.sock.close()
+        except OSError: pass
+
+
+class Pipe:
+    """One direction of a shimmed connection: reader stamps, writer delays."""
+
+    def __init__(self, src, dst, latency, rate):
+        self.src = src
+        self.dst = dst
+        self.latency = latency
+        self.rate = rate
+        self.buf = deque()
+        self.ready = threading.Condition()
+        threading.Thread(target=self.reader, daemon=True).start()
+        threading.Thread(target=self.writer, daemon=True).start()
+
+    def reader(self):
+        while True:
+            try:
+                data = self.src.recv(CHUNK)
+            except OSError:
+                data = b''
+            with self.ready:
+                self.buf.append((time.monotonic() + self.latency, data))
+                self.ready.notify()
+            if not data:
+                return
+
+    def writer(self):
+        while True:
+            with self.ready:
+                while not self.buf:
+                    self.ready.wait()
+                due, data = self.buf.popleft()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if not data:
+                try: self.dst.shutdown(socket.SHUT_WR)
+                except OSError: pass
+                return
+            try:
+                self.dst.sendall(data)
+            except OSError:
+                self.src.close()
+                return
+            if self.rate:
+                time.sleep(len(data) / self.rate)
@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+
+GiB = 1 << 30
+
+TREES = {
+    # name: (description, default parameters)
+    'tiny': ('1M tiny files, 1000 per directory', {'files': 1_000_000, 'per_dir': 1000, 'size': 256}),
+    'deep': ('deep narrow chain of single directories', {'depth': 1200, 'files_per_level': 2, 'size': 4096}),
+    'large': ('100 x 1 GiB sparse files', {'files': 100, 'size': GiB}),
+}
+
+
+def scaled(kind, scale=1.0, **overrides):
+    params = dict(TREES[kind][1])
+    key = {'tiny': 'files', 'deep': 'depth', 'large': 'files'}[kind]
+    params[key] = max(1, int(params[key] * scale))
+    params.update(overrides)
+    return params
+
+
+def make_tiny(root, files, per_dir, size):
+    payload = b'x' * size
+    for i in range(files):
+        folder = os.path.join(root, f'd{i // per_dir:05d}')
+        if i % per_dir == 0:
+            os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f'f{i:07d}'), 'wb') as fd:
+            fd.write(payload)
+
+
+def make_deep(root, depth, files_per_level, size):
+    payload = b'y' * size
+    folder = root
+    for level in range(depth):
+        folder = os.path.join(folder, 'd')
+        os.mkdir(folder)
+        for i in range(files_per_level):
+            with open(os.path.join(folder, f'f{i}'), 'wb') as fd:
+                fd.write(payload)
+
+
+def make_large(root, files, size):
+    # sparse, so the tree costs no real disk; the one written trailing byte
+    # keeps hole-skipping SFTP copies from truncating the file to nothing
+    for i in range(files):
+        with open(os.path.join(root, f'big{i:03d}.bin'), 'wb') as fd:
+            fd.truncate(size)
+            fd.seek(size - 1)
+            fd.write(b'\0')
+
+
+def make_tree(base, kind, scale=1.0, **overrides):
+    """
+    Build (or reuse) a synthetic tree under ``base`` and return its path.
+
+    A ``.spec`` file records the parameters, so a tree is only regenerated
+    when they change; the 1M file tree takes a while to write.
+    """
+    params = scaled(kind, scale, **overrides)
+    root = os.path.join(base, kind)
+    spec_path = os.path.join(base, f'.{kind}.spec')
+    if os.path.exists(spec_path):
+        with open(spec_path) as fd:
+            if json.load(fd) == params:
+                return root, params
+        shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root, exist_ok=True)
+    globals()['make_' + kind](root, **params)
+    with open(spec_path, 'w') as fd:
+        json.dump(params, fd)
+    return root, params
@@ -1,3 +0,0 @@
-import logging
-
-logging.basicConfig(level=logging.INFO, format="%(msg)s")
@@ -0,0 +1,5 @@
+import sys
+
+from sftpc.cli import main
+
+sys.exit(main())
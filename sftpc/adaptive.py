@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AIMDController:
+    """
+    Admission gate whose width follows additive-increase/multiplicative-decrease.
+
+    Workers call ``acquire`` before a unit of work and ``release`` after it
+    with the bytes moved and whether it failed.  Every ``interval`` seconds
+    the window's throughput and error rate are compared to the previous
+    window: errors or a throughput drop shrink the limit by ``decrease``,
+    a throughput gain grows it by ``increase``, a plateau holds it at the
+    knee.
+
+    Parameters
+    ----------
+    minimum, maximum : int
+        bounds for the number of concurrent workers.
+    start : int
+        initial limit, ``minimum`` by default.
+    tolerance : float
+        relative throughput change treated as noise.
+    error_threshold : float
+        failed fraction of a window that counts as congestion.
+    """
+
+    def __init__(self, minimum=1, maximum=8, start=None, increase=1, decrease=0.5,
+                 interval=2.0, tolerance=0.05, error_threshold=0.05, name='transfer'):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(maximum, start or minimum))
+        self.increase = increase
+        self.decrease = decrease
+        self.interval = interval
+        self.tolerance = tolerance
+        self.error_threshold = error_threshold
+        self.name = name
+        self.active = 0
+        self.busy = 0
+        self.bytes = 0
+        self.items = 0
+        self.errors = 0
+        self.previous = None
+        self.grew = False
+        self.window = time.monotonic()
+        self.history = []
+        self.waiters = []
+        self.cond = threading.Condition()
+
+    def try_acquire(self):
+        with self.cond:
+            if self.active < self.limit:
+                self.active += 1
+                self.busy = max(self.busy, self.active)
+                return True
+            return False
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit:
+                self.cond.wait(self.interval)
+                self.adjust()
+                self.wake()
+            self.active += 1
+            self.busy = max(self.busy, self.active)
+
+    async def aacquire(self):
+        with self.cond:
+            if self.active < self.limit and not self.waiters:
+                self.active += 1
+                self.busy = max(self.busy, self.active)
+                return
+            import asyncio
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self.waiters.append((loop, future))
+        # the slot is handed over by wake() before the future resolves
+        await future
+
+    def release(self, size=0, items=1, errors=0):
+        with self.cond:
+            self.active -= 1
+            self.bytes += size
+            self.items += items
+            self.errors += errors
+            self.adjust()
+            self.wake()
+
+    def wake(self):
+        while self.waiters and self.active < self.limit:
+            loop, future = self.waiters.pop(0)
+            self.active += 1
+            self.busy = max(self.busy, self.active)
+            loop.call_soon_threadsafe(self.hand_over, future)
+        self.cond.notify_all()
+
+    def hand_over(self, future):
+        if future.cancelled():
+            self.release(items=0)
+        else:
+            future.set_result(None)
+
+    def adjust(self):
+        now = time.monotonic()
+        elapsed = now - self.window
+        if elapsed < self.interval:
+            return
+        done = self.items + self.errors
+        throughput = self.bytes / elapsed
+        error_rate = self.errors / done if done else 0.0
+        busy, self.busy = self.busy, self.active
+        self.bytes = self.items = self.errors = 0
+        self.window = now
+        if not done:
+            return
+        old, reason = self.limit, None
+        previous, self.previous = self.previous, throughput
+        if error_rate > self.error_threshold:
+            self.limit, reason = max(self.minimum, int(self.limit * self.decrease)), 'errors'
+        elif self.grew and throughput < previous * (1 - self.tolerance):
+            # the last step went past the knee
+            self.limit, reason = max(self.minimum, int(self.limit * self.decrease)), 'throughput drop'
+        elif previous is None or throughput > previous * (1 + self.tolerance):
+            # only probe wider if the current width is actually in use
+            if busy >= self.limit:
+                self.limit, reason = min(self.maximum, self.limit + self.increase), 'throughput gain'
+        self.grew = self.limit > old
+        if reason is not None and self.limit != old:
+            self.history.append((time.time(), old, self.limit, throughput, error_rate, reason))
+            logger.info("%s workers %d -> %d (%s: %.2f MB/s, %.1f%% errors)",
+                        self.name, old, self.limit, reason, throughput / 1e6, error_rate * 100)
@@ -1,70 +1,208 @@
 import asyncio
 import asyncssh
+import logging
 import os
 import random
+import socket
 import time
 
+from sftpc.adaptive import AIMDController
+from sftpc.backlog import Backlog
+from sftpc.filters import relative
+from sftpc.localindex import LocalIndex, FILE, DIR
+from sftpc.partfile import DATA, finish, part_path
+
+
+logger = logging.getLogger(__name__)
+
+BLOCKSIZE = 1 << 18
+# asyncssh's default SSH channel window
+DEFAULT_WINDOW = 2 << 20
+
 
 class SFTP:
 
-    def __init__(self, client):
+    # downloads the walk may run ahead of the transfer workers
+    queue_size = 256
+    # SFTP servers offer no file hash to compare with, so verification
+    # counts the bytes received against the stat size
+    verify = False
+    verify_retries = 2
+    # read size of throttled and verified downloads
+    blocksize = BLOCKSIZE
+
+    def __init__(self, client, limiter=None, host=None, transfers=None, listings=None, filter=None, root=None,
+                 backlog=None):
         self.client = client
+        self.limiter = limiter
+        self.host = host
+        # AIMD gates on the task fan-out: downloads and directory reads
+        self.transfers = transfers or AIMDController(1, 32, name='transfer')
+        self.listings = listings or AIMDController(1, 32, name='listing')
+        self.index = LocalIndex()
+        self.fsync = DATA
+        # a filters.Filter applied to paths relative to ``root``
+        self.filter = filter
+        self.root = root
+        # entries waiting to be visited, bounded in memory
+        self.backlog = backlog or Backlog()
+        self.errors = []
         self.count = 0
         self.download = 0
         self.already_had = 0
+        self.filtered = 0
+        self.mismatches = 0
 
     def print_stats(self):
         msg = [
             f"Processed: {self.count}",
             f"Downloading: {self.download}",
-            f"Exist: {self.already_had}"
+            f"Exist: {self.already_had}",
+            f"Filtered: {self.filtered}"
         ]
         print('\t'.join(msg), end='\r')
 
-    async def get_file(self, local, remote, size):
+    async def get_file(self, local, remote, size, mtime=None):
         self.download += 1
         self.print_stats()
         then = time.time()
-        await self.client.get(remote, local)
+        part = part_path(local)
+        await self.transfers.aacquire()
+        try:
+            attempt = 0
+            while True:
+                if self.limiter is None and not self.verify:
+                    await self.client.get(remote, part)
+                    break
+                received = await self.throttled_get(part, remote)
+                if not self.verify or received == size:
+                    break
+                self.mismatches += 1
+                if attempt >= self.verify_retries:
+                    raise Exception(f'{remote}: received {received} of {size} bytes')
+                attempt += 1
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, finish, part, local, mtime, self.fsync)
+        except Exception:
+            self.transfers.release(errors=1, items=0)
+            raise
+        self.transfers.release(size)
         metrics_output(then, size, local)
         return
 
+    async def throttled_get(self, local, remote):
+        limiter = self.limiter
+        blocksize = self.blocksize
+        if limiter is not None:
+            blocksize = limiter.blocksize(self.host, blocksize)
+        received = 0
+        async with self.client.open(remote, 'rb') as src:
+            with open(local, 'wb') as dst:
+                while True:
+                    data = await src.read(blocksize)
+                    if not data:
+                        break
+                    dst.write(data)
+                    received += len(data)
+                    if limiter is not None:
+                        await limiter.athrottle(self.host, len(data))
+        return received
+
     async def traverse(self, local, remote):
+        """
+        Mirror ``remote`` into ``local``.
+
+        Walker tasks take entries from the backlog and feed files to a
+        bounded queue drained by the download tasks, so the walk waits for
+        the downloads instead of running ahead of them.
+        """
+        self.queue = asyncio.Queue(self.queue_size)
+        self.outstanding = 1
+        self.backlog.put((local, remote, await self.index.alookup(local)))
+        walkers = [asyncio.create_task(self.walk()) for _ in range(self.listings.maximum)]
+        downloaders = [asyncio.create_task(self.fetch()) for _ in range(self.transfers.maximum)]
+        await asyncio.gather(*walkers)
+        for _ in downloaders:
+            await self.queue.put(None)
+        await asyncio.gather(*downloaders)
+        self.backlog.close()
+        for path, err in self.errors:
+            print(f"Something went wrong: {path} {err}")
+        return self.errors
+
+    async def walk(self):
+        while self.outstanding:
+            item = self.backlog.get()
+            if item is None:
+                # the rest is being visited and may add more
+                await asyncio.sleep(0.01)
+                continue
+            try:
+                await self.visit(*item)
+            except Exception as err:
+                logger.info("visiting %s failed: %s", item[1], err)
+                self.errors.append((item[1], err))
+            finally:
+                self.outstanding -= 1
+
+    async def fetch(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            try:
+                await self.get_file(*item)
+            except Exception as err:
+                logger.info("download %s failed: %s", item[1], err)
+                self.errors.append((item[1], err))
+
+    async def visit(self, local, remote, state):
         self.count += 1
         self.print_stats()
         if await self.client.exists(remote):
             if await self.client.isfile(remote):
-                size1 = await self.client.getsize(remote)
-                if os.path.exists(local):
-                    size2 = os.path.getsize(local)
-                    if size1 >= size2:
-                        self.already_had += 1
-                        self.print_stats()
-                        return
-                await self.get_file(local, remote, size1)
+                attrs = await self.client.stat(remote)
+                size = attrs.size
+                if self.filter and self.filter.skip_file(relative(remote, self.root), size, attrs.mtime):
+                    self.filtered += 1
+                    return
+                if state is not None and state[2] == FILE and state[0] >= size:
+                    self.already_had += 1
+                    self.print_stats()
+                    return
+                # blocks this walker while the download queue is full
+                await self.queue.put((local, remote, size, attrs.mtime))
                 return
             elif await self.client.isdir(remote):
-                if not os.path.exists(local) or os.path.isfile(local):
-                    if os.path.isfile(local):
+                if self.filter and remote != self.root and self.filter.skip_dir(relative(remote, self.root)):
+                    # pruned before its readdir is issued
+                    self.filtered += 1
+                    return
+                if state is None or state[2] != DIR:
+                    if state is not None:
                         os.remove(local)
                     print(f"creating new local directory {local} from {remote}")
                     os.mkdir(local)
                     os.chown(local, uid=1000, gid=1000)
-                pathlist = await self.client.listdir(remote)
-                pathlist2 = []
-                while len(pathlist) > 0:
-                    chosen = random.choice(pathlist)
+                await self.listings.aacquire()
+                try:
+                    pathlist = await self.client.listdir(remote)
+                except Exception:
+                    self.listings.release(errors=1, items=0)
+                    raise
+                # listing throughput is counted in entries, not bytes
+                self.listings.release(len(pathlist))
+                entries = await self.index.ascan(local)
+                random.shuffle(pathlist)
+                for chosen in pathlist:
                     if chosen in [".", ".."]:
-                        pathlist.remove(chosen)
                         continue
-                    pathlist.remove(chosen)
                     full_local = os.path.join(local, chosen)
                     full_remote = os.path.join(remote, chosen)
-                    pathlist2.append((full_local, full_remote))
-                futures = [*(asyncio.create_task(self.traverse(*paths))
-                    for paths in pathlist2)]
-                if futures:
-                    await asyncio.wait(futures)
+                    self.outstanding += 1
+                    self.backlog.put((full_local, full_remote, entries.get(chosen)))
+                # the children carry their local state with them
+                self.index.forget(local)
         return
 
 def metrics_output(then, size, path):
@@ -90,11 +228,40 @@ def metrics_output(then, size, path):
     filename = os.path.basename(path)
     print(f"<-Finished  {filename} : {size} || {amount} ->")
 
-async def run_client(host, port, un, pw, LOCAL, REMOTE):
-    print(host, port, un, pw)
-    async with asyncssh.connect(host=host, port=port, username=un, password=pw, known_hosts=None) as conn:
-        print(conn)
-        async with conn.start_sftp_client() as sftp:
-            client = SFTP(sftp)
-            await client.traverse(LOCAL, REMOTE)
-    return
+def greeted(tuning, host, port):
+    # the server speaks first: its banner arrives one round trip after the handshake
+    sock = tuning.connect((host, port))
+    then = time.perf_counter()
+    sock.recv(1, socket.MSG_PEEK)
+    return sock, time.perf_counter() - then
+
+
+async def run_client(host, port, un, pw, LOCAL, REMOTE, limiter=None, transfers=None, listings=None, filter=None,
+                     backlog=None, fsync=DATA, verify=False, tuning=None):
+    logger.debug("connecting to %s:%s as %s", host, port, un)
+    if limiter is not None:
+        await limiter.aacquire(host, port)
+    try:
+        options = {}
+        if tuning is not None:
+            # one connection carries commands and data: control options before
+            # the handshake, buffers once the banner has timed the round trip
+            loop = asyncio.get_running_loop()
+            sock, seconds = await loop.run_in_executor(None, greeted, tuning, host, port)
+            tuned = tuning.sample(host, seconds)
+            tuning.data(sock, host)
+            # the channel window, not only the socket, has to cover the bandwidth-delay product
+            options = {'sock': sock, 'window': max(tuned.buffer, DEFAULT_WINDOW)}
+        async with asyncssh.connect(host=host, port=port, username=un, password=pw, known_hosts=None,
+                                    **options) as conn:
+            async with conn.start_sftp_client() as sftp:
+                client = SFTP(sftp, limiter, host, transfers, listings, filter, REMOTE, backlog)
+                client.fsync = fsync
+                client.verify = verify
+                if tuning is not None:
+                    client.blocksize = tuning.blocksize(host, client.blocksize)
+                await client.traverse(LOCAL, REMOTE)
+    finally:
+        if limiter is not None:
+            limiter.release(host, port)
+    return client
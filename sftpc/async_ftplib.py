@@ -1,8 +1,17 @@
 import time
 import socket
 import asyncio
-import re
+import posixpath
 import logging
+import ssl
+
+from sftpc.bulk import ancestry, deepest_first, delete_group, mkd_group, rename_group, rmd_group
+from sftpc.partfile import PartFile, DATA
+from sftpc.replies import PermanentError, ReplyReader, error, parse150, parse227, parse229, parse257
+from sftpc.stats import StatCollector
+from sftpc.throttle import too_many
+from sftpc.dedup import hash_key, unique_key
+from sftpc.verify import HashMismatch, choose, hash_prefix, new_hash, parse_digest, parse_feat
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +22,13 @@ MAXSIZE = 2**20
 CRLF = '\r\n'
 B_CRLF = b'\r\n'
 
+
+async def threaded(coro):
+    # the sockets underneath block, so sessions only overlap on threads of their own
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, asyncio.run, coro)
+
+
 class AsyncFTP:
 
     host = ''
@@ -20,58 +36,98 @@ class AsyncFTP:
     maxsize = MAXSIZE
     timeout = 999
     sock = None
+    reader = None
     remote = None
     passivemode = True
     trust_pasv_ipv4 = True
-
-    def __init__(self, source_address=None, encoding='utf8'):
+    transfer_type = None
+    next_data = None
+    prot_private = False
+    slot = False
+    lent = False
+    announced = None
+    fsync = DATA
+    verify = False
+    verify_retries = 2
+    content = None
+    tuning = None
+    window = 64
+    bulk_workers = 4
+    hashing = None
+
+    def __init__(self, source_address=None, encoding='utf8', context=None, limiter=None):
         self.loop = asyncio.get_event_loop()
+        self.stats = StatCollector()
         self.encoding = encoding
         self.source_address = source_address
+        self.context = context
+        self.limiter = limiter
+        self.idle = []
 
     async def connect(self, host='', port=0, timeout=None, source_address=None):
         self.host = host
         self.port = port
         self.timeout = timeout
         self.source_address = source_address
-        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout, source_address=self.source_address)
-        self.af = self.sock.family
-        self.file = self.sock.makefile('r', encoding=self.encoding)
-        message = await self.getresp()
-        logger.info(message)
+        if self.limiter is not None and not self.slot:
+            await self.limiter.aacquire(host, port)
+            self.slot = True
+        try:
+            if self.tuning is None:
+                self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout, source_address=self.source_address)
+            else:
+                self.sock = self.tuning.connect((self.host, self.port), self.timeout, self.source_address)
+                self.stats.tuning = self.tuning
+            self.af = self.sock.family
+            self.transfer_type = None
+            self.next_data = None
+            self.prot_private = False
+            self.reader = ReplyReader(self.sock.makefile('rb'), self.encoding, MAXSIZE)
+            message = await self.getresp()
+            logger.info(message)
+            if self.context is not None:
+                await self.auth()
+        except:
+            await self.close()
+            raise
         return self.sock
 
-    async def getline(self):
-        line = self.file.readline(MAXSIZE+1)
-        if len(line) > MAXSIZE:
-            raise Exception("should have only received one")
-        if not line:
-            raise EOFError
-        if line[-2:] == CRLF:
-            line = line[:-2]
-        elif line[-1:] in CRLF:
-            line = line[:-1]
-        logger.debug(line)
-        return line
+    async def wraptls(self, sock, session=None):
+        then = time.perf_counter()
+        sock = self.context.wrap_socket(sock, server_hostname=self.host, session=session)
+        self.stats.tls_handshake(time.perf_counter() - then, sock.session_reused)
+        return sock
+
+    async def auth(self):
+        if isinstance(self.sock, ssl.SSLSocket):
+            raise Exception('already using TLS')
+        resp = await self.voidcmd('AUTH TLS')
+        self.sock = await self.wraptls(self.sock)
+        self.reader = ReplyReader(self.sock.makefile('rb'), self.encoding, MAXSIZE)
+        return resp
+
+    async def prot_p(self):
+        await self.voidcmd('PBSZ 0')
+        resp = await self.voidcmd('PROT P')
+        self.prot_private = True
+        return resp
+
+    async def prot_c(self):
+        resp = await self.voidcmd('PROT C')
+        self.prot_private = False
+        return resp
 
     async def getmultiline(self):
-        line = await self.getline()
-        if line[3:4] == '-':
-            code = line[:3]
-            while True:
-                nextline = await self.getline()
-                line += '\n' + nextline
-                if nextline[:3] == code and nextline[3:4] != '-':
-                    break
-        return line
+        resp = self.reader.read()
+        logger.debug(resp)
+        return resp
 
     async def getresp(self):
         resp = await self.getmultiline()
         self.lastresp = resp[:3]
-        code = resp[:1]
-        if code in '123':
+        if resp[:1] in '123':
             return resp
-        raise Exception(resp)
+        raise error(resp)
 
     async def set_pasv(self, val):
         self.passivesmode = val
@@ -97,7 +153,7 @@ class AsyncFTP:
     async def voidresp(self):
         resp = await self.getresp()
         if resp[:1] != '2':
-            raise Exception(resp)
+            raise error(resp)
         return resp
 
     async def abort(self):
@@ -105,7 +161,7 @@ class AsyncFTP:
         self.sock.sendall(line, OOB)
         resp = await self.getmultiline()
         if resp[:3] not in ['426', '225', '226']:
-            raise Exception(resp)
+            raise error(resp)
         return resp
 
     async def sendcmd(self, cmd):
@@ -129,6 +185,9 @@ class AsyncFTP:
 
     async def makeport(self):
         sock = socket.create_server(('', 0), family=self.af, backlog=1)
+        if self.tuning is not None:
+            # accepted connections inherit the listener's buffers
+            self.tuning.data(sock, self.host)
         port = sock.getsockname()[1]
         host = self.sock.getsockname()[0]
         if self.af == socket.AF_INET:
@@ -151,19 +210,52 @@ class AsyncFTP:
     async def makepasv(self):
         if self.af == socket.AF_INET:
             val = await self.sendcmd('PASV')
-            coro = await parse227(val)
+            coro = parse227(val)
             _, port = coro
             host = self.sock.getpeername()[0]
         else:
-            host, port = await parse229(self.sendcmd('EPSV'), self.sock.getpeername())
+            host, port = parse229(await self.sendcmd('EPSV'), self.sock.getpeername())
         return host, port
 
+    async def settype(self, kind):
+        if self.transfer_type == kind:
+            return None
+        resp = await self.voidcmd('TYPE ' + kind)
+        self.transfer_type = kind
+        return resp
+
+    async def preparepasv(self):
+        await self.putline('PASV' if self.af == socket.AF_INET else 'EPSV')
+
+    async def collectpasv(self):
+        try:
+            resp = await self.getresp()
+            if self.af == socket.AF_INET:
+                _, port = parse227(resp)
+                host = self.sock.getpeername()[0]
+            else:
+                host, port = parse229(resp, self.sock.getpeername())
+            self.next_data = self.connect_data(host, port)
+        except Exception as err:
+            logger.debug("pipelined PASV failed: %s", err)
+            self.next_data = None
+
+    def connect_data(self, host, port):
+        if self.tuning is None:
+            return socket.create_connection((host, port), self.timeout, source_address=self.source_address)
+        return self.tuning.connect((host, port), self.timeout, self.source_address, self.host)
+
+    async def dataconn(self):
+        if self.next_data is not None:
+            conn, self.next_data = self.next_data, None
+            return conn
+        host, port = await self.makepasv()
+        return self.connect_data(host, port)
+
     async def ntransfercmd(self, cmd, rest=None):
         size = None
         if self.passivemode:
-            coro = await self.makepasv()
-            host, port = coro
-            conn = socket.create_connection((host, port), self.timeout, source_address=self.source_address)
+            conn = await self.dataconn()
             try:
                 if rest is not None:
                     await self.sendcmd("REST %s" % rest)
@@ -171,7 +263,7 @@ class AsyncFTP:
                 if resp[0] == '2':
                     resp = await self.getresp()
                 if resp[0] != '1':
-                    raise Exception(resp)
+                    raise error(resp)
             except:
                 conn.close()
                 raise
@@ -183,11 +275,14 @@ class AsyncFTP:
             if resp[0] == '2':
                 resp = await self.getresp()
             if resp[0] != '1':
-                raise Exception(resp)
+                raise error(resp)
             conn, _ = sock.accept()
             conn.settimeout(self.timeout)
+        if self.prot_private:
+            conn = await self.wraptls(conn, self.sock.session)
         if resp[:3] == '150':
-            size = await parse150(resp)
+            size = parse150(resp)
+        self.announced = size
         return conn, size
 
     async def transfercmd(self, cmd, rest=None):
@@ -197,27 +292,49 @@ class AsyncFTP:
     async def login(self, user = '', passwd = '', acct = ''):
         self.user = user
         self.passwd = passwd
+        then = time.perf_counter()
         resp = await self.sendcmd('USER ' + user)
+        if self.tuning is not None:
+            # USER costs the server next to nothing: its reply time is one round trip
+            self.tuning.sample(self.host, time.perf_counter() - then)
         if resp[0] == '3': resp = await self.sendcmd('PASS ' + passwd)
-        if resp[0] != '2': raise Exception(resp)
+        if resp[0] != '2': raise error(resp)
+        if self.context is not None:
+            await self.prot_p()
         return resp
 
-    async def retrbinary(self, cmd, callback, blocksize=MAXSIZE, rest=None):
-        await self.voidcmd('TYPE I')
+    async def retrbinary(self, cmd, callback, blocksize=MAXSIZE, rest=None, prepare_next=False):
+        await self.settype('I')
         conn = await self.transfercmd(cmd, rest)
-        while True:
-            data = conn.recv(blocksize)
-            if not data:
-                break
-            callback(data)
-            await asyncio.sleep(0)
+        prepare_next = prepare_next and self.passivemode
+        if prepare_next:
+            await self.preparepasv()
+        if self.tuning is not None:
+            blocksize = self.tuning.blocksize(self.host, blocksize)
+        limiter = self.limiter
+        if limiter is not None:
+            blocksize = limiter.blocksize(self.host, blocksize)
+        with conn:
+            while True:
+                data = conn.recv(blocksize)
+                if not data:
+                    break
+                callback(data)
+                if limiter is not None:
+                    await limiter.athrottle(self.host, len(data))
+                else:
+                    await asyncio.sleep(0)
+            if isinstance(conn, ssl.SSLSocket):
+                conn.unwrap()
         resp = await self.voidresp()
         logger.info(resp)
+        if prepare_next:
+            await self.collectpasv()
         return resp
 
     async def retrlines(self, cmd, callback):
         if callback is None: callback = print
-        resp = await self.sendcmd('TYPE A')
+        resp = await self.settype('A')
         logger.debug(resp)
         conn = await self.transfercmd(cmd)
         fp = conn.makefile('r', encoding=self.encoding)
@@ -232,11 +349,15 @@ class AsyncFTP:
             elif line[-1:] in CRLF:
                 line = line[:-1]
             callback(line)
+        fp.close()
+        if isinstance(conn, ssl.SSLSocket):
+            conn.unwrap()
+        conn.close()
         val = await self.voidresp()
         return val
 
     async def storbinary(self, cmd, fp, blocksize=8192, callback=None, rest=None):
-        await self.voidcmd('TYPE I')
+        await self.settype('I')
         with await self.transfercmd(cmd, rest) as conn:
             while 1:
                 buf = fp.read(blocksize)
@@ -245,10 +366,12 @@ class AsyncFTP:
                 conn.sendall(buf)
                 if callback:
                     callback(buf)
+            if isinstance(conn, ssl.SSLSocket):
+                conn.unwrap()
         return await self.voidresp()
 
     async def storlines(self, cmd, fp, callback=None):
-        await self.voidcmd('TYPE A')
+        await self.settype('A')
         with await self.transfercmd(cmd) as conn:
             while 1:
                 buf = fp.readline(self.maxline + 1)
@@ -262,6 +385,8 @@ class AsyncFTP:
                 conn.sendall(buf)
                 if callback:
                     callback(buf)
+            if isinstance(conn, ssl.SSLSocket):
+                conn.unwrap()
         return await self.voidresp()
 
     async def acct(self, password):
@@ -309,7 +434,7 @@ class AsyncFTP:
     async def rename(self, fromname, toname):
         resp = await self.sendcmd('RNFR ' + fromname)
         if resp[0] != '3':
-            raise Exception(resp)
+            raise error(resp)
         return await self.voidcmd('RNTO ' + toname)
 
     async def delete(self, filename):
@@ -317,7 +442,7 @@ class AsyncFTP:
         if resp[:3] in {'250', '200'}:
             return resp
         else:
-            raise Exception(resp)
+            raise error(resp)
 
     async def cwd(self, dirname):
         if dirname == '..':
@@ -341,7 +466,7 @@ class AsyncFTP:
         resp = await self.voidcmd('MKD ' + dirname)
         if not resp.startswith('257'):
             return ''
-        return await parse257(resp)
+        return parse257(resp)
 
     async def rmd(self, dirname):
         return await self.voidcmd('RMD ' + dirname)
@@ -350,7 +475,7 @@ class AsyncFTP:
         resp = await self.voidcmd('PWD')
         if not resp.startswith('257'):
             return ''
-        return await parse257(resp)
+        return parse257(resp)
 
     async def quit(self):
         resp = await self.voidcmd('QUIT')
@@ -359,32 +484,309 @@ class AsyncFTP:
         return resp
 
     async def close(self):
+        while self.idle:
+            session = self.idle.pop()
+            try: await session.quit()
+            except: await session.close()
+        if self.next_data is not None:
+            self.next_data.close()
+            self.next_data = None
         try:
-            file = self.file
-            self.file = None
-            if file is not None:
-                file.close()
+            reader = self.reader
+            self.reader = None
+            if reader is not None:
+                reader.close()
         finally:
             sock = self.sock
             self.sock = None
             if sock is not None:
                 sock.close()
+            if self.slot:
+                self.slot = False
+                self.limiter.release(self.host, self.port)
         return
 
     async def listdir(self, path):
         val = await self.nlst(path)
         return val
 
-    async def get(self, targ, dest):
-        client = AsyncFTP()
-        conn = await client.connect(self.host, self.port)
-        await client.login(self.user, self.passwd)
+    async def session(self):
+        attempt = 0
+        while True:
+            if self.idle:
+                return self.idle.pop()
+            if self.limiter is not None:
+                delay = self.limiter.host_slots(self.host, self.port).try_acquire()
+                if delay is None and self.slot and not self.lent:
+                    # at the cap, and the control connection holds a slot of it
+                    self.lent = True
+                    return self
+                if delay != 0.0:
+                    await asyncio.sleep(delay if delay is not None else 0.05)
+                    continue
+            client = AsyncFTP(self.source_address, self.encoding, self.context, self.limiter)
+            client.stats = self.stats
+            client.fsync = self.fsync
+            client.verify = self.verify
+            client.content = self.content
+            client.tuning = self.tuning
+            client.slot = self.limiter is not None
+            try:
+                await client.connect(self.host, self.port, self.timeout, self.source_address)
+                await client.login(self.user, self.passwd)
+            except Exception as err:
+                await client.close()
+                if self.limiter is None or not too_many(err) or attempt >= self.limiter.retries:
+                    raise
+                self.limiter.refused(self.host, self.port)
+                attempt += 1
+                continue
+            if self.limiter is not None:
+                self.limiter.accepted(self.host, self.port)
+            return client
+
+    async def release(self, client):
+        if client is self:
+            self.lent = False
+        else:
+            self.idle.append(client)
+
+    async def discard(self, session):
+        """Close a session that failed; the control connection, if that was it, is reopened instead."""
+        if session is not self:
+            await session.close()
+            return
+        for stream in (self.reader, self.sock):
+            try: stream.close()
+            except: pass
+        try:
+            await self.connect(self.host, self.port, self.timeout, self.source_address)
+            await self.login(self.user, self.passwd)
+        except Exception as err:
+            logger.info("reopening the control connection failed: %s", err)
+        await self.release(self)
+
+    async def hashes(self):
+        if self.hashing is None:
+            try:
+                features = parse_feat(await self.sendcmd('FEAT'))
+            except PermanentError:
+                features = {}
+            self.hashing = choose(features) or False
+            if self.hashing and self.hashing[0] == 'HASH':
+                await self.sendcmd('OPTS HASH ' + self.hashing[1])
+            if not self.hashing:
+                logger.info("%s offers no file hashes", self.host)
+        return self.hashing
+
+    async def remote_hash(self, path):
+        command, _, algorithm = self.hashing
+        return parse_digest(await self.sendcmd(f'{command} {path}'), algorithm)
+
+    async def duplicate(self, targ, dest, size, mtime, unique, keys):
+        if unique:
+            keys.append(unique_key(self.host, unique, size, mtime))
+        source = self.content.lookup(keys, size)
+        expected = None
+        if source is None and size >= self.content.min_size and await self.hashes():
+            expected = await self.remote_hash(targ)
+            keys.append(hash_key(self.hashing[2], expected))
+            source = self.content.lookup(keys[-1:], size)
+        if source is not None and source != dest:
+            how = self.content.clone(source, dest, mtime, self.fsync)
+            logger.info("%s: %s of %s", dest, how, source)
+            self.stats.deduped += 1
+            self.stats.bytes_saved += size
+            self.content.record(keys, dest)
+            return True, expected
+        return False, expected
+
+    async def retrieve(self, targ, dest, prepare_next=False, rest=None, size=None, mtime=None, unique=None):
+        keys = []
+        expected = None
+        if self.content is not None and not rest and size:
+            done, expected = await self.duplicate(targ, dest, size, mtime, unique, keys)
+            if done:
+                return True
+        hashing = await self.hashes() if self.verify else None
+        attempt = 0
+        while True:
+            try:
+                return await self.download(targ, dest, prepare_next, rest, size, mtime, hashing, expected, keys)
+            except HashMismatch as err:
+                self.stats.hash_mismatches += 1
+                if attempt >= self.verify_retries:
+                    raise
+                logger.info("%s, downloading it again", err)
+                attempt += 1
+                rest = None
+                expected = None
+
+    async def download(self, targ, dest, prepare_next, rest, size, mtime, hashing, expected=None, keys=()):
         cmd = "RETR " + targ
-        dest = open(dest, 'ab')
-        await client.retrbinary(cmd, lambda x: dest.write(x))
-        await client.quit()
+        then = time.time()
+        stats = self.stats
+        total = 0
+        digest = new_hash(hashing[2]) if hashing else None
+        with PartFile(dest, rest, self.fsync) as part:
+            if digest is not None and rest:
+                hashed = time.perf_counter()
+                hash_prefix(part.part, digest, rest)
+                stats.hash_time += time.perf_counter() - hashed
+            def callback(data):
+                nonlocal total
+                if not part.allocated:
+                    part.allocate(size or self.announced)
+                part.write(data)
+                if digest is not None:
+                    hashed = time.perf_counter()
+                    digest.update(data)
+                    stats.hash_time += time.perf_counter() - hashed
+                total += len(data)
+            await self.retrbinary(cmd, callback, rest=rest, prepare_next=prepare_next)
+            if digest is not None:
+                expected = expected or await self.remote_hash(targ)
+                if digest.hexdigest() != expected:
+                    raise HashMismatch(f'{targ}: {hashing[2]} {digest.hexdigest()} != {expected}')
+                stats.verified += 1
+            part.commit(mtime)
+        if self.content is not None:
+            keys = list(keys)
+            if digest is not None and hash_key(hashing[2], expected) not in keys:
+                keys.append(hash_key(hashing[2], expected))
+            self.content.record(keys, dest)
+        stats.calc_speed(targ, total, then)
+        return True
+
+    async def get(self, targ, dest):
+        failed = await self.get_many([(targ, dest)])
+        if failed:
+            raise failed[0][2]
         return True
 
+    async def get_many(self, items):
+        failed = []
+        client = None
+        last = len(items) - 1
+        for i, item in enumerate(items):
+            targ, dest, rest, size, mtime, unique = (tuple(item) + (None,) * 4)[:6]
+            try:
+                if client is None:
+                    client = await self.session()
+                await client.retrieve(targ, dest, i < last, rest, size, mtime, unique)
+            except Exception as err:
+                logger.debug("RETR %s failed: %s", targ, err)
+                failed.append((targ, dest, err))
+                if client is not None:
+                    await self.discard(client)
+                client = None
+        if client is not None:
+            await self.release(client)
+        return failed
+
+    async def pipeline(self, groups):
+        lines = [line for group in groups for line, _ in group]
+        for line in lines:
+            if '\r' in line or '\n' in line:
+                raise Exception('an illegal newline character shouldn not be contained')
+        self.sock.sendall(''.join(line + CRLF for line in lines).encode(self.encoding))
+        errors = []
+        for group in groups:
+            failure = None
+            for _, expect in group:
+                resp = await self.getmultiline()
+                if failure is None and resp[:1] != expect:
+                    failure = error(resp)
+            errors.append(failure)
+        return errors
+
+    async def bulk(self, items, group, workers=None):
+        items = list(items)
+        chunks = iter([items[i:i + self.window] for i in range(0, len(items), self.window)])
+        failed = []
+
+        async def work():
+            client = None
+            for chunk in chunks:
+                try:
+                    if client is None:
+                        client = await self.session()
+                    errors = await threaded(client.pipeline([group(item) for item in chunk]))
+                except Exception as err:
+                    errors = [err] * len(chunk)
+                    if client is not None:
+                        await self.discard(client)
+                    client = None
+                failed.extend((item, err) for item, err in zip(chunk, errors) if err is not None)
+            if client is not None:
+                await self.release(client)
+
+        count = min(workers or self.bulk_workers, (len(items) + self.window - 1) // self.window)
+        await asyncio.gather(*(work() for _ in range(count)))
+        return failed
+
+    async def bulk_delete(self, paths, workers=None):
+        return await self.bulk(paths, delete_group, workers)
+
+    async def bulk_rename(self, pairs, workers=None):
+        return await self.bulk(pairs, rename_group, workers)
+
+    async def makedirs(self, tree, workers=None):
+        failed = []
+        for level in ancestry(tree):
+            missing = await self.bulk(level, mkd_group, workers)
+            parents = {}
+            for path, err in missing:
+                parents.setdefault(posixpath.dirname(path), []).append((path, err))
+            for parent, entries in parents.items():
+                try:
+                    dirs = {posixpath.join(parent, name) for name, facts in await self.mlsd(parent)
+                            if facts.get('type') == 'dir'}
+                except Exception:
+                    dirs = set()
+                failed.extend((path, err) for path, err in entries if path not in dirs)
+        return failed
+
+    async def collect(self, path, workers=None):
+        """(files, dirs, errors) under ``path``, each level of directories listed on up to ``workers`` sessions."""
+        files, dirs, errors = [], [], []
+        level = [path]
+        while level:
+            todo, found = iter(level), []
+
+            async def work():
+                client = None
+                for remote in todo:
+                    try:
+                        if client is None:
+                            client = await self.session()
+                        listing = await threaded(client.mlsd(remote))
+                    except Exception as err:
+                        errors.append((remote, err))
+                        if client is not None:
+                            await self.discard(client)
+                        client = None
+                        continue
+                    dirs.append(remote)
+                    for name, facts in listing:
+                        if facts.get('type') == 'dir':
+                            found.append(posixpath.join(remote, name))
+                        elif facts.get('type') not in ('cdir', 'pdir') and name not in ('.', '..'):
+                            files.append(posixpath.join(remote, name))
+                if client is not None:
+                    await self.release(client)
+
+            await asyncio.gather(*(work() for _ in range(min(workers or self.bulk_workers, len(level)))))
+            level = found
+        return files, dirs, errors
+
+    async def remove_tree(self, path, workers=None):
+        files, dirs, failed = await self.collect(path, workers)
+        failed.extend(await self.bulk_delete(files, workers))
+        for level in deepest_first(dirs):
+            failed.extend(await self.bulk(level, rmd_group, workers))
+        return failed
+
     async def isdir(self, path):
         pathlist = await self.mlsd(path)
         return len(pathlist) > 1
@@ -392,52 +794,3 @@ class AsyncFTP:
     async def isfile(self, path):
         coro = await self.isdir(path)
         return not coro
-
-
-class rx:
-    _150_re = None
-    _227_re = None
-
-async def parse150(resp):
-    if resp[:3] != '150': raise Exception(resp)
-    if rx._150_re is None: rx._150_re = re.compile(r"150 .* \((\d+) bytes\)", re.IGNORECASE | re.ASCII)
-    m = rx._150_re.match(resp)
-    if not m: return None
-    return int(m.group(1))
-
-async def parse227(resp):
-    if resp[:3] != '227':  raise Exception(resp)
-    if rx._227_re is None: rx._227_re = re.compile(r'(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)', re.ASCII)
-    m = rx._227_re.search(resp)
-    if not m:  raise Exception(resp)
-    numbers = m.groups()
-    host = '.'.join(numbers[:4])
-    port = (int(numbers[4]) << 8) + int(numbers[5])
-    return host, port
-
-async def parse229(resp, peer):
-    if resp[:3] != '229': raise Exception(resp)
-    left = resp.find('(')
-    if left < 0: raise Exception(resp)
-    right = resp.find(')', left + 1)
-    if right < 0:  raise Exception(resp)
-    if resp[left + 1] != resp[right - 1]:  raise Exception(resp)
-    parts = resp[left + 1:right].split(resp[left+1])
-    if len(parts) != 5: raise Exception(resp)
-    host = peer[0]
-    port = int(parts[3])
-    return host, port
-
-async def parse257(resp):
-    if resp[:3] != '257': raise Exception(resp)
-    if resp[3:5] != ' "': return ''
-    dirname = ''
-    i, n = 5, len(resp)
-    while i < n:
-        c, i = resp[i], i+1
-        if c == '"':
-            if i >= n or resp[i] != '"':
-                break
-            i = i+1
-        dirname += c
-    return dirname
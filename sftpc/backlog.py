@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where unknown."""
+    try:
+        with open('/proc/self/statm') as fd:
+            return int(fd.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class MemoryGuard:
+    """Tells a walk when the process is over ``cap`` bytes of RSS, checked at most every ``interval`` seconds."""
+
+    def __init__(self, cap, interval=0.5):
+        self.cap = cap
+        self.interval = interval
+        self.checked = 0.0
+        self.state = False
+        self.peak = 0
+
+    def over(self):
+        now = time.monotonic()
+        if now - self.checked >= self.interval:
+            self.checked = now
+            rss = current_rss()
+            if rss is not None:
+                self.peak = max(self.peak, rss)
+                if rss > self.cap and not self.state:
+                    logger.info("rss %d MiB over the %d MiB cap", rss >> 20, self.cap >> 20)
+                self.state = rss > self.cap
+        return self.state
+
+
+class Backlog:
+    """
+    Pending work of a tree walk, bounded in memory.
+
+    Items are taken LIFO, so a walk stays depth first and holds about
+    depth x fan-out entries rather than a whole level of the tree.  With a
+    ``spill`` directory, items past ``limit`` (or any while ``guard`` says
+    the process is over its memory cap) go to a JSONL file there and are
+    read back in chunks as the in-memory part drains.  Items must be JSON
+    serialisable; tuples come back as lists.
+    """
+
+    def __init__(self, limit=10000, spill=None, guard=None):
+        self.limit = limit
+        self.spill = spill
+        self.guard = guard
+        self.items = []
+        self.lock = threading.Lock()
+        self.file = None
+        self.path = None
+        self.offset = 0
+        self.spilled = 0
+        self.peak = 0
+
+    def __len__(self):
+        return len(self.items) + self.spilled
+
+    def put(self, item):
+        with self.lock:
+            if self.spill is not None and (
+                    len(self.items) >= self.limit or self.guard is not None and self.guard.over()):
+                self.write(item)
+            else:
+                self.items.append(item)
+                self.peak = max(self.peak, len(self.items))
+
+    def get(self):
+        """Next item, or None if the backlog is empty."""
+        with self.lock:
+            if not self.items and self.spilled:
+                self.refill()
+            if self.items:
+                return self.items.pop()
+            return None
+
+    def write(self, item):
+        if self.file is None:
+            fd, self.path = tempfile.mkstemp(suffix='.backlog', dir=self.spill)
+            # append mode: writes land at the end whatever was read last
+            self.file = os.fdopen(fd, 'a+', encoding='utf8')
+        self.file.write(json.dumps(item) + '\n')
+        self.spilled += 1
+
+    def refill(self):
+        self.file.flush()
+        self.file.seek(self.offset)
+        for _ in range(max(1, self.limit // 2)):
+            line = self.file.readline()
+            if not line:
+                break
+            self.items.append(json.loads(line))
+            self.spilled -= 1
+        self.offset = self.file.tell()
+        if not self.spilled:
+            # all read back: reclaim the disk space
+            self.file.truncate(0)
+            self.offset = 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                os.remove(self.path)
+                self.file = None
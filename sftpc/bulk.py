@@ -0,0 +1,80 @@
+import posixpath
+
+from sftpc.plan import Plan, Planner
+
+# a group is the commands of one item with the reply class each must get,
+# e.g. RNFR must be answered 3xx before RNTO is answered 2xx
+
+
+def delete_group(path):
+    return (('DELE ' + path, '2'),)
+
+
+def rename_group(pair):
+    source, target = pair
+    return (('RNFR ' + source, '3'), ('RNTO ' + target, '2'))
+
+
+def mkd_group(path):
+    return (('MKD ' + path, '2'),)
+
+
+def rmd_group(path):
+    return (('RMD ' + path, '2'),)
+
+
+def depth(path):
+    return posixpath.normpath(path).strip('/').count('/')
+
+
+def ancestry(paths):
+    """Every directory ``makedirs`` has to make for ``paths``, grouped by depth, shallowest first."""
+    levels = {}
+    for path in paths:
+        path = posixpath.normpath(path)
+        while path not in ('/', '.', ''):
+            levels.setdefault(depth(path), set()).add(path)
+            path = posixpath.dirname(path)
+    return [sorted(levels[level]) for level in sorted(levels)]
+
+
+def deepest_first(dirs):
+    """``dirs`` grouped by depth, deepest first: each group can go once the one before has."""
+    levels = {}
+    for path in dirs:
+        levels.setdefault(depth(path), []).append(path)
+    return [levels[level] for level in sorted(levels, reverse=True)]
+
+
+class Collector(Planner):
+    """
+    List a remote tree with the planner's parallel walker, collecting its
+    paths instead of diffing them against a local tree.
+    """
+
+    def __init__(self, client, remote, controller=None):
+        super().__init__(client, None, remote, controller)
+        self.files = []
+        self.dirs = []
+
+    def diff_dir(self, local, remote, listing, state):
+        files = []
+        subdirs = []
+        for path in listing:
+            if path.name in ['.', '..']:
+                continue
+            if path.args.get('type') == 'dir':
+                subdirs.append((None, path.path, None))
+            elif path.args.get('type') not in ('cdir', 'pdir'):
+                files.append(path.path)
+        with self.lock:
+            self.files.extend(files)
+            self.dirs.append(remote)
+        return subdirs
+
+    def collect(self):
+        """(files, dirs, errors) under ``remote``; errors are [path, message] of unlistable directories."""
+        self.result = Plan(None, self.remote)
+        listing = self.client.listdir(self.remote)
+        self.walk(self.diff_dir(None, self.remote, listing, None))
+        return self.files, self.dirs, self.result.errors
@@ -0,0 +1,193 @@
+"""
+Command line entry point.
+
+    sftpc sync ftp [LOCAL REMOTE] [options]
+    sftpc sync sftp [LOCAL REMOTE] [options]
+
+Every option falls back to the environment variable ``sync.py`` always
+read (``HN``, ``PT``, ``UN``, ``PW``, ``LOCAL``, ``REMOTE``, ``RATE``, ...),
+after loading ``--env-file`` if it exists.  Only the backend that runs is
+imported, so an FTP sync never loads asyncssh.
+"""
+import argparse
+import importlib
+import logging
+import os
+import sys
+import tempfile
+
+BACKENDS = ('ftp', 'sftp')
+PORTS = {'ftp': 21, 'sftp': 22}
+WORKERS = {'ftp': 8, 'sftp': 32}
+
+FLAG = 'flag'
+LIST = 'list'
+
+# flag, environment variable, type, default, backends, help
+OPTIONS = (
+    ('--host', 'HN', str, None, BACKENDS, 'server host name'),
+    ('--port', 'PT', int, None, BACKENDS, 'server port, 21 or 22 by default'),
+    ('--user', 'UN', str, None, BACKENDS, 'login name'),
+    ('--password', 'PW', str, None, BACKENDS, 'password; prefer the environment, the command line is visible to ps'),
+    ('--min-workers', 'MIN_WORKERS', int, 1, BACKENDS, 'fewest concurrent transfers and listings'),
+    ('--max-workers', 'MAX_WORKERS', int, None, BACKENDS, 'most concurrent transfers and listings'),
+    ('--rate', 'RATE', int, None, BACKENDS, 'bytes/s for all connections together'),
+    ('--host-rate', 'HOST_RATE', int, None, BACKENDS, 'bytes/s per server'),
+    ('--host-connections', 'HOST_CONNECTIONS', int, None, BACKENDS, 'connections per server'),
+    ('--fsync', 'FSYNC', str, 'file', BACKENDS, 'when downloads reach the disk: never, file or dir'),
+    ('--filter', 'FILTER', str, None, BACKENDS, 'file of gitignore-style exclude rules'),
+    ('--include', 'INCLUDE', LIST, [], BACKENDS, 'comma separated globs of the only files to sync'),
+    ('--min-size', 'MIN_SIZE', int, None, BACKENDS, 'skip smaller files, in bytes'),
+    ('--max-size', 'MAX_SIZE', int, None, BACKENDS, 'skip larger files, in bytes'),
+    ('--min-age', 'MIN_AGE', int, None, BACKENDS, 'skip files changed less than this many seconds ago'),
+    ('--max-age', 'MAX_AGE', int, None, BACKENDS, 'skip files changed more than this many seconds ago'),
+    ('--memory-cap', 'MEMORY_CAP', int, None, BACKENDS, 'RSS in MiB above which pending work spills to disk'),
+    ('--spill', 'SPILL', str, None, BACKENDS, 'directory for pending work that does not fit in memory'),
+    ('--tune', 'TUNE', FLAG, False, BACKENDS, "size socket buffers and reads from each server's round trip time"),
+    ('--link-rate', 'LINK_RATE', int, 125000000, BACKENDS, 'bytes/s the tuned socket buffers are sized for'),
+    ('--verify', 'VERIFY', FLAG, False, BACKENDS, 'check downloads against server hashes (sizes for SFTP)'),
+    ('--profile', 'PROFILE', LIST, [], BACKENDS, 'comma separated cprofile, sample, memory, asyncio (sftp) or all'),
+    ('--profile-dir', 'PROFILE_DIR', str, None, BACKENDS, 'where profile artifacts go, profile-<time> by default'),
+    ('--tls', 'TLS', FLAG, False, ('ftp',), 'explicit FTPS: AUTH TLS, then private data connections'),
+    ('--ca-file', 'CA_FILE', str, None, ('ftp',), 'CA bundle to check the FTPS server against; implies --tls'),
+    ('--plan', 'PLAN', str, None, ('ftp',), 'dry run: write the sync plan to this file'),
+    ('--shards', 'SHARDS', int, 1, ('ftp',), 'worker processes, each syncing part of the tree'),
+    ('--shard-by', 'SHARD_BY', str, 'top', ('ftp',), 'split the tree by top-level directory or path hash'),
+    ('--journal', 'JOURNAL', str, None, ('ftp',), 'resume an interrupted sync from this journal file'),
+    ('--stream', 'STREAM', FLAG, False, ('ftp',), 'download while walking, in bounded memory'),
+    ('--dedup', 'DEDUP', str, None, ('ftp',), 'copy identical files locally: hardlink, reflink or copy'),
+    ('--dedup-index', 'DEDUP_INDEX', str, None, ('ftp',), 'keep the content index in this file, outside LOCAL'),
+    ('--mirrors', 'MIRRORS', LIST, [], ('ftp',), 'comma separated [user:passwd@]host[:port] of more servers'),
+    ('--watch', 'WATCH', float, None, ('ftp',), 'keep polling; hot directories every this many seconds'),
+    ('--watch-max', 'WATCH_MAX', float, 900.0, ('ftp',), 'longest polling interval of cold directories'),
+    ('--watch-metrics', 'WATCH_METRICS', str, None, ('ftp',), 'append one JSON line per watch cycle here'),
+    ('--priorities', 'PRIORITIES', str, None, ('ftp',), 'file of PATTERN PRIORITY [DEADLINE] transfer rules'),
+    ('--small-lane', 'SMALL_LANE', int, 0, ('ftp',), 'more workers that only take files under 100 KiB'),
+)
+CHOICES = {'--fsync': ('never', 'file', 'dir'), '--shard-by': ('top', 'hash'),
+           '--dedup': ('hardlink', 'reflink', 'copy')}
+
+
+def load_env(path):
+    if path and os.path.isfile(path):
+        # python-dotenv is only imported when there is a file for it to read
+        import dotenv
+        dotenv.load_dotenv(path)
+
+
+def from_env(env, name, kind, default):
+    value = env.get(name)
+    if not value:
+        return default
+    if kind == FLAG:
+        return value.lower() not in ('0', 'false', 'no')
+    if kind == LIST:
+        return [item for item in value.split(',') if item.strip()]
+    # zero has always meant unset
+    return kind(value) or default
+
+
+def build_parser(env):
+    parser = argparse.ArgumentParser(prog='sftpc', description='Mirror remote FTP, FTPS and SFTP trees.')
+    parser.add_argument('--env-file', default='.env', help='KEY=value file loaded into the environment first')
+    commands = parser.add_subparsers(dest='command', required=True)
+    sync = commands.add_parser('sync', help='mirror a remote tree into a local directory')
+    backends = sync.add_subparsers(dest='backend', required=True)
+    for backend in BACKENDS:
+        sub = backends.add_parser(backend, help=f'sync over {backend.upper()}')
+        sub.add_argument('local', nargs='?', default=env.get('LOCAL'), help='local directory ($LOCAL)')
+        sub.add_argument('remote', nargs='?', default=env.get('REMOTE'), help='remote directory ($REMOTE)')
+        for flag, name, kind, default, available, text in OPTIONS:
+            if backend not in available:
+                continue
+            default = from_env(env, name, kind, default)
+            text = f'{text} (${name})'
+            if kind == FLAG:
+                sub.add_argument(flag, action='store_true', default=default, help=text)
+            elif kind == LIST:
+                sub.add_argument(flag, type=lambda value: [v for v in value.split(',') if v.strip()],
+                                 default=default, help=text)
+            else:
+                sub.add_argument(flag, type=kind, default=default, choices=CHOICES.get(flag), help=text)
+    return parser
+
+
+def parse(argv, env):
+    parser = build_parser(env)
+    args = parser.parse_args(argv)
+    missing = [name for name in ('host', 'user', 'password', 'local', 'remote') if getattr(args, name) is None]
+    if missing:
+        parser.error('missing ' + ', '.join(missing) + ': pass them or set HN, UN, PW, LOCAL and REMOTE')
+    if args.profile:
+        from sftpc.profile import MODES
+        unknown = set(args.profile) - set(MODES) - {'all'}
+        if unknown:
+            parser.error('unknown profile modes ' + ', '.join(sorted(unknown)))
+    args.profiler = None
+    if args.port is None:
+        args.port = PORTS[args.backend]
+    if args.max_workers is None:
+        args.max_workers = WORKERS[args.backend]
+    if args.memory_cap and not args.spill:
+        args.spill = tempfile.gettempdir()
+    if args.backend == 'ftp' and (args.memory_cap or args.spill):
+        # bounded memory needs the walk and the downloads to run together
+        args.stream = True
+    if args.backend == 'ftp' and args.shards > 1 and (args.plan or args.watch):
+        # one plan file and one polling schedule cover the whole tree
+        parser.error('--shards does not combine with ' + ('--plan' if args.plan else '--watch'))
+    return args
+
+
+def limits(args):
+    if args.rate or args.host_rate or args.host_connections:
+        return {'rate': args.rate, 'host_rate': args.host_rate, 'host_connections': args.host_connections}
+    return None
+
+
+def tls_options(args):
+    if args.tls or args.ca_file:
+        return {'ca_file': args.ca_file}
+    return None
+
+
+def tls_context(options):
+    """The ``ssl.SSLContext`` for ``tls_options``, None without TLS; server certificates are always verified."""
+    if options is None:
+        return None
+    import ssl
+    return ssl.create_default_context(cafile=options['ca_file'])
+
+
+def filter_options(args):
+    rules = []
+    if args.filter:
+        with open(args.filter, encoding='utf8') as fd:
+            rules = fd.read().splitlines()
+    options = {'rules': rules, 'include': args.include, 'min_size': args.min_size,
+               'max_size': args.max_size, 'min_age': args.min_age, 'max_age': args.max_age}
+    return options if any(options.values()) else None
+
+
+def backend(name):
+    """The module running ``sftpc sync <name>``, imported on first use."""
+    if name not in BACKENDS:
+        raise Exception(f'unknown backend {name!r}')
+    return importlib.import_module('sftpc.sync_' + name)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # the environment file feeds the defaults, so it is read before the real parse
+    early = argparse.ArgumentParser(add_help=False)
+    early.add_argument('--env-file', default='.env')
+    known, _ = early.parse_known_args(argv)
+    load_env(known.env_file)
+    args = parse(argv, os.environ)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    module = backend(args.backend)
+    if not args.profile:
+        return module.run(args)
+    from sftpc.profile import Profiler
+    with Profiler(args.profile_dir, args.profile) as args.profiler:
+        return module.run(args)
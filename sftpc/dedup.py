@@ -0,0 +1,153 @@
+import errno
+import json
+import logging
+import os
+import shutil
+import threading
+
+from sftpc.partfile import DATA, finish, part_path
+
+logger = logging.getLogger(__name__)
+
+# how a duplicate is materialised, strongest first; each falls back to the
+# ones after it
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+COPY = 'copy'
+MODES = (HARDLINK, REFLINK, COPY)
+
+# linux/fs.h: share the extents of one file with another (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def reflink(source, target):
+    import fcntl
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+
+
+def unique_key(host, unique, size, mtime):
+    # MLSD unique facts only identify a file on the server that sent them,
+    # and not its content: a file rewritten in place keeps its fact
+    return f'unique:{host}:{unique}:{size}:{mtime}'
+
+
+def hash_key(algorithm, digest):
+    return f'{algorithm}:{digest}'
+
+
+class ContentIndex:
+    """
+    Local files by content, so a download can be satisfied from a copy
+    already on disk.
+
+    Keys are server hashes (``sha256:<hex>``) or MLSD ``unique`` facts of a
+    server; several keys may name the same file.  An entry is only used
+    while its file still has the size and mtime it was recorded with.  With
+    a ``path`` the index is kept as a JSONL file and grows across runs.
+
+    ``mode`` is the strongest way a duplicate may be made: a ``hardlink``
+    shares the inode, so the two paths also share their mtime, a
+    ``reflink`` shares extents copy-on-write where the filesystem supports
+    it, and a ``copy`` at least saves the transfer.
+    """
+
+    # below this many bytes asking the server for a hash costs about as much as the download
+    min_size = 64 << 10
+
+    def __init__(self, path=None, mode=REFLINK):
+        if mode not in MODES:
+            raise Exception(f'unknown dedup mode {mode!r}')
+        self.path = path
+        self.mode = mode
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.fd = None
+        self.reflinks = True
+        if path is not None and os.path.exists(path):
+            with open(path, encoding='utf8') as fd:
+                for line in fd:
+                    try:
+                        key, local, size, mtime = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[key] = (local, size, mtime)
+
+    def lookup(self, keys, size):
+        """A local file with one of ``keys`` and ``size`` bytes, or None."""
+        for key in keys:
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry is None:
+                continue
+            local, lsize, lmtime = entry
+            try:
+                st = os.stat(local)
+            except OSError:
+                st = None
+            if st is not None and st.st_size == lsize == size and int(st.st_mtime) == lmtime:
+                return local
+            with self.lock:
+                if self.entries.get(key) == entry:
+                    del self.entries[key]
+        return None
+
+    def record(self, keys, local):
+        try:
+            st = os.stat(local)
+        except OSError:
+            return
+        entry = (local, st.st_size, int(st.st_mtime))
+        with self.lock:
+            for key in keys:
+                if self.entries.get(key) == entry:
+                    continue
+                self.entries[key] = entry
+                if self.path is not None:
+                    if self.fd is None:
+                        self.fd = open(self.path, 'a', encoding='utf8')
+                    self.fd.write(json.dumps([key, *entry]) + '\n')
+            if self.fd is not None:
+                self.fd.flush()
+
+    def clone(self, source, local, mtime=None, fsync=DATA):
+        """Make ``local`` a copy of ``source`` and return how it was done."""
+        part = part_path(local)
+        if self.mode == HARDLINK:
+            try:
+                if os.path.lexists(part):
+                    os.remove(part)
+                os.link(source, part)
+                if os.path.exists(local) and os.path.samefile(source, local):
+                    # rename() between links of one inode does nothing
+                    os.remove(part)
+                else:
+                    # restamping would change the source too
+                    finish(part, local, None, fsync)
+                return HARDLINK
+            except OSError as err:
+                logger.debug("hardlink %s failed: %s", source, err)
+        if self.mode != COPY and self.reflinks:
+            try:
+                reflink(source, part)
+                finish(part, local, mtime, fsync)
+                return REFLINK
+            except (OSError, ImportError) as err:
+                if getattr(err, 'errno', None) in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, None):
+                    # the filesystem cannot; stop asking
+                    self.reflinks = False
+                logger.debug("reflink %s failed: %s", source, err)
+        shutil.copyfile(source, part)
+        finish(part, local, mtime, fsync)
+        return COPY
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                self.fd.close()
+                self.fd = None
@@ -0,0 +1,146 @@
+import posixpath
+import re
+import time
+
+
+def translate(pattern):
+    """Regex source for one gitignore-style glob, without anchors."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end < 0:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body[0] == '!':
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+class Rule:
+    __slots__ = ('pattern', 'negate', 'dir_only', 'regex')
+
+    def __init__(self, line):
+        self.pattern = line
+        self.negate = line.startswith('!')
+        if self.negate:
+            line = line[1:]
+        self.dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if '/' in line:
+            # a slash anywhere but the end anchors the pattern at the root
+            source = '^' + translate(line.lstrip('/')) + '$'
+        else:
+            source = '(?:^|/)' + translate(line) + '$'
+        self.regex = re.compile(source, re.DOTALL)
+
+    def __repr__(self):
+        return f'<Rule {self.pattern}>'
+
+
+def parse_rules(lines):
+    rules = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.endswith(' ') and not line.endswith('\\ '):
+            line = line.rstrip(' ')
+        if not line or line.startswith('#'):
+            continue
+        rules.append(Rule(line))
+    return rules
+
+
+class Filter:
+    """
+    Decide which remote entries a sync skips.
+
+    ``rules`` are gitignore lines: globs with ``*``, ``?``, ``[]`` and
+    ``**``, a trailing ``/`` for directories only, a leading or inner
+    ``/`` to anchor at the sync root, ``!`` to re-include; the last
+    matching rule wins.  ``include`` globs, if given, are the only files
+    synced.  Sizes are in bytes and ages in seconds since the remote mtime.
+    Excluded directories are never listed, so nothing under them can be
+    re-included.
+
+    Paths are relative to the sync root with ``/`` separators.
+    """
+
+    # remote path the rules are relative to; the sync root when None
+    root = None
+
+    def __init__(self, rules=(), include=(), min_size=None, max_size=None, min_age=None, max_age=None):
+        self.rules = parse_rules(rules)
+        self.include = parse_rules(include)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.min_age = min_age
+        self.max_age = max_age
+        # one pass over the alternation answers most paths: no rule matches
+        self.any = None
+        if self.rules:
+            self.any = re.compile('|'.join(f'(?:{rule.regex.pattern})' for rule in self.rules), re.DOTALL)
+        self.now = time.time()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, encoding='utf8') as fd:
+            return cls(fd.read().splitlines(), **kwargs)
+
+    def __bool__(self):
+        return bool(self.rules or self.include or self.min_size or self.max_size
+                    or self.min_age or self.max_age)
+
+    def excluded(self, path, isdir):
+        if self.any is None or not self.any.search(path):
+            return False
+        for rule in reversed(self.rules):
+            if rule.dir_only and not isdir:
+                continue
+            if rule.regex.search(path):
+                return not rule.negate
+        return False
+
+    def skip_dir(self, path):
+        return self.excluded(path, True)
+
+    def skip_file(self, path, size=None, mtime=None):
+        if self.excluded(path, False):
+            return True
+        if self.include and not any(rule.regex.search(path) for rule in self.include):
+            return True
+        if size is not None:
+            if self.min_size is not None and size < self.min_size:
+                return True
+            if self.max_size is not None and size > self.max_size:
+                return True
+        if mtime is not None:
+            age = self.now - mtime
+            if self.min_age is not None and age < self.min_age:
+                return True
+            if self.max_age is not None and age > self.max_age:
+                return True
+        return False
+
+
+def relative(path, root):
+    return posixpath.relpath(path, root or '.')
@@ -1,8 +1,19 @@
 import os
+import posixpath
 import time
+import calendar
 import socket
-import re
 import logging
+import ssl
+import threading
+
+from sftpc.bulk import Collector, ancestry, deepest_first, delete_group, mkd_group, rename_group, rmd_group
+from sftpc.dedup import hash_key, unique_key
+from sftpc.partfile import PartFile, DATA
+from sftpc.replies import PermanentError, ReplyReader, error, parse150, parse227, parse229, parse257
+from sftpc.stats import StatCollector
+from sftpc.throttle import too_many
+from sftpc.verify import HashMismatch, choose, hash_prefix, new_hash, parse_digest, parse_feat
 
 
 class PathIO:
@@ -26,75 +37,16 @@ class PathIO:
         else:
             return self.args['sizd']
 
+    def get_mtime(self):
+        modify = self.args.get('modify')
+        if not modify:
+            return None
+        return calendar.timegm(time.strptime(modify[:14], '%Y%m%d%H%M%S'))
+
     def __repr__(self):
         return f'<PathIO {self.name};{self.args["type"]}>'
 
 
-class StatCollector:
-
-    processed = 0
-    downloaded = 0
-    total = 0
-    skipped = 0
-    replaced = 0
-    start = time.time()
-    last = None
-    GiB = 1 << 30
-    MiB = 1 << 20
-    KiB = 1 << 10
-
-    def byte_suffix(self, size):
-        """
-        Return a human representation of a number of bytes.
-
-        Parameters
-        ----------
-        b : int
-            number of bytes
-        """
-        abbrevs = (
-            (self.GiB, 'GiB'),
-            (self.MiB, 'MiB'),
-            (self.KiB, 'KiB'),
-            (1, 'B')
-        )
-        for factor, suffix in abbrevs:
-            if size >= factor:
-                break
-        return factor, suffix
-
-    def humanize(self, size, starttime):
-        interval = time.time() - starttime
-        num = size / interval
-        factor, suffix = self.byte_suffix(num)
-        return "{0:.2f} {1}/s".format(num / factor, suffix)
-
-    def calc_speed(self, path, size, starttime):
-        speed = self.humanize(size, starttime)
-        self.last = path.name
-        self.downloaded += 1
-        self.total += size
-        print(f"Complete: {path}; Size: {size}; Rate {speed}")
-
-    def log_report(self):
-        msg = f"Elapsed Time: {time.time() - self.start} seconds; Processed: {self.processed}; Total: {self.total}; Downloaded: {self.downloaded}; Skipped: {self.skipped};"
-        logger.debug(msg)
-        print(msg, end='')
-
-    def show_end(self):
-        span = time.time() - self.start
-        rate = self.humanize(self.total, self.start)
-        stats = {
-            "time": span,
-            "processed": self.processed,
-            "total": self.total,
-            "downloaded": self.downloaded,
-            "skipped": self.skipped,
-            'avg rate': rate
-        }
-        print(stats)
-
-
 logger = logging.getLogger(__name__)
 
 OOB = 0x1
@@ -115,53 +67,102 @@ class Client:
     remote = None
     passivemode = True
     trust_pasv_ipv4 = True
-
-    def __init__(self, source_address=None, encoding='utf8', timeout=999):
+    transfer_type = None
+    next_data = None
+    prot_private = False
+    slot = False
+    # the control connection handed out by ``session`` as the host's last slot
+    lent = False
+    # size from the last 150 reply, if the server announced one
+    announced = None
+    fsync = DATA
+    journal = None
+    # check every download against the server's file hash, retrying on a mismatch
+    verify = False
+    verify_retries = 2
+    hashing = None
+    # a dedup.ContentIndex: downloads already on disk under another path are copied locally
+    content = None
+    # bulk operations: commands sent before reading replies, and sessions used at once
+    window = 64
+    bulk_workers = 4
+    # a tuning.SocketTuning: socket options and read sizes from each server's round trip time
+    tuning = None
+
+    def __init__(self, source_address=None, encoding='utf8', timeout=999, context=None, limiter=None):
         self.stats = StatCollector()
         self.encoding = encoding
         self.source_address = source_address
         self.timeout = timeout
+        # an ssl.SSLContext switches the session to explicit FTPS
+        self.context = context
+        # a throttle.Limiter shapes bandwidth and caps connections per server
+        self.limiter = limiter
+        self.idle = []
+        self.lock = threading.Condition()
 
     def connect(self, host='', port=0):
         self.host = host
         self.port = port
-        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout, source_address=self.source_address)
-        self.af = self.sock.family
-        self.file = self.sock.makefile('r', encoding=self.encoding)
-        message = self.getresp()
-        logger.debug(message)
+        if self.limiter is not None and not self.slot:
+            self.limiter.acquire(host, port)
+            self.slot = True
+        try:
+            if self.tuning is None:
+                self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout, source_address=self.source_address)
+            else:
+                self.sock = self.tuning.connect((self.host, self.port), self.timeout, self.source_address)
+                self.stats.tuning = self.tuning
+            self.af = self.sock.family
+            self.transfer_type = None
+            self.next_data = None
+            self.prot_private = False
+            self.reader = ReplyReader(self.sock.makefile('rb'), self.encoding, MAXSIZE)
+            message = self.getresp()
+            logger.debug(message)
+            if self.context is not None:
+                self.auth()
+        except:
+            self.close()
+            raise
         return self.sock
 
-    def getline(self):
-        line = self.file.readline(MAXSIZE+1)
-        if not line:
-            raise EOFError
-        if line[-2:] == CRLF:
-            line = line[:-2]
-        elif line[-1:] in CRLF:
-            line = line[:-1]
-        logger.debug(line)
-        return line
+    def wraptls(self, sock, session=None):
+        then = time.perf_counter()
+        sock = self.context.wrap_socket(sock, server_hostname=self.host, session=session)
+        self.stats.tls_handshake(time.perf_counter() - then, sock.session_reused)
+        return sock
+
+    def auth(self):
+        if isinstance(self.sock, ssl.SSLSocket):
+            raise Exception('already using TLS')
+        resp = self.sendcmd('AUTH TLS')
+        self.sock = self.wraptls(self.sock)
+        self.reader = ReplyReader(self.sock.makefile('rb'), self.encoding, MAXSIZE)
+        return resp
+
+    def prot_p(self):
+        self.sendcmd('PBSZ 0')
+        resp = self.sendcmd('PROT P')
+        self.prot_private = True
+        return resp
+
+    def prot_c(self):
+        resp = self.sendcmd('PROT C')
+        self.prot_private = False
+        return resp
 
     def getmultiline(self):
-        line = self.getline()
-        if line[3:4] == '-':
-            code = line[:3]
-            while True:
-                nextline = self.getline()
-                line += '\n' + nextline
-                if nextline[:3] == code and nextline[3:4] != '-':
-                    break
-        return line
+        resp = self.reader.read()
+        logger.debug(resp)
+        return resp
 
     def getresp(self):
         resp = self.getmultiline()
         self.lastresp = resp[:3]
-        code = resp[:1]
-        if code in '123':
+        if resp[:1] in '123':
             return resp
-        logger.debug(resp)
-        raise Exception(resp)
+        raise error(resp)
 
     def set_pasv(self, val):
         self.passivesmode = val
@@ -185,7 +186,7 @@ class Client:
         resp = self.getmultiline()
         if resp[:3] not in ['426', '225', '226']:
             logger.debug(resp)
-            raise Exception(resp)
+            raise error(resp)
         return resp
 
     def sendcmd(self, cmd):
@@ -204,6 +205,9 @@ class Client:
 
     def makeport(self):
         sock = socket.create_server(('', 0), family=self.af, backlog=1)
+        if self.tuning is not None:
+            # accepted connections inherit the listener's buffers
+            self.tuning.data(sock, self.host)
         port = sock.getsockname()[1]
         host = self.sock.getsockname()[0]
         if self.af == socket.AF_INET:
@@ -233,12 +237,49 @@ class Client:
             host, port = parse229(self.sendcmd('EPSV'), self.sock.getpeername())
         return host, port
 
+    def settype(self, kind):
+        # the representation type is session state; only send it on change
+        if self.transfer_type == kind:
+            return None
+        resp = self.sendcmd('TYPE ' + kind)
+        self.transfer_type = kind
+        return resp
+
+    def preparepasv(self):
+        # sent while a transfer is still streaming; the server answers it
+        # right after the 226, so the next data connection costs no extra
+        # round trip.  The reply is read by collectpasv().
+        self.putline('PASV' if self.af == socket.AF_INET else 'EPSV')
+
+    def collectpasv(self):
+        try:
+            resp = self.getresp()
+            if self.af == socket.AF_INET:
+                _, port = parse227(resp)
+                host = self.sock.getpeername()[0]
+            else:
+                host, port = parse229(resp, self.sock.getpeername())
+            self.next_data = self.connect_data(host, port)
+        except Exception as err:
+            logger.debug("pipelined PASV failed: %s", err)
+            self.next_data = None
+
+    def connect_data(self, host, port):
+        if self.tuning is None:
+            return socket.create_connection((host, port), self.timeout, source_address=self.source_address)
+        return self.tuning.connect((host, port), self.timeout, self.source_address, self.host)
+
+    def dataconn(self):
+        if self.next_data is not None:
+            conn, self.next_data = self.next_data, None
+            return conn
+        host, port = self.makepasv()
+        return self.connect_data(host, port)
+
     def ntransfercmd(self, cmd, rest=None):
         size = None
         if self.passivemode:
-            coro = self.makepasv()
-            host, port = coro
-            conn = socket.create_connection((host, port), self.timeout, source_address=self.source_address)
+            conn = self.dataconn()
             try:
                 if rest is not None:
                     self.sendcmd("REST %s" % rest)
@@ -246,7 +287,7 @@ class Client:
                 if resp[0] == '2':
                     resp = self.getresp()
                 if resp[0] != '1':
-                    raise Exception(resp)
+                    raise error(resp)
             except:
                 conn.close()
                 raise
@@ -258,11 +299,16 @@ class Client:
             if resp[0] == '2':
                 resp = self.getresp()
             if resp[0] != '1':
-                raise Exception(resp)
+                raise error(resp)
             conn, _ = sock.accept()
             conn.settimeout(self.timeout)
+        if self.prot_private:
+            # resume the control channel's session: an abbreviated handshake
+            # instead of a full one for every file
+            conn = self.wraptls(conn, self.sock.session)
         if resp[:3] == '150':
             size = parse150(resp)
+        self.announced = size
         return conn, size
 
     def transfercmd(self, cmd, rest=None):
@@ -272,28 +318,80 @@ class Client:
     def login(self, user = '', passwd = ''):
         self.user = user
         self.passwd = passwd
+        then = time.perf_counter()
         resp = self.sendcmd('USER ' + user)
+        if self.tuning is not None:
+            # USER costs the server next to nothing: its reply time is one round trip
+            self.tuning.sample(self.host, time.perf_counter() - then)
         if resp[0] == '3': resp = self.sendcmd('PASS ' + passwd)
-        if resp[0] != '2': raise Exception(resp)
+        if resp[0] != '2': raise error(resp)
+        if self.context is not None:
+            self.prot_p()
         return resp
 
-    def retrbinary(self, cmd, callback, blocksize=MAXSIZE, rest=None):
-        self.sendcmd('TYPE I')
+    def retrbinary(self, cmd, callback, blocksize=MAXSIZE, rest=None, prepare_next=False):
+        self.settype('I')
         conn = self.transfercmd(cmd, rest)
+        prepare_next = prepare_next and self.passivemode
+        if prepare_next:
+            self.preparepasv()
+        if self.tuning is not None:
+            blocksize = self.tuning.blocksize(self.host, blocksize)
+        limiter = self.limiter
+        if limiter is not None:
+            blocksize = limiter.blocksize(self.host, blocksize)
         total = 0
-        while True:
-            data = conn.recv(blocksize)
-            if not data:
-                break
-            callback(data)
-            total += len(data)
+        with conn:
+            while True:
+                data = conn.recv(blocksize)
+                if not data:
+                    break
+                callback(data)
+                total += len(data)
+                if limiter is not None:
+                    limiter.throttle(self.host, len(data))
+            if isinstance(conn, ssl.SSLSocket):
+                conn.unwrap()
         resp = self.getresp()
         logger.debug(resp)
+        if prepare_next:
+            self.collectpasv()
         return total
 
+    def retrieve_range(self, path, fd, offset, length, size):
+        """
+        Write ``length`` bytes of ``path`` from ``offset`` to the same offset of file descriptor ``fd``.
+
+        A range that ends before ``size`` is cut off mid-transfer, which
+        leaves this session unusable; close it afterwards.
+        """
+        self.settype('I')
+        conn = self.transfercmd("RETR " + path, offset or None)
+        limiter = self.limiter
+        blocksize = MAXSIZE
+        if self.tuning is not None:
+            blocksize = self.tuning.blocksize(self.host, blocksize)
+        if limiter is not None:
+            blocksize = limiter.blocksize(self.host, blocksize)
+        got = 0
+        with conn:
+            while got < length:
+                data = conn.recv(min(blocksize, length - got))
+                if not data:
+                    break
+                os.pwrite(fd, data, offset + got)
+                got += len(data)
+                if limiter is not None:
+                    limiter.throttle(self.host, len(data))
+        if offset + length >= size:
+            logger.debug(self.getresp())
+        if got < length:
+            raise Exception(f'{path}: range ended after {got} of {length} bytes')
+        return got
+
     def retrlines(self, cmd, callback):
         if callback is None: callback = print
-        resp = self.sendcmd('TYPE A')
+        resp = self.settype('A')
         logger.debug(resp)
         conn = self.transfercmd(cmd)
         fp = conn.makefile('r', encoding=self.encoding)
@@ -308,6 +406,10 @@ class Client:
             elif line[-1:] in CRLF:
                 line = line[:-1]
             callback(line)
+        fp.close()
+        if isinstance(conn, ssl.SSLSocket):
+            conn.unwrap()
+        conn.close()
         val = self.getresp()
         return val
 
@@ -348,6 +450,21 @@ class Client:
         cmd = 'CWD ' + dirname
         return self.sendcmd(cmd)
 
+    def delete(self, filename):
+        return self.sendcmd('DELE ' + filename)
+
+    def rename(self, fromname, toname):
+        resp = self.sendcmd('RNFR ' + fromname)
+        if resp[0] != '3':
+            raise error(resp)
+        return self.sendcmd('RNTO ' + toname)
+
+    def mkd(self, dirname):
+        return parse257(self.sendcmd('MKD ' + dirname))
+
+    def rmd(self, dirname):
+        return self.sendcmd('RMD ' + dirname)
+
     def size(self, filename):
         resp = self.sendcmd('SIZE ' + filename)
         if resp[:3] == '213':
@@ -367,10 +484,20 @@ class Client:
         return resp
 
     def close(self):
-        try: self.file.close()
+        while self.idle:
+            session = self.idle.pop()
+            try: session.quit()
+            except: session.close()
+        if self.next_data is not None:
+            self.next_data.close()
+            self.next_data = None
+        try: self.reader.close()
         except: pass
         try: self.sock.close()
         except: pass
+        if self.slot:
+            self.slot = False
+            self.limiter.release(self.host, self.port)
 
     def getsize(self, path):
         return self.size(path)
@@ -388,65 +515,310 @@ class Client:
     def isfile(self, path):
         return not self.isdir(path)
 
+    def session(self):
+        attempt = 0
+        while True:
+            with self.lock:
+                if self.idle:
+                    return self.idle.pop()
+                if self.limiter is not None:
+                    # an idle session may come back before a slot frees up
+                    delay = self.limiter.host_slots(self.host, self.port).try_acquire()
+                    if delay is None and self.slot and not self.lent:
+                        # at the cap, and the control connection holds a slot of it
+                        self.lent = True
+                        return self
+                    if delay != 0.0:
+                        self.lock.wait(delay if delay is not None else 0.1)
+                        continue
+            client = Client(self.source_address, self.encoding, self.timeout, self.context, self.limiter)
+            client.stats = self.stats
+            client.fsync = self.fsync
+            client.journal = self.journal
+            client.verify = self.verify
+            client.content = self.content
+            client.tuning = self.tuning
+            client.slot = self.limiter is not None
+            try:
+                client.connect(self.host, self.port)
+                client.login(self.user, self.passwd)
+            except Exception as err:
+                client.close()
+                if self.limiter is None or not too_many(err) or attempt >= self.limiter.retries:
+                    raise
+                # 421 or 530 "too many connections": shrink the cap and wait
+                self.limiter.refused(self.host, self.port)
+                attempt += 1
+                continue
+            if self.limiter is not None:
+                self.limiter.accepted(self.host, self.port)
+            return client
+
+    def release(self, client):
+        with self.lock:
+            if client is self:
+                self.lent = False
+            else:
+                self.idle.append(client)
+            self.lock.notify()
+
+    def discard(self, session):
+        """Close a session that failed; the control connection, if that was it, is reopened instead."""
+        if session is not self:
+            session.close()
+            return
+        # it may still owe a reply, so start it afresh
+        try: self.reader.close()
+        except: pass
+        try: self.sock.close()
+        except: pass
+        try:
+            self.connect(self.host, self.port)
+            self.login(self.user, self.passwd)
+        except Exception as err:
+            logger.info("reopening the control connection failed: %s", err)
+        self.release(self)
+
+    def hashes(self):
+        # session state: HASH needs its algorithm selected on every session
+        if self.hashing is None:
+            try:
+                features = parse_feat(self.sendcmd('FEAT'))
+            except PermanentError:
+                # no FEAT at all: no hashes either
+                features = {}
+            self.hashing = choose(features) or False
+            if self.hashing and self.hashing[0] == 'HASH':
+                self.sendcmd('OPTS HASH ' + self.hashing[1])
+            if not self.hashing:
+                logger.info("%s offers no file hashes", self.host)
+        return self.hashing
+
+    def remote_hash(self, path):
+        command, _, algorithm = self.hashing
+        return parse_digest(self.sendcmd(f'{command} {path}'), algorithm)
+
+    def duplicate(self, path, local, size, mtime, unique, keys):
+        # look the file up by its unique fact, then by its server hash, which
+        # also becomes the expected digest of a verified download
+        if unique:
+            keys.append(unique_key(self.host, unique, size, mtime))
+        source = self.content.lookup(keys, size)
+        expected = None
+        if source is None and size >= self.content.min_size and self.hashes():
+            expected = self.remote_hash(path)
+            keys.append(hash_key(self.hashing[2], expected))
+            source = self.content.lookup(keys[-1:], size)
+        if source is not None and source != local:
+            how = self.content.clone(source, local, mtime, self.fsync)
+            logger.info("%s: %s of %s", local, how, source)
+            self.stats.deduped += 1
+            self.stats.bytes_saved += size
+            self.content.record(keys, local)
+            return True, expected
+        return False, expected
+
+    def retrieve(self, remote, local, prepare_next=False, rest=None, size=None, mtime=None, unique=None):
+        if isinstance(remote, str):
+            path = remote
+        else:
+            path = remote.path
+            size = size or int(remote.get_size())
+            mtime = mtime or remote.get_mtime()
+            unique = unique or remote.args.get('unique')
+        keys = []
+        expected = None
+        if self.content is not None and not rest and size:
+            done, expected = self.duplicate(path, local, size, mtime, unique, keys)
+            if done:
+                return size
+        hashing = self.hashes() if self.verify else None
+        attempt = 0
+        while True:
+            try:
+                return self.download(path, remote, local, prepare_next, rest, size, mtime, hashing, expected, keys)
+            except HashMismatch as err:
+                self.stats.hash_mismatches += 1
+                if attempt >= self.verify_retries:
+                    raise
+                logger.info("%s, downloading it again", err)
+                attempt += 1
+                rest = None
+                expected = None
+
+    def download(self, path, remote, local, prepare_next, rest, size, mtime, hashing, expected=None, keys=()):
+        cmd = "RETR " + path
+        then = time.time()
+        journal = self.journal
+        stats = self.stats
+        offset = mark = rest or 0
+        digest = new_hash(hashing[2]) if hashing else None
+        with PartFile(local, rest, self.fsync) as part:
+            if digest is not None and rest:
+                hashed = time.perf_counter()
+                hash_prefix(part.part, digest, rest)
+                stats.hash_time += time.perf_counter() - hashed
+            def callback(data):
+                nonlocal offset, mark
+                if not part.allocated:
+                    part.allocate(size or self.announced)
+                part.write(data)
+                if digest is not None:
+                    hashed = time.perf_counter()
+                    digest.update(data)
+                    stats.hash_time += time.perf_counter() - hashed
+                offset += len(data)
+                if journal is not None and offset - mark >= journal.interval:
+                    # the offset is only recorded once the data reached the OS
+                    part.fd.flush()
+                    journal.progress(local, offset)
+                    mark = offset
+            total = self.retrbinary(cmd, callback, rest=rest, prepare_next=prepare_next)
+            if digest is not None:
+                expected = expected or self.remote_hash(path)
+                if digest.hexdigest() != expected:
+                    raise HashMismatch(f'{path}: {hashing[2]} {digest.hexdigest()} != {expected}')
+                stats.verified += 1
+            part.commit(mtime)
+        if self.content is not None:
+            keys = list(keys)
+            if digest is not None and hash_key(hashing[2], expected) not in keys:
+                keys.append(hash_key(hashing[2], expected))
+            self.content.record(keys, local)
+        stats.calc_speed(remote, total, then)
+        return total
+
     def get(self, remote, local):
-        client = Client()
-        client.connect(self.host, self.port)
-        client.login(self.user, self.passwd)
-        cmd = "RETR " + remote.path
-        with open(local, 'ab+') as fd:
-            callback = lambda x: fd.write(x)
-            then = time.time()
-            total = client.retrbinary(cmd, callback)
-        self.stats.calc_speed(remote, total, then)
-        client.quit()
+        failed = self.get_many([(remote, local)])
+        if failed:
+            raise failed[0][2]
+
+    def get_many(self, items):
+        # one warm session for the whole batch, with every data connection
+        # after the first opened while the previous file is streaming
+        failed = []
+        client = None
+        last = len(items) - 1
+        for i, item in enumerate(items):
+            # (remote, local[, rest[, size, mtime[, unique]]]): rest resumes at
+            # an offset, size, mtime and unique come from the listing
+            remote, local, rest, size, mtime, unique = (tuple(item) + (None,) * 4)[:6]
+            try:
+                if client is None:
+                    client = self.session()
+                client.retrieve(remote, local, i < last, rest, size, mtime, unique)
+            except Exception as err:
+                logger.debug("RETR %s failed: %s", remote, err)
+                failed.append((remote, local, err))
+                if client is not None:
+                    self.discard(client)
+                client = None
+        if client is not None:
+            self.release(client)
+        return failed
+
+    def pipeline(self, groups):
+        """
+        Send the commands of every group before reading a reply, then read
+        the replies in order.  Returns one error per group, None if every
+        reply was of the expected class.
+        """
+        lines = [line for group in groups for line, _ in group]
+        for line in lines:
+            if '\r' in line or '\n' in line:
+                raise Exception('an illegal newline character shouldn not be contained')
+        self.sock.sendall(''.join(line + CRLF for line in lines).encode(self.encoding))
+        errors = []
+        for group in groups:
+            failure = None
+            for _, expect in group:
+                resp = self.getmultiline()
+                if failure is None and resp[:1] != expect:
+                    failure = error(resp)
+            errors.append(failure)
+        return errors
+
+    def bulk(self, items, group, workers=None):
+        """
+        Run the commands ``group(item)`` makes for each of ``items``, pipelined
+        ``window`` items at a time on up to ``workers`` sessions.  Every item
+        is attempted; returns (item, error) of the ones that failed.  A
+        broken session fails the items it had in flight.
+        """
+        items = list(items)
+        chunks = iter([items[i:i + self.window] for i in range(0, len(items), self.window)])
+        failed = []
+        lock = threading.Lock()
+
+        def work():
+            client = None
+            while True:
+                with lock:
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                try:
+                    if client is None:
+                        client = self.session()
+                    errors = client.pipeline([group(item) for item in chunk])
+                except Exception as err:
+                    errors = [err] * len(chunk)
+                    if client is not None:
+                        self.discard(client)
+                    client = None
+                with lock:
+                    failed.extend((item, err) for item, err in zip(chunk, errors) if err is not None)
+            if client is not None:
+                self.release(client)
+
+        count = min(workers or self.bulk_workers, (len(items) + self.window - 1) // self.window)
+        threads = [threading.Thread(target=work) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return failed
+
+    def bulk_delete(self, paths, workers=None):
+        return self.bulk(paths, delete_group, workers)
+
+    def bulk_rename(self, pairs, workers=None):
+        """Rename each (source, target) of ``pairs``."""
+        return self.bulk(pairs, rename_group, workers)
+
+    def makedirs(self, tree, workers=None):
+        """
+        Make the directories of ``tree`` and their parents, a level at a time.
+
+        Directories that already exist are not failures; a failed MKD is
+        checked against a listing of its parent.
+        """
+        failed = []
+        for level in ancestry(tree):
+            missing = self.bulk(level, mkd_group, workers)
+            parents = {}
+            for path, err in missing:
+                parents.setdefault(posixpath.dirname(path), []).append((path, err))
+            for parent, entries in parents.items():
+                try:
+                    dirs = {entry.path for entry in self.listdir(parent) if entry.args.get('type') == 'dir'}
+                except Exception:
+                    dirs = set()
+                failed.extend((path, err) for path, err in entries if path not in dirs)
+        return failed
+
+    def remove_tree(self, path, workers=None, controller=None):
+        """
+        Delete ``path`` and everything below it: files in bulk, then the
+        directories deepest first.  Listings run on the planner's parallel
+        walker; returns (path, error) of whatever could not be listed or removed.
+        """
+        files, dirs, errors = Collector(self, path, controller).collect()
+        failed = [(remote, Exception(err)) for remote, err in errors]
+        failed.extend(self.bulk_delete(files, workers))
+        for level in deepest_first(dirs):
+            failed.extend(self.bulk(level, rmd_group, workers))
+        return failed
 
     def print_stats(self):
         self.stats.log_report()
-
-class rx:
-    _150_re = None
-    _227_re = None
-
-def parse150(resp):
-    if resp[:3] != '150': raise Exception(resp)
-    if rx._150_re is None: rx._150_re = re.compile(r"150 .* \((\d+) bytes\)", re.IGNORECASE | re.ASCII)
-    m = rx._150_re.match(resp)
-    if not m: return None
-    return int(m.group(1))
-
-def parse227(resp):
-    if resp[:3] != '227':  raise Exception(resp)
-    if rx._227_re is None: rx._227_re = re.compile(r'(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)', re.ASCII)
-    m = rx._227_re.search(resp)
-    if not m:  raise Exception(resp)
-    numbers = m.groups()
-    host = '.'.join(numbers[:4])
-    port = (int(numbers[4]) << 8) + int(numbers[5])
-    return host, port
-
-def parse229(resp, peer):
-    if resp[:3] != '229': raise Exception(resp)
-    left = resp.find('(')
-    if left < 0: raise Exception(resp)
-    right = resp.find(')', left + 1)
-    if right < 0:  raise Exception(resp)
-    if resp[left + 1] != resp[right - 1]:  raise Exception(resp)
-    parts = resp[left + 1:right].split(resp[left+1])
-    if len(parts) != 5: raise Exception(resp)
-    host = peer[0]
-    port = int(parts[3])
-    return host, port
-
-def parse257(resp):
-    if resp[:3] != '257': raise Exception(resp)
-    if resp[3:5] != ' "': return ''
-    dirname = ''
-    i, n = 5, len(resp)
-    while i < n:
-        c, i = resp[i], i+1
-        if c == '"':
-            if i >= n or resp[i] != '"':
-                break
-            i = i+1
-        dirname += c
-    return dirname
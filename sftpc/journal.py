@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import threading
+
+from sftpc.localindex import stat_entry
+from sftpc.partfile import part_path
+from sftpc.plan import Action, DOWNLOAD, RESUME, TRANSFERS
+
+logger = logging.getLogger(__name__)
+
+# record kinds, one JSON object per line under the key "ev"
+ACTION = 'action'
+LISTED = 'listed'
+PLANNED = 'planned'
+PROGRESS = 'progress'
+DONE = 'done'
+
+
+class Replay:
+    """What a journal says about an interrupted run."""
+
+    def __init__(self):
+        self.actions = {}
+        self.listed = {}
+        self.planned = False
+        self.offsets = {}
+        self.done = set()
+
+    def __bool__(self):
+        return bool(self.actions or self.listed)
+
+    def pending_dirs(self):
+        # listed directories whose subdirectories were never listed
+        pending = []
+        for local, remote, subdirs in self.listed.values():
+            for sub in subdirs:
+                if sub[1] not in self.listed:
+                    pending.append(tuple(sub))
+        return pending
+
+    def remaining(self):
+        """Actions not yet carried out, with in-flight files resumed at their offsets."""
+        actions = []
+        for action in self.actions.values():
+            if (action.op, action.local) in self.done:
+                continue
+            if action.op in TRANSFERS:
+                state = stat_entry(action.local)
+                if state is not None and state[0] == action.size and (
+                        action.mtime is None or state[1] == action.mtime):
+                    # renamed into place before its done record was written
+                    continue
+                offset = self.offsets.get(action.local)
+                if offset:
+                    part = stat_entry(part_path(action.local))
+                    # a preallocated part is longer than what was written
+                    offset = min(offset, part[0]) if part is not None else 0
+                    if offset:
+                        action.op, action.offset = RESUME, offset
+                    elif action.op == RESUME:
+                        action.op, action.offset = DOWNLOAD, 0
+            actions.append(action)
+        return actions
+
+
+class Journal:
+    """
+    Append-only JSONL record of a sync, so an interrupted run can pick up
+    where it stopped.
+
+    The planner records every action and every fully diffed directory, the
+    client records byte offsets of in-flight downloads every ``interval``
+    bytes, and the executor records completed actions.  Every record is
+    flushed as it is written; a torn last line is ignored on replay.
+    """
+
+    interval = 8 << 20
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.fd = None
+
+    def exists(self):
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def write(self, record):
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            if self.fd is None:
+                self.fd = open(self.path, 'a', encoding='utf8')
+            self.fd.write(line)
+            self.fd.flush()
+
+    def action(self, action):
+        self.write({'ev': ACTION, **action.to_dict()})
+
+    def listed(self, local, remote, subdirs):
+        self.write({'ev': LISTED, 'local': local, 'remote': remote,
+                    'subdirs': [[sub[0], sub[1]] for sub in subdirs]})
+
+    def planned(self):
+        self.write({'ev': PLANNED})
+        with self.lock:
+            os.fsync(self.fd.fileno())
+
+    def progress(self, local, offset):
+        self.write({'ev': PROGRESS, 'local': local, 'offset': offset})
+
+    def done(self, op, local):
+        self.write({'ev': DONE, 'op': op, 'local': local})
+
+    def replay(self):
+        replay = Replay()
+        if not self.exists():
+            return replay
+        with open(self.path, 'rb+') as fd:
+            good = 0
+            for line in fd:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError(line)
+                    record = json.loads(line)
+                except ValueError:
+                    # cut the torn record off, or the next append would join it
+                    logger.info("dropping torn journal record in %s", self.path)
+                    fd.truncate(good)
+                    break
+                good += len(line)
+                kind = record.pop('ev')
+                if kind == ACTION:
+                    action = Action.from_dict(record)
+                    # a directory relisted after a crash adds its actions again
+                    replay.actions[(action.op, action.local)] = action
+                elif kind == LISTED:
+                    replay.listed[record['remote']] = (record['local'], record['remote'], record['subdirs'])
+                elif kind == PLANNED:
+                    replay.planned = True
+                elif kind == PROGRESS:
+                    replay.offsets[record['local']] = record['offset']
+                elif kind == DONE:
+                    replay.done.add((record['op'], record['local']))
+        return replay
+
+    def compact(self, actions):
+        """Rewrite the journal as just the remaining ``actions`` of a finished plan."""
+        temp = self.path + '.tmp'
+        with open(temp, 'w', encoding='utf8') as fd:
+            for action in actions:
+                fd.write(json.dumps({'ev': ACTION, **action.to_dict()}) + '\n')
+            fd.write(json.dumps({'ev': PLANNED}) + '\n')
+            fd.flush()
+            os.fsync(fd.fileno())
+        with self.lock:
+            if self.fd is not None:
+                self.fd.close()
+                self.fd = None
+            os.replace(temp, self.path)
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                self.fd.close()
+                self.fd = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
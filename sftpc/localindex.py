@@ -0,0 +1,93 @@
+import os
+import stat
+import threading
+
+FILE = 'file'
+DIR = 'dir'
+OTHER = 'other'
+
+
+def entry_type(mode):
+    if stat.S_ISREG(mode):
+        return FILE
+    if stat.S_ISDIR(mode):
+        return DIR
+    return OTHER
+
+
+def stat_entry(path):
+    """(size, mtime, type) of a single path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return st.st_size, st.st_mtime, entry_type(st.st_mode)
+
+
+class LocalIndex:
+    """
+    Cache of local directories as name -> (size, mtime, type).
+
+    A directory costs one ``os.scandir`` pass instead of exists/getsize/
+    isfile calls for every entry.  Callers that walk a tree once should
+    ``forget`` directories when done with them to keep memory flat.
+    """
+
+    def __init__(self):
+        self.dirs = {}
+        self.lock = threading.Lock()
+        self.scans = 0
+
+    def scan(self, directory):
+        with self.lock:
+            entries = self.dirs.get(directory)
+        if entries is not None:
+            return entries
+        entries = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries[entry.name] = (st.st_size, st.st_mtime, entry_type(st.st_mode))
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        with self.lock:
+            self.scans += 1
+            self.dirs[directory] = entries
+        return entries
+
+    def lookup(self, path):
+        directory, name = os.path.split(path)
+        return self.scan(directory or '.').get(name)
+
+    def forget(self, directory):
+        with self.lock:
+            self.dirs.pop(directory, None)
+
+    def update(self, path, entry):
+        directory, name = os.path.split(path)
+        with self.lock:
+            entries = self.dirs.get(directory or '.')
+            if entries is not None:
+                if entry is None:
+                    entries.pop(name, None)
+                else:
+                    entries[name] = entry
+
+    async def ascan(self, directory):
+        # scandir blocks, badly so on network filesystems: keep it off the loop
+        with self.lock:
+            entries = self.dirs.get(directory)
+        if entries is not None:
+            return entries
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.scan, directory)
+
+    async def alookup(self, path):
+        directory, name = os.path.split(path)
+        entries = await self.ascan(directory or '.')
+        return entries.get(name)
@@ -0,0 +1,286 @@
+import logging
+import os
+import threading
+import time
+
+from sftpc.ftpdirsync import Client
+from sftpc.partfile import PartFile, part_path
+from sftpc.verify import HashMismatch, hash_prefix, new_hash
+
+logger = logging.getLogger(__name__)
+
+
+def parse_mirror(spec, user, passwd, port=21):
+    """``[user:passwd@]host[:port]`` as (host, port, user, passwd), defaulting to the primary's login."""
+    login, _, address = spec.strip().rpartition('@')
+    if login:
+        user, _, passwd = login.partition(':')
+    host, _, number = address.partition(':')
+    return host, int(number or port), user, passwd
+
+
+def pool(primary, host, port, user, passwd):
+    """A client configured like ``primary`` that only hands out sessions to another server."""
+    client = Client(primary.source_address, primary.encoding, primary.timeout, primary.context, primary.limiter)
+    client.host, client.port, client.user, client.passwd = host, port, user, passwd
+    client.stats = primary.stats
+    client.fsync = primary.fsync
+    client.verify = primary.verify
+    client.content = primary.content
+    client.tuning = primary.tuning
+    return client
+
+
+class Mirror:
+    """One server of a ``MirrorSet`` and what its transfers have shown of it."""
+
+    def __init__(self, client):
+        self.client = client
+        self.name = f'{client.host}:{client.port}'
+        # bytes per second, smoothed over recent transfers; None until measured
+        self.rate = None
+        self.transfers = 0
+        self.errors = 0
+        self.failures = 0
+        self.downs = 0
+        self.down_until = 0.0
+        self.active = 0
+
+    def healthy(self, now):
+        return self.down_until <= now
+
+    def __repr__(self):
+        return f'<Mirror {self.name}>'
+
+
+class MirrorSet:
+    """
+    Spread the transfers of a sync over equivalent servers.
+
+    Listings stay on the primary; ``get_many`` sends each batch to the
+    healthy mirror with the best score, its smoothed throughput discounted
+    by its error rate and by the transfers already running on it.  Mirrors
+    not yet measured are tried first.  A mirror that fails ``failures``
+    times in a row, or cannot be reached, is left alone for ``backoff``
+    seconds, doubling each time.  Files that fail on one mirror are retried
+    on the others, resuming from their ``.part``.
+
+    Files of at least two ``segment`` lengths are split into ranges fetched
+    from several mirrors at once.
+    """
+
+    alpha = 0.3
+    failures = 3
+    backoff = 30.0
+    max_backoff = 600.0
+    segment = 64 << 20
+
+    def __init__(self, primary, mirrors=()):
+        self.primary = Mirror(primary)
+        self.mirrors = [self.primary] + [Mirror(pool(primary, *mirror)) for mirror in mirrors]
+        self.stats = primary.stats
+        self.lock = threading.Lock()
+
+    @property
+    def journal(self):
+        return self.primary.client.journal
+
+    @journal.setter
+    def journal(self, journal):
+        for mirror in self.mirrors:
+            mirror.client.journal = journal
+
+    def score(self, mirror, best):
+        rate = mirror.rate if mirror.rate is not None else best * 2
+        # errors over attempts, with one success and one error assumed up front
+        errors = (mirror.errors + 1) / (mirror.transfers + mirror.errors + 2)
+        return rate * (1 - errors) / (1 + mirror.active)
+
+    def ranked(self, exclude=()):
+        now = time.monotonic()
+        candidates = [m for m in self.mirrors if m not in exclude]
+        healthy = [m for m in candidates if m.healthy(now)]
+        if not healthy:
+            # all backing off: the one due back soonest beats failing outright
+            return sorted(candidates, key=lambda m: m.down_until)[:1]
+        best = max((m.rate for m in healthy if m.rate is not None), default=1.0)
+        return sorted(healthy, key=lambda m: self.score(m, best), reverse=True)
+
+    def pick(self, exclude=()):
+        with self.lock:
+            ranked = self.ranked(exclude)
+            if not ranked:
+                return None
+            ranked[0].active += 1
+            return ranked[0]
+
+    def finished(self, mirror, size, seconds, done, errors, unreachable=False):
+        with self.lock:
+            mirror.active -= 1
+            mirror.transfers += done
+            mirror.errors += errors
+            if size and seconds > 0:
+                rate = size / seconds
+                mirror.rate = rate if mirror.rate is None else self.alpha * rate + (1 - self.alpha) * mirror.rate
+            if done:
+                mirror.failures = 0
+            mirror.failures += errors
+            if unreachable or mirror.failures >= self.failures:
+                delay = min(self.backoff * 2 ** mirror.downs, self.max_backoff)
+                mirror.downs += 1
+                mirror.failures = 0
+                mirror.down_until = time.monotonic() + delay
+                logger.info("mirror %s unhealthy, retrying it in %.0f s", mirror.name, delay)
+            elif done:
+                mirror.downs = 0
+
+    def get_many(self, items):
+        # (remote, local[, rest[, size, mtime[, unique]]]) as for Client.get_many
+        pending = [(tuple(item) + (None,) * 4)[:6] for item in items]
+        failed = []
+        rest = []
+        for item in pending:
+            if item[2] is None and item[3] and item[3] >= 2 * self.segment and len(self.ranked()) > 1:
+                try:
+                    if self.segmented(*item):
+                        continue
+                except Exception as err:
+                    logger.info("segmented download of %s failed: %s", item[0], err)
+            rest.append(item)
+        pending = rest
+        tried = set()
+        errors = {}
+        while pending:
+            mirror = self.pick(tried)
+            if mirror is None:
+                failed.extend((item[0], item[1], errors[item[1]]) for item in pending)
+                break
+            tried.add(mirror)
+            then = time.monotonic()
+            try:
+                bad = mirror.client.get_many(pending)
+            except Exception as err:
+                bad = [(item[0], item[1], err) for item in pending]
+            bad_locals = {local for _, local, _ in bad}
+            size = sum((item[3] or 0) - (item[2] or 0) for item in pending if item[1] not in bad_locals)
+            unreachable = len(bad) == len(pending) and any(isinstance(err, OSError) for _, _, err in bad)
+            self.finished(mirror, size, time.monotonic() - then, len(pending) - len(bad), len(bad), unreachable)
+            retry = []
+            for item in pending:
+                if item[1] not in bad_locals:
+                    continue
+                errors[item[1]] = next(err for _, local, err in bad if local == item[1])
+                # carry on from whatever reached the .part before the failure
+                part = part_path(item[1])
+                offset = os.path.getsize(part) if os.path.exists(part) else item[2] or 0
+                if isinstance(errors[item[1]], HashMismatch) or not item[3] or offset >= item[3]:
+                    offset = 0
+                retry.append((item[0], item[1], offset or None) + item[3:])
+            if retry:
+                logger.info("%d files failed on %s, trying another mirror", len(retry), mirror.name)
+            pending = retry
+        return failed
+
+    def segmented(self, remote, local, rest, size, mtime, unique):
+        """Fetch ``remote`` in ranges from several mirrors; False if it could not be split."""
+        then = time.time()
+        primary = self.primary.client
+        if primary.content is not None:
+            session = primary.session()
+            try:
+                done, _ = session.duplicate(remote, local, size, mtime, unique, [])
+            except Exception:
+                primary.discard(session)
+                raise
+            primary.release(session)
+            if done:
+                return True
+        with self.lock:
+            count = min(len(self.ranked()), size // self.segment)
+        if count < 2:
+            return False
+        step = -(-size // count)
+        ranges = [[start, min(start + step, size)] for start in range(0, size, step)]
+        errors = []
+        with PartFile(local, fsync=primary.fsync) as part:
+            part.allocate(size)
+            fd = part.fd.fileno()
+            threads = [threading.Thread(target=self.fetch_range, args=(remote, fd, size, span, errors))
+                       for span in ranges]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if errors:
+                part.fd.close()
+                # holes where ranges are missing: nothing to resume from
+                os.remove(part.part)
+                raise errors[0]
+            part.fd.seek(size)
+            if primary.verify:
+                self.verify(remote, part.part, size)
+            part.commit(mtime)
+        self.stats.calc_speed(remote, size, then)
+        return True
+
+    def fetch_range(self, remote, fd, size, span, errors):
+        tried = set()
+        while span[0] < span[1]:
+            mirror = self.pick(tried)
+            if mirror is None:
+                errors.append(Exception(f'{remote}: no mirror left for bytes {span[0]}-{span[1]}'))
+                return
+            tried.add(mirror)
+            then = time.monotonic()
+            start = span[0]
+            session = None
+            err = None
+            try:
+                session = mirror.client.session()
+                span[0] += session.retrieve_range(remote, fd, span[0], span[1] - span[0], size)
+            except Exception as error:
+                err = error
+            if session is not None:
+                if err is None and span[1] == size:
+                    mirror.client.release(session)
+                else:
+                    # stopped mid-file: the control channel still owes a reply
+                    mirror.client.discard(session)
+            got = span[0] - start
+            self.finished(mirror, got, time.monotonic() - then, int(err is None), int(err is not None),
+                          isinstance(err, OSError) and not got)
+            if err is not None:
+                logger.info("range %d-%d of %s failed on %s: %s", start, span[1], remote, mirror.name, err)
+
+    def verify(self, remote, path, size):
+        client = self.primary.client
+        session = client.session()
+        try:
+            hashing = session.hashes()
+            expected = session.remote_hash(remote) if hashing else None
+        except Exception:
+            client.discard(session)
+            raise
+        client.release(session)
+        if not hashing:
+            return
+        digest = new_hash(hashing[2])
+        then = time.perf_counter()
+        hash_prefix(path, digest, size)
+        self.stats.hash_time += time.perf_counter() - then
+        if digest.hexdigest() != expected:
+            self.stats.hash_mismatches += 1
+            raise HashMismatch(f'{remote}: {hashing[2]} {digest.hexdigest()} != {expected}')
+        self.stats.verified += 1
+
+    def report(self):
+        lines = []
+        for mirror in self.mirrors:
+            rate = f'{mirror.rate / (1 << 20):.2f} MiB/s' if mirror.rate else '-'
+            state = 'up' if mirror.healthy(time.monotonic()) else 'down'
+            lines.append(f'{mirror.name}: {state}, {mirror.transfers} transfers, {mirror.errors} errors, {rate}')
+        return lines
+
+    def close(self):
+        for mirror in self.mirrors[1:]:
+            mirror.client.close()
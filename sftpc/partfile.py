@@ -0,0 +1,109 @@
+import logging
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+PART = '.part'
+
+# fsync policies: never, the file before it is renamed, or the file and
+# then its directory so the rename itself survives a crash
+NEVER = 'never'
+DATA = 'file'
+FULL = 'dir'
+FSYNC = (NEVER, DATA, FULL)
+
+
+def part_path(path):
+    return path + PART
+
+
+def fsync_dir(directory):
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def finish(part, path, mtime=None, fsync=DATA):
+    """Stamp a completed ``part`` with the remote ``mtime`` and rename it onto ``path``."""
+    if fsync != NEVER:
+        fd = os.open(part, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    if mtime is not None:
+        os.utime(part, (mtime, mtime))
+    os.replace(part, path)
+    if fsync == FULL:
+        fsync_dir(os.path.dirname(path))
+
+
+class PartFile:
+    """
+    Download target that only appears at its final path once complete.
+
+    Data goes to ``path + '.part'``, preallocated to the expected size so
+    large files are laid out in few extents.  ``commit`` trims it to what
+    was written, syncs it according to the fsync policy, stamps the remote
+    mtime and renames it into place.  If the transfer fails the part is
+    trimmed to the written length and left behind, so a later run can
+    resume from it.
+    """
+
+    def __init__(self, path, rest=None, fsync=DATA):
+        if fsync not in FSYNC:
+            raise Exception(f'unknown fsync policy {fsync!r}')
+        self.path = path
+        self.part = part_path(path)
+        self.rest = rest or 0
+        self.fsync = fsync
+        self.allocated = False
+        self.fd = None
+
+    def open(self):
+        if self.rest:
+            part = os.stat(self.part).st_size if os.path.exists(self.part) else 0
+            if part < self.rest and os.path.exists(self.path):
+                # growing an existing copy: it becomes the part while it grows,
+                # unless it is hardlinked elsewhere and must not change there
+                if os.stat(self.path).st_nlink > 1:
+                    shutil.copyfile(self.path, self.part)
+                else:
+                    os.replace(self.path, self.part)
+            self.fd = open(self.part, 'r+b')
+            self.fd.seek(self.rest)
+        else:
+            self.fd = open(self.part, 'wb')
+        return self
+
+    def allocate(self, size):
+        self.allocated = True
+        if not size or size <= self.rest or not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(self.fd.fileno(), 0, size)
+        except OSError as err:
+            # not supported by every filesystem; only an optimisation
+            logger.debug("fallocate %s failed: %s", self.part, err)
+
+    def write(self, data):
+        self.fd.write(data)
+
+    def close(self):
+        # preallocated space past the written data must not count as downloaded
+        self.fd.truncate(self.fd.tell())
+        self.fd.close()
+
+    def commit(self, mtime=None):
+        self.close()
+        finish(self.part, self.path, mtime, self.fsync)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, kind, value, tb):
+        if kind is not None and not self.fd.closed:
+            self.close()
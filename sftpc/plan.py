@@ -0,0 +1,499 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+
+from sftpc.adaptive import AIMDController
+from sftpc.backlog import Backlog
+from sftpc.filters import relative
+from sftpc.localindex import LocalIndex, stat_entry, FILE, DIR
+from sftpc.partfile import PART, part_path
+from sftpc.priority import DEFAULT, TransferQueue
+
+logger = logging.getLogger(__name__)
+
+MKDIR = 'mkdir'
+DOWNLOAD = 'download'
+RESUME = 'resume'
+REPLACE = 'replace'
+DELETE = 'delete'
+
+OPS = (DELETE, MKDIR, DOWNLOAD, RESUME, REPLACE)
+TRANSFERS = (DOWNLOAD, RESUME, REPLACE)
+
+
+class Action:
+    __slots__ = ('op', 'local', 'remote', 'size', 'offset', 'mtime', 'unique')
+
+    def __init__(self, op, local, remote=None, size=0, offset=0, mtime=None, unique=None):
+        self.op = op
+        self.local = local
+        self.remote = remote
+        self.size = size
+        self.offset = offset
+        self.mtime = mtime
+        # the MLSD unique fact, which identifies server-side duplicates
+        self.unique = unique
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __repr__(self):
+        return f'<Action {self.op} {self.local}>'
+
+
+class Plan:
+    """Everything a sync will change locally, decided before anything is changed."""
+
+    def __init__(self, local, remote, actions=None, errors=None):
+        self.local = local
+        self.remote = remote
+        self.actions = actions or []
+        self.errors = errors or []
+
+    def __iter__(self):
+        return iter(self.actions)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def counts(self):
+        counts = dict.fromkeys(OPS, 0)
+        for action in self.actions:
+            counts[action.op] += 1
+        return counts
+
+    def sort(self):
+        # stable order so dumped plans of the same tree diff cleanly
+        self.actions.sort(key=lambda a: (OPS.index(a.op), a.local))
+
+    def to_dict(self):
+        return {
+            'local': self.local,
+            'remote': self.remote,
+            'counts': self.counts(),
+            'bytes': sum(a.size - a.offset for a in self.actions if a.op in TRANSFERS),
+            'actions': [a.to_dict() for a in self.actions],
+            'errors': self.errors,
+        }
+
+    def dump(self, fp):
+        json.dump(self.to_dict(), fp, indent=1)
+
+    @classmethod
+    def load(cls, fp):
+        data = json.load(fp)
+        actions = [Action.from_dict(a) for a in data['actions']]
+        return cls(data['local'], data['remote'], actions, data.get('errors'))
+
+
+class Planner:
+    """
+    Diff a remote tree against the local one into a ``Plan``.
+
+    Directories are listed in parallel on pooled sessions, as many at a time
+    as the listing controller allows.  File decisions come from the facts
+    of the parent listing, so files themselves are never listed, and local
+    state from one scandir pass per directory through the ``LocalIndex``.
+
+    Directories waiting to be listed sit in a ``Backlog``, bounded in memory
+    and taken depth first.  With a ``sink`` (an ``Executor`` streaming the
+    sync) actions are handed over as they are decided instead of being
+    collected into the plan.
+    """
+
+    def __init__(self, client, local, remote, controller=None, delete=False, index=None, journal=None,
+                 filter=None, backlog=None):
+        self.client = client
+        self.local = local
+        self.remote = remote
+        self.controller = controller or AIMDController(name='listing')
+        self.index = index or LocalIndex()
+        # also remove local files and directories missing on the server
+        self.delete = delete
+        # a journal.Journal makes an interrupted plan or run resumable
+        self.journal = journal
+        # a filters.Filter: excluded directories are pruned before they are listed
+        self.filter = filter
+        self.backlog = backlog
+        self.sink = None
+        self.lock = threading.Lock()
+
+    def add(self, *actions):
+        if self.journal is not None:
+            for action in actions:
+                self.journal.action(action)
+        self.emit(actions)
+
+    def emit(self, actions):
+        if self.sink is not None:
+            for action in actions:
+                self.sink.add(action)
+        else:
+            with self.lock:
+                self.result.actions.extend(actions)
+
+    def diff_file(self, local, remote, state, part=None):
+        size = int(remote.get_size())
+        mtime = remote.get_mtime()
+        unique = remote.args.get('unique')
+        if state is None:
+            if part is not None and part[2] == FILE and 0 < part[0] < size:
+                # an interrupted download: carry on from its .part
+                self.client.stats.replaced += 1
+                return self.add(Action(RESUME, local, remote.path, size, offset=part[0], mtime=mtime))
+            return self.add(Action(DOWNLOAD, local, remote.path, size, mtime=mtime, unique=unique))
+        lsize, lmtime, kind = state
+        if kind != FILE:
+            self.client.stats.replaced += 1
+            return self.add(Action(DELETE, local), Action(DOWNLOAD, local, remote.path, size, mtime=mtime, unique=unique))
+        if lsize >= size:
+            self.client.stats.skipped += 1
+            if self.client.stats.skipped % 10 == 0:
+                logger.info("Skipping: %s" % remote)
+            return
+        self.client.stats.replaced += 1
+        if mtime is not None and lmtime < mtime:
+            # local copy predates the remote change: not a prefix of it
+            return self.add(Action(REPLACE, local, remote.path, size, mtime=mtime, unique=unique))
+        self.add(Action(RESUME, local, remote.path, size, offset=lsize, mtime=mtime))
+
+    def filtered(self, path):
+        rel = relative(path.path, self.filter.root or self.remote)
+        if path.isfile():
+            if self.filter.skip_file(rel, int(path.get_size()), path.get_mtime()):
+                self.client.stats.filtered_files += 1
+                return True
+        elif self.filter.skip_dir(rel):
+            self.client.stats.filtered_dirs += 1
+            return True
+        return False
+
+    def diff_dir(self, local, remote, listing, state):
+        """Plan one listed directory and return its subdirectories to visit."""
+        entries = {}
+        if state is None:
+            self.add(Action(MKDIR, local))
+        elif state[2] != DIR:
+            self.add(Action(DELETE, local), Action(MKDIR, local))
+        else:
+            entries = self.index.scan(local)
+        subdirs = []
+        names = set()
+        for path in listing:
+            if path.name in ['.', '..'] or path.args.get('type') not in ('file', 'dir'):
+                continue
+            self.client.stats.processed += 1
+            # filtered entries also count as present, so they are never deleted
+            names.add(path.name)
+            if self.filter and self.filtered(path):
+                continue
+            local1 = os.path.join(local, path.name).replace('\\', '/')
+            if path.isfile():
+                self.diff_file(local1, path, entries.get(path.name), entries.get(path.name + PART))
+            else:
+                subdirs.append((local1, path.path, entries.get(path.name)))
+        if self.delete:
+            for name in entries:
+                if name not in names and not (name.endswith(PART) and name[:-len(PART)] in names):
+                    self.add(Action(DELETE, os.path.join(local, name).replace('\\', '/')))
+        # every entry has been decided; the subdirectories carry their own state
+        self.index.forget(local)
+        if self.journal is not None:
+            self.journal.listed(local, remote, subdirs)
+        if self.sink is not None:
+            self.sink.flush(local)
+        return subdirs
+
+    def plan(self, entry=None):
+        """The ``Plan``; with ``entry``, the listing entry of a single file, of just that file, which is not listed."""
+        self.result = Plan(self.local, self.remote)
+        replay = self.journal.replay() if self.journal is not None else None
+        if replay and replay.planned:
+            # nothing to list: the plan is what the last run had left to do
+            actions = replay.remaining()
+            self.journal.compact(actions)
+            logger.info("resuming %d actions from %s", len(actions), self.journal.path)
+            self.emit(actions)
+        elif replay and self.remote in replay.listed:
+            # finished directories keep what is left of their actions and are not listed again
+            self.emit(replay.remaining())
+            pending = [(local, remote, stat_entry(local)) for local, remote in replay.pending_dirs()]
+            logger.info("resuming plan: %d directories listed, %d pending",
+                        len(replay.listed), len(pending))
+            self.walk(pending)
+            self.journal.planned()
+        else:
+            listing = [entry] if entry is not None else self.client.listdir(self.remote)
+            self.client.stats.processed += 1
+            state = stat_entry(self.local)
+            if len(listing) == 1 and listing[0].isfile():
+                self.diff_file(self.local, listing[0], state, stat_entry(part_path(self.local)))
+            else:
+                self.walk(self.diff_dir(self.local, self.remote, listing, state))
+            if self.journal is not None:
+                self.journal.planned()
+        self.result.sort()
+        return self.result
+
+    def walk(self, subdirs):
+        # an empty backlog is falsy
+        self.pending = self.backlog if self.backlog is not None else Backlog()
+        self.ready = threading.Condition()
+        self.outstanding = len(subdirs)
+        if not subdirs:
+            return
+        for item in subdirs:
+            self.pending.put(item)
+        workers = [threading.Thread(target=self.work) for _ in range(self.controller.maximum)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.pending.close()
+
+    def next_dir(self):
+        with self.ready:
+            while self.outstanding:
+                item = self.pending.get()
+                if item is not None:
+                    return item
+                # everything left is being listed; its subdirectories may follow
+                self.ready.wait()
+            return None
+
+    def work(self):
+        while True:
+            item = self.next_dir()
+            if item is None:
+                return
+            local, remote, state = item
+            self.controller.acquire()
+            session = None
+            try:
+                session = self.client.session()
+                listing = session.listdir(remote)
+            except Exception as err:
+                logger.info("listing %s failed: %s", remote, err)
+                if session is not None:
+                    self.client.discard(session)
+                self.controller.release(items=0, errors=1)
+                with self.lock:
+                    self.result.errors.append([remote, str(err)])
+                subdirs = []
+            else:
+                self.client.release(session)
+                self.controller.release(len(listing))
+                subdirs = self.diff_dir(local, remote, listing, state)
+            with self.ready:
+                self.outstanding += len(subdirs) - 1
+                for sub in subdirs:
+                    self.pending.put(sub)
+                self.ready.notify_all()
+
+
+class Executor:
+    """
+    Carry out a ``Plan``.
+
+    Deletes and directory creation run first, in order.  Transfers are then
+    regrouped: small files by directory into batches that share one warm
+    session, large files one per unit, the two interleaved so bandwidth-
+    bound and latency-bound work overlap across the workers.
+
+    ``stream`` instead runs the workers while the planner walks: actions
+    arrive through ``add``, directory changes are applied at once and
+    transfers go onto a queue of ``queue_size`` units that blocks the walk
+    when the workers fall behind.
+
+    With ``priorities`` (a ``priority.Priorities``) the workers take units
+    by priority and deadline rather than in order, and small files are
+    batched per directory and dataset so a batch has one priority.
+    ``lane`` more workers take only units of small files, past the
+    controller, so large files cannot hold up every worker at once.
+    """
+
+    # files below ``small`` bytes are batched, up to ``batch`` per session
+    small = 100 * 1024
+    batch = 64
+    queue_size = 256
+
+    def __init__(self, plan, client, controller=None, journal=None, guard=None, priorities=None, lane=0):
+        self.plan = plan
+        self.client = client
+        self.controller = controller or AIMDController()
+        self.journal = journal
+        # a backlog.MemoryGuard: over its cap the walk waits for the queue to drain
+        self.guard = guard
+        self.priorities = priorities
+        self.lane = lane
+        self.units = None
+        self.failed = []
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def done(self, *actions):
+        if self.journal is not None:
+            for action in actions:
+                self.journal.done(action.op, action.local)
+
+    def apply(self, action):
+        if action.op == DELETE:
+            if os.path.isdir(action.local) and not os.path.islink(action.local):
+                shutil.rmtree(action.local)
+            elif os.path.lexists(action.local):
+                os.remove(action.local)
+        else:
+            os.makedirs(action.local, exist_ok=True)
+        self.done(action)
+
+    def prepare(self):
+        for action in self.plan:
+            if action.op == DELETE:
+                self.apply(action)
+        mkdirs = [a for a in self.plan if a.op == MKDIR]
+        for action in sorted(mkdirs, key=lambda a: a.local.count('/')):
+            self.apply(action)
+
+    def batch_key(self, action):
+        directory = os.path.dirname(action.local)
+        if self.priorities is None:
+            return directory, DEFAULT
+        return directory, self.priorities.classify(action.remote)[2]
+
+    def add(self, action):
+        if action.op not in TRANSFERS:
+            return self.apply(action)
+        if action.size - action.offset >= self.small:
+            return self.put([action])
+        key = self.batch_key(action)
+        with self.lock:
+            batch = self.batches.setdefault(key, [])
+            batch.append(action)
+            if len(batch) < self.batch:
+                return
+            del self.batches[key]
+        self.put(batch)
+
+    def flush(self, directory=None):
+        with self.lock:
+            if directory is None:
+                batches, self.batches = list(self.batches.values()), {}
+            else:
+                keys = [key for key in self.batches if key[0] == directory]
+                batches = [self.batches.pop(key) for key in keys]
+        for batch in batches:
+            self.put(batch)
+
+    def put(self, unit):
+        if self.guard is not None:
+            while self.units.qsize() and self.guard.over():
+                time.sleep(0.05)
+        # blocks the walk while the queue is full
+        self.units.put(unit, *self.rank(unit))
+
+    def rank(self, unit):
+        """(priority, deadline, small, dataset) of ``unit``: its most urgent action's."""
+        small = all(a.size - a.offset < self.small for a in unit)
+        if self.priorities is None:
+            return 0, None, small, DEFAULT
+        best = None
+        for action in unit:
+            priority, deadline, dataset = self.priorities.classify(action.remote)
+            if best is None or priority > best[0]:
+                best = [priority, deadline, dataset]
+            if deadline is not None and (best[1] is None or deadline < best[1]):
+                best[1] = deadline
+        return best[0], best[1], small, best[2]
+
+    def stream(self, walk):
+        """Run ``walk`` (a ``Planner.plan`` with this executor as its sink) and the transfers together."""
+        self.units = TransferQueue(self.queue_size)
+        workers = self.start()
+        try:
+            walk()
+            self.flush()
+        finally:
+            self.stop(workers)
+        return self.failed
+
+    def order(self):
+        groups = {}
+        large = []
+        for action in self.plan:
+            if action.op not in TRANSFERS:
+                continue
+            if action.size - action.offset < self.small:
+                groups.setdefault(self.batch_key(action), []).append(action)
+            else:
+                large.append([action])
+        small = []
+        for actions in groups.values():
+            for i in range(0, len(actions), self.batch):
+                small.append(actions[i:i + self.batch])
+        large.sort(key=lambda unit: unit[0].size, reverse=True)
+        large, small = deque(large), deque(small)
+        units = []
+        while large or small:
+            if large:
+                units.append(large.popleft())
+            if small:
+                units.append(small.popleft())
+        return units
+
+    def run(self):
+        self.prepare()
+        self.units = TransferQueue()
+        for unit in self.order():
+            self.units.put(unit, *self.rank(unit))
+        self.stop(self.start())
+        return self.failed
+
+    def start(self):
+        workers = [threading.Thread(target=self.work) for _ in range(self.controller.maximum)]
+        workers += [threading.Thread(target=self.work, args=(True,)) for _ in range(self.lane)]
+        for worker in workers:
+            worker.start()
+        return workers
+
+    def stop(self, workers):
+        self.units.close()
+        for worker in workers:
+            worker.join()
+
+    def metrics(self):
+        """Depth and per dataset waits of the transfer queue; see ``TransferQueue.metrics``."""
+        return self.units.metrics() if self.units is not None else None
+
+    def work(self, small=False):
+        while True:
+            unit = self.units.get(small)
+            if unit is None:
+                return
+            if not small:
+                self.controller.acquire()
+            items = []
+            for action in unit:
+                print(f'Getting {action.local}, {action.remote}')
+                # a REPLACE keeps the old copy readable until the new one is renamed over it
+                items.append((action.remote, action.local, action.offset or None, action.size, action.mtime,
+                              action.unique))
+            try:
+                failed = self.client.get_many(items)
+            except Exception as err:
+                failed = [(remote, local, err) for remote, local, *_ in items]
+            for remote, local, err in failed:
+                print(f"Something went wrong: {remote} {err}")
+            self.failed.extend(failed)
+            bad = {local for _, local, _ in failed}
+            self.done(*(a for a in unit if a.local not in bad))
+            size = sum(a.size - a.offset for a in unit if a.local not in bad)
+            if not small:
+                self.controller.release(size, len(unit) - len(failed), len(failed))
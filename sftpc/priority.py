@@ -0,0 +1,212 @@
+import heapq
+import itertools
+import posixpath
+import threading
+import time
+
+from sftpc.filters import Rule, relative
+
+DEFAULT = 'default'
+
+
+class PriorityRule:
+    __slots__ = ('rule', 'priority', 'deadline')
+
+    def __init__(self, pattern, priority=0, deadline=None):
+        self.rule = Rule(pattern)
+        self.priority = priority
+        # seconds a matching transfer may wait in the queue
+        self.deadline = deadline
+
+    def __repr__(self):
+        return f'<PriorityRule {self.rule.pattern} {self.priority} {self.deadline}>'
+
+
+def parse_priorities(lines):
+    """``PATTERN PRIORITY [DEADLINE]`` lines, ``#`` comments; patterns as in filter files."""
+    rules = []
+    for line in lines:
+        parts = line.split()
+        if not parts or parts[0].startswith('#'):
+            continue
+        if len(parts) not in (2, 3):
+            raise Exception(f'priority rule {line!r}: expected PATTERN PRIORITY [DEADLINE]')
+        deadline = float(parts[2]) if len(parts) == 3 else None
+        rules.append(PriorityRule(parts[0], int(parts[1]), deadline))
+    return rules
+
+
+class Priorities:
+    """
+    Priority and deadline of each transfer, from gitignore-style path rules.
+
+    The last matching rule wins and names the dataset the queue keeps its
+    metrics under; unmatched paths get priority 0, no deadline and the
+    ``default`` dataset.  A rule matching a directory covers the files
+    below it.  Paths are relative to ``root``, the sync root when None.
+    """
+
+    def __init__(self, rules=(), root=None):
+        self.rules = parse_priorities(rules)
+        self.root = root
+
+    @classmethod
+    def from_file(cls, path, root=None):
+        with open(path, encoding='utf8') as fd:
+            return cls(fd.read().splitlines(), root)
+
+    def add(self, pattern, priority=0, deadline=None):
+        self.rules.append(PriorityRule(pattern, priority, deadline))
+
+    def classify(self, path):
+        """(priority, deadline seconds or None, dataset) of remote ``path``."""
+        rel = relative(path, self.root)
+        parents = []
+        parent = posixpath.dirname(rel)
+        while parent:
+            parents.append(parent)
+            parent = posixpath.dirname(parent)
+        for rule in reversed(self.rules):
+            search = rule.rule.regex.search
+            if (not rule.rule.dir_only and search(rel)) or any(search(p) for p in parents):
+                return rule.priority, rule.deadline, rule.rule.pattern
+        return 0, None, DEFAULT
+
+
+class Entry:
+    __slots__ = ('unit', 'priority', 'deadline', 'queued', 'small', 'dataset', 'taken')
+
+    def __init__(self, unit, priority, deadline, queued, small, dataset):
+        self.unit = unit
+        self.priority = priority
+        self.deadline = deadline
+        self.queued = queued
+        self.small = small
+        self.dataset = dataset
+        self.taken = False
+
+
+class Waits:
+    __slots__ = ('queued', 'started', 'total', 'max', 'late')
+
+    def __init__(self):
+        self.queued = 0
+        self.started = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.late = 0
+
+
+class TransferQueue:
+    """
+    Transfer units taken by priority and deadline instead of arrival.
+
+    A waiting unit ranks by ``priority + waited / aging``: each ``aging``
+    seconds in the queue is worth one priority level, so low priorities
+    are late but never starve.  All units age alike, so the order only
+    changes as units arrive and a heap on ``queued / aging - priority``
+    keeps it.  A unit less than ``horizon`` seconds from its deadline goes
+    before any rank, earliest deadline first.
+
+    ``get(small=True)`` only takes units marked small: the lane of workers
+    that call it keeps small files moving while large ones hold the rest.
+    With ``maxsize`` a full queue blocks ``put``.  ``close`` lets workers
+    drain what is left and then get None.
+    """
+
+    aging = 60.0
+    horizon = 5.0
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.ready = threading.Condition()
+        self.ranked = {True: [], False: []}
+        self.due = {True: [], False: []}
+        self.seq = itertools.count()
+        self.depth = 0
+        self.peak = 0
+        self.closed = False
+        self.datasets = {}
+
+    def qsize(self):
+        return self.depth
+
+    def put(self, unit, priority=0, deadline=None, small=False, dataset=DEFAULT):
+        """Queue ``unit``; ``deadline`` is the seconds it may wait."""
+        with self.ready:
+            while self.maxsize and self.depth >= self.maxsize:
+                self.ready.wait()
+            now = time.monotonic()
+            entry = Entry(unit, priority, None if deadline is None else now + deadline, now, small, dataset)
+            seq = next(self.seq)
+            heapq.heappush(self.ranked[small], (now / self.aging - priority, seq, entry))
+            if entry.deadline is not None:
+                heapq.heappush(self.due[small], (entry.deadline, seq, entry))
+            self.depth += 1
+            self.peak = max(self.peak, self.depth)
+            waits = self.datasets.get(dataset)
+            if waits is None:
+                waits = self.datasets[dataset] = Waits()
+            waits.queued += 1
+            self.ready.notify_all()
+
+    def top(self, heap):
+        while heap and heap[0][2].taken:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def take(self, small):
+        lanes = (True,) if small else (True, False)
+        now = time.monotonic()
+        best = None
+        for lane in lanes:
+            item = self.top(self.due[lane])
+            if item is not None and item[0] <= now + self.horizon and (best is None or item < best):
+                best = item
+        if best is None:
+            for lane in lanes:
+                item = self.top(self.ranked[lane])
+                if item is not None and (best is None or item < best):
+                    best = item
+        if best is None:
+            return None
+        entry = best[2]
+        entry.taken = True
+        self.depth -= 1
+        waited = now - entry.queued
+        waits = self.datasets[entry.dataset]
+        waits.started += 1
+        waits.total += waited
+        waits.max = max(waits.max, waited)
+        if entry.deadline is not None and now > entry.deadline:
+            waits.late += 1
+        return entry
+
+    def get(self, small=False):
+        with self.ready:
+            while True:
+                entry = self.take(small)
+                if entry is not None:
+                    self.ready.notify_all()
+                    return entry.unit
+                if self.closed:
+                    return None
+                self.ready.wait()
+
+    def close(self):
+        with self.ready:
+            self.closed = True
+            self.ready.notify_all()
+
+    def metrics(self):
+        """Depth now and at peak, and per dataset the units started, their mean and longest wait, and how many missed a deadline."""
+        with self.ready:
+            return {
+                'depth': self.depth,
+                'peak': self.peak,
+                'datasets': {
+                    name: {'queued': w.queued, 'started': w.started, 'wait_mean': w.total / w.started if w.started else None,
+                           'wait_max': w.max, 'late': w.late}
+                    for name, w in self.datasets.items()
+                },
+            }
@@ -0,0 +1,188 @@
+import cProfile
+import collections
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+MEMORY = 'memory'
+ASYNCIO = 'asyncio'
+MODES = (CPROFILE, SAMPLE, MEMORY, ASYNCIO)
+
+
+def frame_label(code):
+    # collapsed stacks use ';' between frames
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class Profiler:
+    """
+    Profile a sync and write what was found to ``directory``.
+
+    Modes, any combination:
+
+    ``cprofile``
+        deterministic profile of every thread, ``profile.pstats`` for
+        ``python -m pstats`` or snakeviz and ``profile.txt`` with the top
+        functions by cumulative and own time.
+    ``sample``
+        all thread stacks every ``interval`` seconds, ``stacks.collapsed``
+        for flamegraph.pl or speedscope.  Cheap enough for a long run.
+    ``memory``
+        tracemalloc snapshots every ``snapshots`` seconds: the top
+        allocation sites in ``memory-NNN.txt``, growth since the first
+        snapshot in ``memory-growth.txt``.
+    ``asyncio``
+        loops passed to ``watch`` run in debug mode and callbacks slower
+        than ``slow`` seconds are logged to ``slow-callbacks.log``.
+    """
+
+    interval = 0.01
+    snapshots = 10.0
+    slow = 0.05
+    frames = 1
+    top = 40
+
+    def __init__(self, directory=None, modes=MODES):
+        modes = set(MODES if 'all' in modes else modes)
+        unknown = modes - set(MODES)
+        if unknown:
+            raise Exception(f'unknown profile modes {", ".join(sorted(unknown))}')
+        self.modes = modes
+        self.directory = directory or time.strftime('profile-%Y%m%d-%H%M%S')
+        self.done = threading.Event()
+        self.threads = []
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.first = None
+        self.count = 0
+        self.handler = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if SAMPLE in self.modes:
+            self.spawn(self.sample)
+        if MEMORY in self.modes:
+            tracemalloc.start(self.frames)
+            self.first = self.snapshot()
+            self.spawn(self.remember)
+        if ASYNCIO in self.modes:
+            self.handler = logging.FileHandler(self.path('slow-callbacks.log'))
+            self.handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            logging.getLogger('asyncio').addHandler(self.handler)
+        # last, so the profiler's own threads stay out of the profile
+        if CPROFILE in self.modes:
+            if sys.version_info < (3, 12):
+                threading.setprofile(self.profile_thread)
+            self.profile_thread()
+        return self
+
+    def spawn(self, target):
+        thread = threading.Thread(target=target, name='profiler', daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def profile_thread(self, *_):
+        # runs first thing in every new thread: before 3.12 cProfile only sees the
+        # thread that enabled it; since, it is built on sys.monitoring, which sees
+        # them all and allows one profiler per process
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def watch(self, loop):
+        """Report slow callbacks of an asyncio ``loop``; a no-op unless the asyncio mode is on."""
+        if ASYNCIO in self.modes:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.slow
+
+    def sample(self):
+        me = threading.get_ident()
+        while not self.done.wait(self.interval):
+            names = {thread.ident: re.sub(r'^Thread-\d+ ', '', thread.name) for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, 'thread').replace(';', ':'))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def snapshot(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        with open(self.path('memory-%03d.txt' % self.count), 'w') as fd:
+            fd.write(f'traced {current >> 10} KiB, peak {peak >> 10} KiB\n')
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                fd.write(f'{stat}\n')
+        self.count += 1
+        return snapshot
+
+    def remember(self):
+        while not self.done.wait(self.snapshots):
+            self.snapshot()
+
+    def stop(self):
+        if CPROFILE in self.modes:
+            if sys.version_info < (3, 12):
+                threading.setprofile(None)
+                sys.setprofile(None)
+            else:
+                self.profiles[0].disable()
+        self.done.set()
+        for thread in self.threads:
+            thread.join()
+        # before the profiles are summed up, which allocates plenty itself
+        if MEMORY in self.modes:
+            final = self.snapshot()
+            with open(self.path('memory-growth.txt'), 'w') as fd:
+                for stat in final.compare_to(self.first, 'lineno')[:self.top]:
+                    fd.write(f'{stat}\n')
+            tracemalloc.stop()
+        if CPROFILE in self.modes:
+            with self.lock:
+                profiles = list(self.profiles)
+            with open(self.path('profile.txt'), 'w') as fd:
+                stats = pstats.Stats(profiles[0], stream=fd)
+                for profile in profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(self.path('profile.pstats'))
+                fd.write(f'{len(profiles)} threads\n')
+                stats.sort_stats('cumulative').print_stats(self.top)
+                stats.sort_stats('tottime').print_stats(self.top)
+        if SAMPLE in self.modes:
+            with open(self.path('stacks.collapsed'), 'w') as fd:
+                for stack, count in sorted(self.stacks.items()):
+                    fd.write(f'{stack} {count}\n')
+        if self.handler is not None:
+            logging.getLogger('asyncio').removeHandler(self.handler)
+            self.handler.close()
+        logger.info("profile written to %s", self.directory)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, kind, value, tb):
+        self.stop()
@@ -0,0 +1,130 @@
+"""
+Control connection replies, shared by ``Client`` and ``AsyncFTP``.
+
+Replies are read as bytes and decoded once, a whole reply at a time, and
+come back as ``Reply``: the text the clients always compared against,
+with its ``code`` and ``lines`` derived on demand.  Replies a command did not
+expect raise a ``ReplyError`` subclass for their class.
+"""
+import re
+
+RE_150 = re.compile(r'150 .* \((\d+) bytes\)', re.IGNORECASE | re.ASCII)
+RE_227 = re.compile(r'(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)', re.ASCII)
+RE_229 = re.compile(r'\((.)[^)]*\1(\d+)\1\)', re.ASCII)
+RE_257 = re.compile(r'257 "((?:[^"]|"")*)')
+
+
+class Reply(str):
+    """A server reply; as a string, its lines joined by newlines."""
+
+    __slots__ = ()
+
+    @property
+    def code(self):
+        return int(self[:3])
+
+    @property
+    def lines(self):
+        return self.split('\n')
+
+
+class ReplyError(Exception):
+    """An unexpected reply, kept as ``reply``; its text is the message."""
+
+    def __init__(self, reply):
+        super().__init__(reply)
+        self.reply = reply
+
+
+class TransientError(ReplyError):
+    """4xx: the command may succeed if tried again."""
+
+
+class PermanentError(ReplyError):
+    """5xx: the command failed and will fail again."""
+
+
+class ProtocolError(ReplyError):
+    """A reply of the wrong kind, or no reply at all."""
+
+
+def error(reply):
+    """The ``ReplyError`` for ``reply``, to raise."""
+    kind = reply[:1]
+    if kind == '4':
+        return TransientError(reply)
+    if kind == '5':
+        return PermanentError(reply)
+    return ProtocolError(reply)
+
+
+class ReplyReader:
+    """Reads replies off ``file``, a binary buffered reader of the control connection."""
+
+    def __init__(self, file, encoding='utf8', limit=8192):
+        self.file = file
+        self.encoding = encoding
+        self.limit = limit
+
+    def read(self):
+        readline, limit = self.file.readline, self.limit
+        line = readline(limit + 1)
+        if not line:
+            raise EOFError
+        if len(line) > limit:
+            raise ProtocolError(f'reply line over {limit} bytes')
+        if line[3:4] != b'-':
+            return Reply(line.rstrip(b'\r\n').decode(self.encoding))
+        code = line[:3]
+        lines = [line.rstrip(b'\r\n')]
+        while True:
+            line = readline(limit + 1)
+            if not line:
+                raise EOFError
+            if len(line) > limit:
+                raise ProtocolError(f'reply line over {limit} bytes')
+            lines.append(line.rstrip(b'\r\n'))
+            if line[:3] == code and line[3:4] != b'-':
+                return Reply(b'\n'.join(lines).decode(self.encoding))
+
+    def close(self):
+        self.file.close()
+
+
+def parse150(resp):
+    if resp[:3] != '150':
+        raise error(resp)
+    m = RE_150.match(resp)
+    if not m:
+        return None
+    return int(m.group(1))
+
+
+def parse227(resp):
+    if resp[:3] != '227':
+        raise error(resp)
+    m = RE_227.search(resp)
+    if not m:
+        raise ProtocolError(resp)
+    numbers = m.groups()
+    host = '.'.join(numbers[:4])
+    port = (int(numbers[4]) << 8) + int(numbers[5])
+    return host, port
+
+
+def parse229(resp, peer):
+    if resp[:3] != '229':
+        raise error(resp)
+    m = RE_229.search(resp)
+    if not m:
+        raise ProtocolError(resp)
+    return peer[0], int(m.group(2))
+
+
+def parse257(resp):
+    if resp[:3] != '257':
+        raise error(resp)
+    m = RE_257.match(resp)
+    if not m:
+        return ''
+    return m.group(1).replace('""', '"')
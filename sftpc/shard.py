@@ -0,0 +1,186 @@
+import logging
+import os
+import posixpath
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from sftpc.adaptive import AIMDController
+from sftpc.backlog import Backlog, MemoryGuard
+from sftpc.cli import tls_context
+from sftpc.dedup import ContentIndex
+from sftpc.filters import Filter, relative
+from sftpc.ftpdirsync import Client
+from sftpc.journal import Journal
+from sftpc.mirrors import MirrorSet
+from sftpc.priority import Priorities
+from sftpc.stats import StatCollector
+from sftpc.throttle import Limiter
+from sftpc.tuning import SocketTuning
+from sftpc.utils import SyncDir
+
+logger = logging.getLogger(__name__)
+
+
+def connect(config):
+    limiter = None
+    if config.get('limiter'):
+        limiter = Limiter(**config['limiter'])
+    # an SSLContext does not pickle: every process builds its own
+    client = Client(limiter=limiter, context=tls_context(config.get('tls')))
+    client.fsync = config.get('fsync', client.fsync)
+    client.verify = config.get('verify', False)
+    if config.get('tuning'):
+        client.tuning = SocketTuning(config['tuning'])
+    if config.get('dedup'):
+        # every shard appends to the same index file but only reads it at start
+        client.content = ContentIndex(**config['dedup'])
+    client.connect(host=config['host'], port=config['port'])
+    client.login(user=config['user'], passwd=config['passwd'])
+    return client
+
+
+def children(client, local, remote, filter=None):
+    units = []
+    for path in client.listdir(remote):
+        if path.name in ['.', '..'] or path.args.get('type') not in ('file', 'dir'):
+            continue
+        if filter:
+            rel = relative(path.path, filter.root)
+            if path.isdir() and filter.skip_dir(rel) or path.isfile() and filter.skip_file(
+                    rel, int(path.get_size()), path.get_mtime()):
+                continue
+        units.append((os.path.join(local, path.name).replace('\\', '/'), path.path, path))
+    return units
+
+
+def make_filter(config):
+    if not config.get('filter'):
+        return None
+    filter = Filter(**config['filter'])
+    # units are subtrees; rules stay relative to the whole sync's root
+    filter.root = config['root']
+    return filter
+
+
+def partition(client, local, remote, shards, by='top', filter=None):
+    """
+    Split the tree under ``remote`` into ``shards`` lists of (local, remote, entry)
+    units; ``entry`` is the listing entry of a file unit, None for a directory.
+
+    ``top`` deals the top-level entries out round robin.  ``hash`` first
+    expands directories breadth first until there are plenty of units,
+    then places each by a stable hash of its path, so a shard keeps the
+    same subtrees from run to run.
+    """
+    units = children(client, local, remote, filter)
+    if by == 'hash':
+        want = shards * 8
+        while len(units) < want and any(path.isdir() for _, _, path in units):
+            expanded = []
+            for unit in units:
+                if unit[2].isdir():
+                    expanded.extend(children(client, unit[0], unit[1], filter) or [unit])
+                else:
+                    expanded.append(unit)
+            if len(expanded) == len(units):
+                break
+            units = expanded
+    units.sort(key=lambda unit: unit[1])
+    parts = [[] for _ in range(shards)]
+    for i, (local1, remote1, path) in enumerate(units):
+        if by == 'hash':
+            index = zlib.crc32(remote1.encode('utf8')) % shards
+        else:
+            index = i % shards
+        parts[index].append((local1, remote1, None if path.isdir() else path))
+    return parts
+
+
+def run_shard(config, index, units):
+    """Worker process: sync ``units`` over its own sessions and report back."""
+    failures = []
+    errors = []
+    client = connect(config)
+    filter = make_filter(config)
+    mirrors = MirrorSet(client, config['mirrors']) if config.get('mirrors') else None
+    # rules stay relative to the whole sync's root, like the filter's
+    priorities = Priorities(config['priorities'], config['root']) if config.get('priorities') else None
+    # the memory cap is per process, like the limiter's shares
+    guard = MemoryGuard(config['memory_cap'] << 20) if config.get('memory_cap') else None
+    backlog_peak = 0
+    try:
+        for local, remote, entry in units:
+            os.makedirs(posixpath.dirname(local) or '.', exist_ok=True)
+            workers = config.get('workers', (1, 8))
+            journal = None
+            if config.get('journal'):
+                # one journal per unit, named by its path so reruns find it
+                journal = Journal('%s.%08x' % (config['journal'], zlib.crc32(remote.encode('utf8'))))
+            backlog = Backlog(spill=config.get('spill'), guard=guard)
+            sync = SyncDir(local, remote, client, AIMDController(*workers),
+                           AIMDController(*workers, name='listing'), journal=journal, filter=filter,
+                           backlog=backlog, mirrors=mirrors, priorities=priorities, lane=config.get('lane', 0))
+            try:
+                if config.get('stream') and entry is None:
+                    failed = sync.stream(guard)
+                else:
+                    # a file is planned from its parent's listing: MLSD only lists directories
+                    sync.traverse(entry)
+                    failed = sync.run()
+                errors.extend(sync.plan.errors)
+                for path, _, err in failed:
+                    failures.append([getattr(path, 'path', path), str(err)])
+            except Exception as err:
+                logger.info("shard %d: %s failed: %s", index, remote, err)
+                failures.append([remote, str(err)])
+            finally:
+                backlog.close()
+            backlog_peak = max(backlog_peak, backlog.peak)
+        stats = client.stats.as_dict()
+    finally:
+        if client.content is not None:
+            client.content.close()
+        if mirrors is not None:
+            mirrors.close()
+        client.close()
+    return {'shard': index, 'units': len(units), 'stats': stats, 'failures': failures, 'errors': errors,
+            'rss_peak': guard.peak if guard is not None else None, 'backlog_peak': backlog_peak}
+
+
+def sync_sharded(config, local, remote, shards, by='top'):
+    """
+    Mirror ``remote`` into ``local`` with ``shards`` worker processes.
+
+    Every process owns its sessions and AIMD controllers.  Configured rates
+    and connection caps are split evenly between them.  Returns the merged
+    ``StatCollector`` and the per-shard reports.  A shard that fails as a
+    whole, e.g. cannot log in, reports its units as failed.
+    """
+    config = dict(config, root=remote)
+    client = connect(config)
+    try:
+        parts = partition(client, local, remote, shards, by, make_filter(config))
+    finally:
+        client.quit()
+    os.makedirs(local, exist_ok=True)
+    if config.get('limiter'):
+        limits = dict(config['limiter'])
+        for key in ('rate', 'host_rate', 'host_connections'):
+            if limits.get(key):
+                limits[key] = max(1, limits[key] // shards)
+        config['limiter'] = limits
+    stats = StatCollector()
+    reports = []
+    with ProcessPoolExecutor(max_workers=shards) as pool:
+        futures = [(i, part, pool.submit(run_shard, config, i, part)) for i, part in enumerate(parts) if part]
+        for i, part, future in futures:
+            try:
+                report = future.result()
+            except Exception as err:
+                logger.info("shard %d failed: %s", i, err)
+                reports.append({'shard': i, 'units': len(part), 'stats': None, 'errors': [],
+                                'failures': [[remote, str(err)] for _, remote, _ in part]})
+                continue
+            stats.merge(report['stats'])
+            reports.append(report)
+    return stats, reports
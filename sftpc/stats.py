@@ -10,11 +10,26 @@ class StatCollector:
     total = 0
     skipped = 0
     replaced = 0
+    tls_handshakes = 0
+    tls_resumed = 0
+    tls_time = 0.0
+    filtered_dirs = 0
+    filtered_files = 0
+    verified = 0
+    hash_mismatches = 0
+    hash_time = 0.0
+    deduped = 0
+    bytes_saved = 0
+    # the tuning.SocketTuning of the clients, if any
+    tuning = None
     start = time.time()
     last = None
     GiB = 1 << 30
     MiB = 1 << 20
     KiB = 1 << 10
+    counters = ('processed', 'downloaded', 'total', 'skipped', 'replaced',
+                'tls_handshakes', 'tls_resumed', 'tls_time', 'filtered_dirs', 'filtered_files',
+                'verified', 'hash_mismatches', 'hash_time', 'deduped', 'bytes_saved')
 
     def byte_suffix(self, size):
         """
@@ -34,25 +49,38 @@ class StatCollector:
         for factor, suffix in abbrevs:
             if size >= factor:
                 break
-        return suffix
+        return factor, suffix
 
     def humanize(self, size, starttime):
         interval = time.time() - starttime
         num = size / interval
-        suffix = self.byte_suffix(num)
-        return "{0:.2f} {1}/s".format(num, suffix)
+        factor, suffix = self.byte_suffix(num)
+        return "{0:.2f} {1}/s".format(num / factor, suffix)
 
     def calc_speed(self, path, size, starttime):
         speed = self.humanize(size, starttime)
-        self.last = path
+        self.last = getattr(path, 'name', path)
         self.downloaded += 1
         self.total += size
         print(f"Complete: {path}; Size: {size}; Rate {speed}")
 
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.counters}
+
+    def merge(self, counts):
+        # fold in another collector's as_dict(), e.g. from a worker process
+        for name in self.counters:
+            setattr(self, name, getattr(self, name) + counts.get(name, 0))
+
+    def tls_handshake(self, seconds, resumed):
+        self.tls_handshakes += 1
+        self.tls_resumed += bool(resumed)
+        self.tls_time += seconds
+
     def log_report(self):
-        msg = f"Elapsed Time: {time.time() - self.start}; Processed: {self.processed}; Total: {self.total}; Downloaded: {self.downloaded}; Skipped: {self.skipped};"
+        msg = f"Elapsed Time: {time.time() - self.start} seconds; Processed: {self.processed}; Total: {self.total}; Downloaded: {self.downloaded}; Skipped: {self.skipped};"
         logger.debug(msg)
-        print(msg, end='\r')
+        print(msg, end='')
 
     def show_end(self):
         span = time.time() - self.start
@@ -65,4 +93,22 @@ class StatCollector:
             "skipped": self.skipped,
             'avg rate': rate
         }
+        if self.tls_handshakes:
+            stats['tls handshakes'] = self.tls_handshakes
+            stats['tls resumed'] = self.tls_resumed
+            stats['tls time'] = self.tls_time
+        if self.filtered_dirs or self.filtered_files:
+            stats['filtered dirs'] = self.filtered_dirs
+            stats['filtered files'] = self.filtered_files
+        if self.verified or self.hash_mismatches:
+            # hashing runs inside the receive loop; this is its share of the time
+            stats['verified'] = self.verified
+            stats['hash mismatches'] = self.hash_mismatches
+            stats['hash time'] = self.hash_time
+        if self.deduped:
+            factor, suffix = self.byte_suffix(self.bytes_saved)
+            stats['deduped'] = self.deduped
+            stats['bytes saved'] = f"{self.bytes_saved / factor:.2f} {suffix}"
+        if self.tuning is not None and self.tuning.hosts:
+            stats['sockets'] = self.tuning.report()
         print(stats)
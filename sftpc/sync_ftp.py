@@ -0,0 +1,122 @@
+import logging
+
+from sftpc.adaptive import AIMDController
+from sftpc.backlog import Backlog, MemoryGuard
+from sftpc.cli import filter_options, limits, tls_context, tls_options
+from sftpc.filters import Filter
+from sftpc.ftpdirsync import Client
+from sftpc.journal import Journal
+from sftpc.throttle import Limiter
+from sftpc.utils import SyncDir
+
+logger = logging.getLogger(__name__)
+
+
+def mirrors(args):
+    from sftpc.mirrors import parse_mirror
+    return [parse_mirror(spec, args.user, args.password, args.port) for spec in args.mirrors]
+
+
+def priority_rules(args):
+    if not args.priorities:
+        return None
+    with open(args.priorities, encoding='utf8') as fd:
+        return fd.read().splitlines()
+
+
+def show_queue(metrics):
+    print(f"queue depth peak {metrics['peak']}")
+    for name, waits in sorted(metrics['datasets'].items()):
+        mean = waits['wait_mean']
+        print(f"  {name}: {waits['started']} started, wait mean {mean or 0:.2f} s, max {waits['wait_max']:.2f} s, "
+              f"{waits['late']} late")
+
+
+def sharded(args):
+    from sftpc.shard import sync_sharded
+    config = {'host': args.host, 'port': args.port, 'user': args.user, 'passwd': args.password,
+              'limiter': limits(args), 'workers': (args.min_workers, args.max_workers), 'fsync': args.fsync,
+              'journal': args.journal, 'filter': filter_options(args), 'verify': args.verify,
+              'dedup': {'path': args.dedup_index, 'mode': args.dedup} if args.dedup else None,
+              'mirrors': mirrors(args), 'tuning': args.link_rate if args.tune else None,
+              'priorities': priority_rules(args), 'lane': args.small_lane, 'tls': tls_options(args),
+              'stream': args.stream, 'memory_cap': args.memory_cap, 'spill': args.spill}
+    stats, reports = sync_sharded(config, args.local, args.remote, args.shards, args.shard_by)
+    failed = 0
+    for report in reports:
+        for path, err in report['failures'] + report['errors']:
+            print(f"shard {report['shard']}: {path}: {err}")
+            failed += 1
+        if report.get('rss_peak') is not None:
+            print(f"shard {report['shard']}: peak rss {report['rss_peak'] >> 20} MiB, "
+                  f"backlog peak {report['backlog_peak']}")
+    stats.show_end()
+    return 1 if failed else 0
+
+
+def run(args):
+    """``sftpc sync ftp``: mirror ``args.remote`` into ``args.local``; 1 if anything failed."""
+    if args.shards > 1:
+        return sharded(args)
+    options = limits(args)
+    limiter = Limiter(**options) if options else None
+    controller = AIMDController(minimum=args.min_workers, maximum=args.max_workers)
+    # mirrors and pooled sessions take the control connection's context
+    client = Client(limiter=limiter, context=tls_context(tls_options(args)))
+    client.fsync = args.fsync
+    client.verify = args.verify
+    if args.tune:
+        from sftpc.tuning import SocketTuning
+        client.tuning = SocketTuning(args.link_rate)
+    if args.dedup:
+        from sftpc.dedup import ContentIndex
+        client.content = ContentIndex(args.dedup_index, args.dedup)
+    client.connect(host=args.host, port=args.port)
+    client.login(user=args.user, passwd=args.password)
+    journal = Journal(args.journal) if args.journal and not args.plan else None
+    options = filter_options(args)
+    filter = Filter(**options) if options else None
+    guard = MemoryGuard(args.memory_cap << 20) if args.memory_cap else None
+    backlog = Backlog(spill=args.spill, guard=guard)
+    priorities = None
+    if args.priorities:
+        from sftpc.priority import Priorities
+        priorities = Priorities.from_file(args.priorities, args.remote)
+    transfers = None
+    if args.mirrors:
+        from sftpc.mirrors import MirrorSet
+        transfers = MirrorSet(client, mirrors(args))
+    sync = SyncDir(args.local, args.remote, client, controller, journal=journal, filter=filter, backlog=backlog,
+                   mirrors=transfers, priorities=priorities, lane=args.small_lane)
+    failed = []
+    if args.watch:
+        import signal
+        from sftpc.watch import Watcher
+        watcher = Watcher(client, args.local, args.remote, transfers, controller, filter=filter,
+                          minimum=args.watch, maximum=args.watch_max, metrics=args.watch_metrics,
+                          priorities=priorities, lane=args.small_lane)
+        signal.signal(signal.SIGTERM, lambda *_: watcher.stop())
+        watcher.run()
+    elif args.plan:
+        plan = sync.traverse()
+        with open(args.plan, 'w') as fd:
+            plan.dump(fd)
+        print(plan.counts())
+    elif args.stream:
+        failed = sync.stream(guard)
+        if guard is not None:
+            print(f"peak rss {guard.peak >> 20} MiB, backlog peak {backlog.peak}")
+    else:
+        sync.traverse()
+        failed = sync.run()
+    if (priorities is not None or args.small_lane) and sync.executor is not None:
+        show_queue(sync.executor.metrics())
+    client.stats.show_end()
+    if transfers is not None:
+        for line in transfers.report():
+            print(line)
+        transfers.close()
+    if client.content is not None:
+        client.content.close()
+    client.quit()
+    return 1 if failed else 0
@@ -0,0 +1,40 @@
+import asyncio
+
+from sftpc import aio_sftp
+from sftpc.adaptive import AIMDController
+from sftpc.backlog import Backlog, MemoryGuard
+from sftpc.cli import filter_options, limits
+from sftpc.filters import Filter
+from sftpc.throttle import Limiter
+
+
+async def watched(profiler, sync):
+    profiler.watch(asyncio.get_running_loop())
+    return await sync
+
+
+def run(args):
+    """``sftpc sync sftp``: mirror ``args.remote`` into ``args.local``; 1 if anything failed."""
+    options = limits(args)
+    limiter = Limiter(**options) if options else None
+    transfers = AIMDController(args.min_workers, args.max_workers, name='transfer')
+    listings = AIMDController(args.min_workers, args.max_workers, name='listing')
+    options = filter_options(args)
+    filter = Filter(**options) if options else None
+    guard = MemoryGuard(args.memory_cap << 20) if args.memory_cap else None
+    backlog = Backlog(spill=args.spill, guard=guard)
+    tuning = None
+    if args.tune:
+        from sftpc.tuning import SocketTuning
+        tuning = SocketTuning(args.link_rate)
+    sync = aio_sftp.run_client(args.host, args.port, args.user, args.password, args.local, args.remote,
+                               limiter, transfers, listings, filter, backlog, fsync=args.fsync, verify=args.verify,
+                               tuning=tuning)
+    if args.profiler is not None:
+        sync = watched(args.profiler, sync)
+    client = asyncio.run(sync)
+    if guard is not None:
+        print(f"peak rss {guard.peak >> 20} MiB, backlog peak {backlog.peak}")
+    if tuning is not None:
+        print({'sockets': tuning.report()})
+    return 1 if client.errors else 0
@@ -0,0 +1,223 @@
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TOO_MANY = re.compile(r'too many|connection limit|maximum|max.* connections', re.IGNORECASE)
+
+
+def too_many(err):
+    """True for a 421 or a 530 that is a connection limit, not bad credentials."""
+    resp = str(err)
+    if resp[:3] == '421':
+        return True
+    return resp[:3] == '530' and TOO_MANY.search(resp) is not None
+
+
+class TokenBucket:
+    """
+    Byte rate limiter shared between threads and coroutines.
+
+    Receivers take tokens after the bytes have arrived and sleep off any
+    debt, so a stalled reader lets the TCP window push back on the sender.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, size):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= size
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class HostSlots:
+    """
+    Per-server connection cap that shrinks and backs off when refused.
+
+    A cap lowered by a refusal grows back by one after ``regrow``
+    connections in a row are accepted, or after ``probe`` seconds without
+    a refusal while it is the only thing holding a connection back.  It
+    never grows past the configured ``limit``.
+    """
+
+    regrow = 8
+    probe = 60.0
+
+    def __init__(self, limit=None, backoff=1.0, max_backoff=60.0):
+        self.limit = limit
+        self.cap = limit
+        self.active = 0
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.delay = backoff
+        self.resume_at = 0.0
+        self.lowered = False
+        self.changed = 0.0
+        self.streak = 0
+        self.cond = threading.Condition()
+
+    def wait_time(self):
+        now = time.monotonic()
+        delay = self.resume_at - now
+        if delay > 0:
+            return delay
+        if self.limit is not None and self.active >= self.limit:
+            if not (self.lowered and now - self.changed >= self.probe):
+                return None
+            self.grow(now)
+        return 0.0
+
+    def grow(self, now):
+        self.limit += 1
+        self.lowered = self.cap is None or self.limit < self.cap
+        self.changed = now
+        self.streak = 0
+        logger.info("connection limit back up to %d", self.limit)
+        self.cond.notify_all()
+
+    def try_acquire(self):
+        with self.cond:
+            delay = self.wait_time()
+            if delay == 0.0:
+                self.active += 1
+            return delay
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                delay = self.wait_time()
+                if delay == 0.0:
+                    self.active += 1
+                    return
+                if delay is None and self.lowered:
+                    delay = max(0.01, self.changed + self.probe - time.monotonic())
+                self.cond.wait(delay)
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+
+    def accepted(self):
+        with self.cond:
+            self.delay = self.backoff
+            if self.lowered:
+                self.streak += 1
+                if self.streak >= self.regrow:
+                    self.grow(time.monotonic())
+
+    def refused(self):
+        # the server told us where its limit is: never go above what was
+        # open when it refused, and wait before the next attempt
+        with self.cond:
+            self.limit = max(1, self.active)
+            self.lowered = self.cap is None or self.limit < self.cap
+            self.changed = time.monotonic()
+            self.streak = 0
+            self.resume_at = self.changed + self.delay
+            logger.info("connection refused, limit %d, backing off %.1fs", self.limit, self.delay)
+            self.delay = min(self.delay * 2, self.max_backoff)
+
+
+class Limiter:
+    """
+    Global and per-host bandwidth shaping plus per-server connection caps.
+
+    A server is a host and port: mirrors on one machine share its rate but
+    each has its own cap and back-off.
+
+    Parameters
+    ----------
+    rate : int
+        aggregate bytes per second over every host, ``None`` for unlimited.
+    host_rate : int
+        bytes per second per host.
+    host_connections : int
+        connections allowed open to one server at a time.
+    retries : int
+        attempts to open a session after "too many connections" replies.
+    """
+
+    def __init__(self, rate=None, host_rate=None, host_connections=None, retries=5, backoff=1.0, max_backoff=60.0):
+        self.bucket = TokenBucket(rate) if rate else None
+        self.host_rate = host_rate
+        self.host_connections = host_connections
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.buckets = {}
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    def host_bucket(self, host):
+        if not self.host_rate:
+            return None
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.host_rate)
+            return self.buckets[host]
+
+    def host_slots(self, host, port=None):
+        with self.lock:
+            if (host, port) not in self.slots:
+                self.slots[host, port] = HostSlots(self.host_connections, self.backoff, self.max_backoff)
+            return self.slots[host, port]
+
+    def blocksize(self, host, blocksize):
+        # keep single reads well under a bucket so pacing stays smooth
+        for bucket in (self.bucket, self.host_bucket(host)):
+            if bucket is not None:
+                blocksize = min(blocksize, max(1, int(bucket.burst) // 4))
+        return blocksize
+
+    def delay(self, host, size):
+        delay = 0.0
+        for bucket in (self.bucket, self.host_bucket(host)):
+            if bucket is not None:
+                delay = max(delay, bucket.reserve(size))
+        return delay
+
+    def throttle(self, host, size):
+        delay = self.delay(host, size)
+        if delay:
+            time.sleep(delay)
+
+    async def athrottle(self, host, size):
+        delay = self.delay(host, size)
+        if delay:
+            # imported here: the threaded clients never load asyncio
+            import asyncio
+            await asyncio.sleep(delay)
+
+    def acquire(self, host, port=None):
+        self.host_slots(host, port).acquire()
+
+    async def aacquire(self, host, port=None):
+        import asyncio
+        slots = self.host_slots(host, port)
+        while True:
+            delay = slots.try_acquire()
+            if delay == 0.0:
+                return
+            await asyncio.sleep(delay if delay is not None else 0.05)
+
+    def release(self, host, port=None):
+        self.host_slots(host, port).release()
+
+    def accepted(self, host, port=None):
+        self.host_slots(host, port).accepted()
+
+    def refused(self, host, port=None):
+        self.host_slots(host, port).refused()
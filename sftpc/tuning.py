@@ -0,0 +1,133 @@
+import logging
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+KiB = 1 << 10
+MiB = 1 << 20
+
+
+def sysctl(name):
+    # the kernel silently caps SO_RCVBUF / SO_SNDBUF at these
+    try:
+        with open('/proc/sys/net/core/' + name) as fd:
+            return int(fd.read())
+    except (OSError, ValueError):
+        return None
+
+
+class HostTuning:
+    """What ``SocketTuning`` chose for one server."""
+
+    __slots__ = ('rtt', 'buffer', 'blocksize', 'applied')
+
+    def __init__(self, rtt, buffer, blocksize):
+        self.rtt = rtt
+        # the bandwidth-delay product, clamped
+        self.buffer = buffer
+        self.blocksize = blocksize
+        # what the kernel reported after setting it, None while autotuned
+        self.applied = None
+
+    def __repr__(self):
+        applied = 'auto' if self.applied is None else self.applied
+        return f'rtt {self.rtt * 1000:.1f} ms, buffer {self.buffer} (applied {applied}), block {self.blocksize}'
+
+
+class SocketTuning:
+    """
+    Socket options for the connections of a sync, sized per server.
+
+    Control connections get TCP_NODELAY, as every command waits for its
+    reply, and keepalive so firewalls do not drop them while a long
+    transfer runs.  Data connections get buffers of ``rate`` times the
+    server's round trip time, set before connecting so the window scale
+    is negotiated for them, and reads of the same size.  Buffers are only
+    ever raised; a size the kernel would cap (``net.core.rmem_max``) is
+    left to its autotuning instead, which that limit does not bind.
+
+    The round trip time is the fastest of the samples the connections
+    report, e.g. the ``USER`` round trip of every FTP login.
+    """
+
+    # link bytes/s the buffers are sized for
+    rate = 125_000_000
+    minimum = 64 * KiB
+    maximum = 64 * MiB
+    max_block = 4 * MiB
+    keepidle = 60
+    keepinterval = 15
+    keepcount = 4
+
+    def __init__(self, rate=None):
+        if rate:
+            self.rate = rate
+        self.hosts = {}
+        self.lock = threading.Lock()
+        self.limits = {socket.SO_RCVBUF: sysctl('rmem_max'), socket.SO_SNDBUF: sysctl('wmem_max')}
+
+    def sample(self, host, seconds):
+        """Record one round trip to ``host``; returns its ``HostTuning``."""
+        with self.lock:
+            tuned = self.hosts.get(host)
+            if tuned is not None and tuned.rtt <= seconds:
+                return tuned
+            buffer = min(max(int(self.rate * seconds), self.minimum), self.maximum)
+            self.hosts[host] = tuned = HostTuning(seconds, buffer, min(buffer, self.max_block))
+        logger.debug("%s: %r", host, tuned)
+        return tuned
+
+    def blocksize(self, host, default):
+        tuned = self.hosts.get(host)
+        return default if tuned is None else tuned.blocksize
+
+    def control(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Linux names; elsewhere the system keepalive timers apply
+        for name, value in (('TCP_KEEPIDLE', self.keepidle), ('TCP_KEEPINTVL', self.keepinterval),
+                            ('TCP_KEEPCNT', self.keepcount)):
+            option = getattr(socket, name, None)
+            if option is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, option, value)
+
+    def data(self, sock, host):
+        tuned = self.hosts.get(host)
+        if tuned is None:
+            return
+        for option, limit in self.limits.items():
+            if tuned.buffer <= sock.getsockopt(socket.SOL_SOCKET, option):
+                continue
+            if limit is not None and tuned.buffer > limit:
+                continue
+            sock.setsockopt(socket.SOL_SOCKET, option, tuned.buffer)
+            if option == socket.SO_RCVBUF:
+                tuned.applied = sock.getsockopt(socket.SOL_SOCKET, option)
+
+    def connect(self, address, timeout=None, source_address=None, host=None):
+        """
+        ``socket.create_connection`` with the options set before the handshake.
+
+        Data options for ``host`` when given, control options otherwise.
+        """
+        error = None
+        for family, kind, proto, _, sockaddr in socket.getaddrinfo(address[0], address[1], 0, socket.SOCK_STREAM):
+            sock = socket.socket(family, kind, proto)
+            try:
+                if host is None:
+                    self.control(sock)
+                else:
+                    self.data(sock, host)
+                sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except OSError as err:
+                error = err
+                sock.close()
+        raise error or OSError(f'no address for {address[0]}')
+
+    def report(self):
+        return {host: repr(tuned) for host, tuned in self.hosts.items()}
@@ -1,8 +1,9 @@
-from queue import Queue
 from threading import Thread
-import os
 import logging
 
+from sftpc.adaptive import AIMDController
+from sftpc.plan import Planner, Executor
+
 logger = logging.getLogger(__name__)
 
 class MyThread(Thread):
@@ -15,68 +16,74 @@ class MyThread(Thread):
     def run(self):
         self.client.get(self.remote, self.local)
 
-class Traverse(Thread):
-    def __init__(self, local, remote, client, queue):
-        super().__init__()
-        self.local = local
-        self.remote = remote
-        self.client = client
-        self.queue = queue
-
-    def traverse(self, local, remote):
-        self.client.stats.processed += 1
-        lst = self.client.listdir(remote)
-        if len(lst) == 1 and lst[0].isfile():
-            remote = lst[0]
-            size = remote.get_size()
-            if os.path.exists(local):
-                if os.path.getsize(local) >= int(size):
-                    self.client.stats.skipped += 1
-                    if self.client.stats.skipped % 10 == 0:
-                        logger.info("Skipping: %s" % remote)
-                    return
-                else:
-                    if os.path.isfile(local):
-                        os.remove(local)
-                    else:
-                        os.rmdir(local)
-                    self.client.stats.replaced += 1
-            self.queue.put((local, remote))
-        else:
-            if not os.path.exists(local):
-                os.mkdir(local)
-            for path in lst:
-                if path.name in ['.', '..']:
-                    continue
-                remote1 = path.path
-                local1 = os.path.join(local, path.name).replace('\\','/')
-                self.traverse(local1, remote1)
-
-    def run(self):
-        self.traverse(self.local, self.remote)
+class SyncDir:
+    """
+    Plan a mirror of ``remote`` into ``local``, then execute the plan.
 
+    ``traverse`` only reads: it lists the server and the local tree and
+    returns the ``Plan``.  ``run`` changes the local tree.
+    """
 
-class SyncDir:
-    def __init__(self, local, remote, client):
-        self.fifo = Queue()
+    def __init__(self, local, remote, client, controller=None, listings=None, delete=False, journal=None,
+                 filter=None, backlog=None, mirrors=None, priorities=None, lane=0):
         self.remote_root = remote
         self.local_root = local
         self.client = client
-        self.walker = Traverse(
-            self.local_root, self.remote_root, self.client, self.fifo
-        )
+        # a mirrors.MirrorSet takes the transfers; listings stay on ``client``
+        self.transfers = mirrors or client
+        # the controllers decide how many transfer and listing workers run
+        self.controller = controller or AIMDController()
+        # with a journal.Journal an interrupted sync resumes instead of starting over
+        self.journal = journal
+        # a priority.Priorities and the workers kept for small files; see ``Executor``
+        self.priorities = priorities
+        if priorities is not None and priorities.root is None:
+            priorities.root = remote
+        self.lane = lane
+        self.executor = None
+        self.planner = Planner(client, local, remote, listings, delete, journal=journal, filter=filter,
+                               backlog=backlog)
+        self.plan = None
 
-    def traverse(self):
-        self.walker.run()
+    def traverse(self, entry=None):
+        self.plan = self.planner.plan(entry)
+        return self.plan
 
-    def run(self):
-        while not self.fifo.empty() or self.walker.is_alive():
-            try:
-                local, remote = self.fifo.get(timeout=5)
-                print(f'Getting {local}, {remote}')
-                self.client.get(remote, local)
-                self.fifo.task_done()
-            except:
-                print("Something went wrong")
-                continue
+    def run(self, plan=None):
+        plan = plan or self.plan
+        journal = self.journal
+        self.transfers.journal = journal
+        executor = self.executor = Executor(plan, self.transfers, self.controller, journal,
+                                            priorities=self.priorities, lane=self.lane)
+        failed = executor.run()
+        print("Empty Queue")
+        self.finish(failed, plan.errors)
+        return failed
+
+    def finish(self, failed, errors):
+        if self.journal is not None:
+            if failed or errors:
+                self.journal.close()
+            else:
+                self.journal.remove()
+
+    def sync(self):
+        self.traverse()
+        return self.run()
+
+    def stream(self, guard=None):
+        """
+        Walk and download at once without holding the whole plan.
+
+        Memory stays flat however large the tree: the walker blocks on a
+        bounded transfer queue and pending directories live in the backlog.
+        """
+        journal = self.journal
+        self.transfers.journal = journal
+        executor = self.executor = Executor(None, self.transfers, self.controller, journal, guard, self.priorities,
+                                            self.lane)
+        self.planner.sink = executor
+        failed = executor.stream(self.traverse)
         print("Empty Queue")
+        self.finish(failed, self.plan.errors)
+        return failed
@@ -0,0 +1,91 @@
+import hashlib
+import re
+import zlib
+
+# strongest first: HASH algorithm names (draft-bryan-ftpext-hash) and the
+# older single-algorithm commands
+ALGORITHMS = (('SHA-512', 'sha512'), ('SHA-256', 'sha256'), ('SHA-1', 'sha1'), ('MD5', 'md5'), ('CRC32', 'crc32'))
+COMMANDS = (('XSHA512', 'sha512'), ('XSHA256', 'sha256'), ('XSHA1', 'sha1'), ('XMD5', 'md5'), ('XCRC', 'crc32'))
+
+# whole reply tokens that can be a digest of each algorithm; servers often
+# drop the leading zeros of a CRC
+DIGEST = {
+    'sha512': re.compile(r'[0-9a-fA-F]{128}'),
+    'sha256': re.compile(r'[0-9a-fA-F]{64}'),
+    'sha1': re.compile(r'[0-9a-fA-F]{40}'),
+    'md5': re.compile(r'[0-9a-fA-F]{32}'),
+    'crc32': re.compile(r'(?:0x)?[0-9a-fA-F]{1,8}'),
+}
+
+
+class HashMismatch(Exception):
+    pass
+
+
+class CRC32:
+    name = 'crc32'
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return '%08x' % self.value
+
+
+def new_hash(algorithm):
+    if algorithm == 'crc32':
+        return CRC32()
+    return hashlib.new(algorithm)
+
+
+def parse_feat(resp):
+    """Map each feature keyword of a 211 FEAT reply to its parameters."""
+    features = {}
+    for line in resp.splitlines()[1:-1]:
+        word, _, params = line.strip().partition(' ')
+        features[word.upper()] = params
+    return features
+
+
+def choose(features):
+    """
+    The strongest file hash a server offers, as (command, name, algorithm).
+
+    ``name`` is what ``OPTS HASH`` selects for the HASH command and None
+    for the X commands.  Returns None if the server has no file hashes.
+    """
+    if 'HASH' in features:
+        offered = {name.rstrip('*').upper() for name in features['HASH'].split(';')}
+        for name, algorithm in ALGORITHMS:
+            if name in offered:
+                return 'HASH', name, algorithm
+    for command, algorithm in COMMANDS:
+        if command in features:
+            return command, None, algorithm
+    return None
+
+
+def parse_digest(resp, algorithm):
+    # HASH answers "213 SHA-256 0-49 <digest> <file>", the X commands just
+    # "<code> <digest>"
+    pattern = DIGEST[algorithm]
+    for token in resp[4:].split():
+        if pattern.fullmatch(token):
+            if algorithm == 'crc32':
+                return '%08x' % int(token, 16)
+            return token.lower()
+    raise Exception(resp)
+
+
+def hash_prefix(path, digest, length):
+    """Feed the first ``length`` bytes of ``path`` to ``digest``: the part a resumed download already has."""
+    with open(path, 'rb') as fd:
+        while length > 0:
+            block = fd.read(min(length, 1 << 20))
+            if not block:
+                break
+            digest.update(block)
+            length -= len(block)
@@ -0,0 +1,252 @@
+import heapq
+import json
+import logging
+import posixpath
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sftpc.adaptive import AIMDController
+from sftpc.localindex import stat_entry
+from sftpc.plan import Executor, Plan, Planner, TRANSFERS
+
+logger = logging.getLogger(__name__)
+
+
+class Watched:
+    __slots__ = ('local', 'remote', 'modify', 'signature', 'interval', 'due', 'children')
+
+    def __init__(self, local, remote, modify=None, interval=None):
+        self.local = local
+        self.remote = remote
+        # the directory's modify fact in its parent's listing
+        self.modify = modify
+        # what its own listing looked like last time
+        self.signature = None
+        self.interval = interval
+        self.due = 0.0
+        self.children = set()
+
+
+def signature(listing):
+    return hash(frozenset((p.name, p.args.get('type'), p.args.get('size'), p.args.get('modify'))
+                          for p in listing if p.name not in ('.', '..')))
+
+
+class Watcher:
+    """
+    Keep ``local`` a mirror of ``remote``, polling for changes indefinitely.
+
+    Every directory has its own polling interval: a listing that changed
+    drops it to ``minimum`` seconds, an unchanged one doubles it up to
+    ``maximum``.  A subdirectory whose ``modify`` fact in its parent's
+    listing moved is polled in the same cycle, whatever its schedule, so a
+    new file turns up within about ``minimum`` seconds of its directory
+    being hot.  Files changed in place do not touch their directory's
+    modify fact and are found on the directory's own schedule.
+
+    Sessions stay logged in between cycles, with a NOOP every
+    ``keepalive`` seconds.  Each cycle is logged and, with ``metrics``,
+    appended to that JSONL file: directories polled and the time spent
+    listing them, transfers, and the delay from a file's remote mtime to
+    its arrival for files changed since the watch started, and the
+    transfer queue's depth and waits per dataset.
+    """
+
+    keepalive = 60.0
+
+    def __init__(self, client, local, remote, transfers=None, controller=None, listings=None, delete=False,
+                 filter=None, minimum=5.0, maximum=900.0, metrics=None, priorities=None, lane=0):
+        self.client = client
+        # a mirrors.MirrorSet or the client itself
+        self.transfers = transfers or client
+        self.controller = controller or AIMDController()
+        self.listings = listings or AIMDController(name='listing')
+        self.planner = Planner(client, local, remote, self.listings, delete, filter=filter)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.metrics = metrics
+        self.priorities = priorities
+        if priorities is not None and priorities.root is None:
+            priorities.root = remote
+        self.lane = lane
+        self.dirs = {}
+        self.queue = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.cycles = 0
+        self.started = time.time()
+        self.alive = time.monotonic()
+        self.schedule(self.add(Watched(local, remote, interval=self.minimum)), 0.0)
+
+    def add(self, watched):
+        self.dirs[watched.remote] = watched
+        return watched
+
+    def forget(self, remote):
+        # a directory gone from the server takes its subtree with it
+        watched = self.dirs.pop(remote, None)
+        if watched is not None:
+            for child in watched.children:
+                self.forget(child)
+
+    def schedule(self, watched, due):
+        watched.due = due
+        heapq.heappush(self.queue, (due, watched.remote))
+
+    def take_due(self, now):
+        due = []
+        while self.queue and self.queue[0][0] <= now:
+            when, remote = heapq.heappop(self.queue)
+            watched = self.dirs.get(remote)
+            # stale entries: rescheduled since, or forgotten
+            if watched is not None and watched.due == when:
+                due.append(watched)
+        return due
+
+    def poll(self, watched):
+        """List one directory, plan it and return the subdirectories to poll now."""
+        self.listings.acquire()
+        then = time.monotonic()
+        session = None
+        try:
+            session = self.client.session()
+            listing = session.listdir(watched.remote)
+        except Exception as err:
+            logger.info("listing %s failed: %s", watched.remote, err)
+            if session is not None:
+                self.client.discard(session)
+            self.listings.release(items=0, errors=1)
+            with self.lock:
+                self.schedule(watched, time.monotonic() + watched.interval)
+            return [], 0, time.monotonic() - then
+        self.client.release(session)
+        seconds = time.monotonic() - then
+        self.listings.release(len(listing))
+        subdirs = self.planner.diff_dir(watched.local, watched.remote, listing, stat_entry(watched.local))
+        facts = {p.path: p.args.get('modify') for p in listing if p.args.get('type') == 'dir'}
+        found = []
+        with self.lock:
+            seen = set()
+            for local, remote, _ in subdirs:
+                seen.add(remote)
+                modify = facts.get(remote)
+                child = self.dirs.get(remote)
+                if child is None:
+                    # cold ones back off from here like any other directory
+                    found.append(self.add(Watched(local, remote, modify, self.minimum)))
+                elif modify is not None and modify != child.modify:
+                    # entries were added, removed or renamed in it
+                    child.modify = modify
+                    found.append(child)
+            for remote in watched.children - seen:
+                self.forget(remote)
+            watched.children = seen
+            current = signature(listing)
+            if watched.signature is not None and current != watched.signature:
+                watched.interval = self.minimum
+            elif watched.signature is not None:
+                watched.interval = min(watched.interval * 2, self.maximum)
+            watched.signature = current
+            self.schedule(watched, time.monotonic() + watched.interval)
+        return found, len(listing), seconds
+
+    def cycle(self):
+        self.cycles += 1
+        start = time.monotonic()
+        plan = self.planner.result = Plan(self.planner.local, self.planner.remote)
+        if self.planner.filter is not None:
+            # file ages for --min-age and --max-age are as of this cycle
+            self.planner.filter.now = time.time()
+        polled = entries = 0
+        listing = 0.0
+        with self.lock:
+            due = self.take_due(start)
+        done = set()
+        with ThreadPoolExecutor(self.listings.maximum) as pool:
+            while due:
+                done.update(w.remote for w in due)
+                found = []
+                for subdirs, count, seconds in pool.map(self.poll, due):
+                    polled += 1
+                    entries += count
+                    listing += seconds
+                    found.extend(subdirs)
+                due = [w for w in found if w.remote not in done]
+        poll = time.monotonic() - start
+        failed = []
+        queue = None
+        if plan.actions:
+            plan.sort()
+            executor = Executor(plan, self.transfers, self.controller, priorities=self.priorities, lane=self.lane)
+            failed = executor.run()
+            queue = executor.metrics()
+            with self.lock:
+                for remote, local, err in failed:
+                    logger.info("%s failed: %s", remote, err)
+                    # try again soon rather than on a cold directory's schedule
+                    watched = self.dirs.get(posixpath.dirname(remote))
+                    if watched is not None:
+                        watched.interval = self.minimum
+                        self.schedule(watched, time.monotonic() + self.minimum)
+        now = time.time()
+        bad = {local for _, local, _ in failed}
+        transfers = [a for a in plan if a.op in TRANSFERS and a.local not in bad]
+        # only files changed while watching: older ones measure the backlog, not the watch
+        delays = sorted(now - a.mtime for a in transfers if a.mtime is not None and a.mtime >= self.started)
+        record = {
+            'cycle': self.cycles, 'time': now, 'watched': len(self.dirs), 'polled': polled,
+            'entries': entries, 'listing_seconds': listing, 'poll_seconds': poll,
+            'actions': len(plan), 'transfers': len(transfers), 'failed': len(failed),
+            'bytes': sum(a.size - a.offset for a in transfers),
+            'cycle_seconds': time.monotonic() - start,
+            'delay_median': delays[len(delays) // 2] if delays else None,
+            'delay_max': delays[-1] if delays else None,
+            'queue': queue,
+        }
+        if polled or plan.actions:
+            # quiet cycles only at debug level: a daemon polls all day
+            (logger.info if plan.actions else logger.debug)("cycle %d: polled %d of %d dirs in %.2f s, %d transfers, %d failed",
+                        self.cycles, polled, len(self.dirs), poll, len(transfers), len(failed))
+        if self.metrics is not None:
+            with open(self.metrics, 'a', encoding='utf8') as fd:
+                fd.write(json.dumps(record) + '\n')
+        return record
+
+    def ping(self):
+        # idle sessions would otherwise be dropped by the server's idle timeout
+        clients = [self.client] + [m.client for m in getattr(self.transfers, 'mirrors', [])[1:]]
+        for client in clients:
+            with client.lock:
+                sessions, client.idle = client.idle, []
+            for session in sessions:
+                try:
+                    session.sendcmd('NOOP')
+                except Exception as err:
+                    logger.debug("dropping idle session: %s", err)
+                    session.close()
+                    continue
+                client.release(session)
+        try:
+            self.client.sendcmd('NOOP')
+        except Exception as err:
+            logger.info("control connection lost: %s", err)
+        self.alive = time.monotonic()
+
+    def run(self, cycles=None):
+        try:
+            while not self.stopped.is_set():
+                self.cycle()
+                if cycles is not None and self.cycles >= cycles:
+                    break
+                now = time.monotonic()
+                if now - self.alive >= self.keepalive:
+                    self.ping()
+                with self.lock:
+                    due = self.queue[0][0] if self.queue else now + self.maximum
+                self.stopped.wait(min(max(due - now, 0.5), self.keepalive))
+        except KeyboardInterrupt:
+            logger.info("stopping")
+
+    def stop(self):
+        self.stopped.set()
@@ -1,28 +1,9 @@
-import logging
+"""``python sync.py`` is ``sftpc sync ftp`` configured from the environment and a .env next to this file."""
 import os
-from sftpc.ftpdirsync import Client
-from sftpc.utils import traverse, Pool
-import dotenv
-dotenv.load_dotenv()
+import sys
 
-logger = logging.getLogger(__name__)
-
-un = os.environ['UN']
-pw = os.environ['PW']
-pt = os.environ['PT']
-hn = os.environ['HN']
-LOCAL = os.environ['LOCAL']
-REMOTE = os.environ['REMOTE']
-
-
-def main():
-    pool = Pool(3)
-    client = Client()
-    client.connect(host=hn, port=pt)
-    client.login(user=un, passwd=pw)
-    local = LOCAL
-    remote = REMOTE
-    traverse(remote, local, client, pool)
+from sftpc.cli import main
 
 if __name__ == "__main__":
-    main()
+    env = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+    sys.exit(main(['--env-file', env, 'sync', 'ftp'] + sys.argv[1:]))
@@ -0,0 +1,50 @@
+import re
+
+import pytest
+
+from sftpc.filters import Filter, relative, translate
+
+
+@pytest.mark.parametrize('pattern, path, matches', [
+    ('*.log', 'app.log', True),
+    ('*.log', 'logs/app.log', False),
+    ('a?c', 'abc', True),
+    ('a?c', 'a/c', False),
+    ('**/tmp', 'tmp', True),
+    ('**/tmp', 'a/b/tmp', True),
+    ('data/**', 'data/x/y', True),
+    ('[ab].txt', 'b.txt', True),
+    ('[!ab].txt', 'b.txt', False),
+    ('[!ab].txt', 'c.txt', True),
+    ('[x', '[x', True),
+    ('a.b', 'axb', False),
+])
+def test_translate(pattern, path, matches):
+    assert bool(re.fullmatch(translate(pattern), path)) == matches
+
+
+def test_last_rule_wins_and_negation_reincludes():
+    rules = Filter(['*.tmp', '!keep.tmp', 'build/', '/top'])
+    assert rules.skip_file('a/b.tmp')
+    assert not rules.skip_file('a/keep.tmp')
+    assert rules.skip_dir('src/build')
+    # a directory-only rule leaves files of that name alone
+    assert not rules.skip_file('src/build')
+    # anchored at the root
+    assert rules.skip_file('top')
+    assert not rules.skip_file('sub/top')
+
+
+def test_include_size_and_age():
+    rules = Filter(include=['*.csv'], min_size=10, max_size=100, min_age=60, max_age=3600)
+    rules.now = 10000.0
+    assert rules.skip_file('a.txt', 50, 9000.0)
+    assert not rules.skip_file('a.csv', 50, 9000.0)
+    assert rules.skip_file('a.csv', 5, 9000.0)
+    assert rules.skip_file('a.csv', 500, 9000.0)
+    assert rules.skip_file('a.csv', 50, 9990.0)
+    assert rules.skip_file('a.csv', 50, 1000.0)
+
+
+def test_relative():
+    assert relative('/srv/data/a/b', '/srv/data') == 'a/b'
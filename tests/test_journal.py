@@ -0,0 +1,66 @@
+from sftpc.journal import Journal
+from sftpc.partfile import part_path
+from sftpc.plan import Action, DOWNLOAD, MKDIR, RESUME
+
+
+def test_replay_of_missing_journal_is_empty(tmp_path):
+    replay = Journal(str(tmp_path / 'journal')).replay()
+    assert not replay
+    assert replay.remaining() == []
+
+
+def test_remaining_skips_done_and_resumes_at_offsets(tmp_path):
+    journal = Journal(str(tmp_path / 'journal'))
+    done = str(tmp_path / 'done')
+    partial = str(tmp_path / 'partial')
+    fresh = str(tmp_path / 'fresh')
+    journal.action(Action(MKDIR, str(tmp_path / 'dir')))
+    for local in (done, partial, fresh):
+        journal.action(Action(DOWNLOAD, local, '/' + local, 100))
+    journal.done(MKDIR, str(tmp_path / 'dir'))
+    journal.done(DOWNLOAD, done)
+    journal.progress(partial, 60)
+    journal.planned()
+    journal.close()
+    # the part was preallocated past what the journal saw written
+    with open(part_path(partial), 'wb') as fd:
+        fd.write(b'x' * 80)
+
+    replay = journal.replay()
+    assert replay.planned
+    actions = {a.local: a for a in replay.remaining()}
+    assert set(actions) == {partial, fresh}
+    assert (actions[partial].op, actions[partial].offset) == (RESUME, 60)
+    assert (actions[fresh].op, actions[fresh].offset) == (DOWNLOAD, 0)
+
+
+def test_remaining_skips_files_renamed_before_their_done_record(tmp_path):
+    journal = Journal(str(tmp_path / 'journal'))
+    local = str(tmp_path / 'file')
+    journal.action(Action(DOWNLOAD, local, '/file', 3))
+    journal.close()
+    with open(local, 'wb') as fd:
+        fd.write(b'abc')
+    assert journal.replay().remaining() == []
+
+
+def test_progress_without_a_part_starts_over(tmp_path):
+    journal = Journal(str(tmp_path / 'journal'))
+    local = str(tmp_path / 'file')
+    journal.action(Action(RESUME, local, '/file', 100, offset=10))
+    journal.progress(local, 50)
+    journal.close()
+    [action] = journal.replay().remaining()
+    assert (action.op, action.offset) == (DOWNLOAD, 0)
+
+
+def test_torn_last_record_is_cut_off(tmp_path):
+    path = tmp_path / 'journal'
+    journal = Journal(str(path))
+    journal.action(Action(DOWNLOAD, str(tmp_path / 'a'), '/a', 1))
+    journal.close()
+    with open(path, 'a') as fd:
+        fd.write('{"ev": "action", "op"')
+    replay = journal.replay()
+    assert len(replay.actions) == 1
+    assert path.read_text().endswith('}\n')
@@ -0,0 +1,26 @@
+from sftpc.journal import Journal
+from sftpc.partfile import part_path
+from sftpc.plan import Action, DOWNLOAD, Planner, RESUME
+
+
+def test_streamed_resume_before_planned_skips_done_actions(tmp_path):
+    # a --stream run records done actions while the walk is still going
+    path = str(tmp_path / 'journal')
+    local = str(tmp_path / 'local')
+    journal = Journal(path)
+    files = [f'{local}/f{i}' for i in range(4)]
+    for name in files:
+        journal.action(Action(DOWNLOAD, name, '/remote/' + name[-2:], 100))
+    journal.listed(local, '/remote', [])
+    journal.done(DOWNLOAD, files[0])
+    journal.progress(files[1], 40)
+    journal.close()
+    (tmp_path / 'local').mkdir()
+    with open(part_path(files[1]), 'wb') as fd:
+        fd.write(b'x' * 40)
+
+    planner = Planner(None, local, '/remote', journal=Journal(path))
+    actions = {a.local: a for a in planner.plan()}
+    assert set(actions) == set(files[1:])
+    assert (actions[files[1]].op, actions[files[1]].offset) == (RESUME, 40)
+    assert Journal(path).replay().planned
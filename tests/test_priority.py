@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from sftpc.priority import DEFAULT, Priorities, TransferQueue
+
+
+def test_priority_order_and_fifo_ties():
+    queue = TransferQueue()
+    for unit, priority in (('a', 0), ('b', 5), ('c', 0), ('d', 5)):
+        queue.put(unit, priority)
+    assert [queue.get() for _ in range(4)] == ['b', 'd', 'a', 'c']
+
+
+def test_waiting_outranks_priority_eventually():
+    queue = TransferQueue()
+    queue.aging = 0.05
+    queue.put('old', 0)
+    time.sleep(0.15)
+    queue.put('new', 2)
+    assert queue.get() == 'old'
+
+
+def test_near_deadline_goes_first_earliest_first():
+    queue = TransferQueue()
+    queue.put('high', 10)
+    queue.put('later', 0, deadline=3.0)
+    queue.put('sooner', 0, deadline=1.0)
+    queue.put('far', 0, deadline=600.0)
+    assert [queue.get() for _ in range(4)] == ['sooner', 'later', 'high', 'far']
+
+
+def test_small_lane_only_takes_small_units():
+    queue = TransferQueue()
+    queue.put('big', 9)
+    queue.put('tiny', 0, small=True)
+    assert queue.get(small=True) == 'tiny'
+    queue.close()
+    assert queue.get(small=True) is None
+    assert queue.get() == 'big'
+    assert queue.get() is None
+
+
+def test_full_queue_blocks_put_until_get():
+    queue = TransferQueue(maxsize=1)
+    queue.put('a')
+    thread = threading.Thread(target=queue.put, args=('b',))
+    thread.start()
+    thread.join(0.1)
+    assert thread.is_alive()
+    assert queue.get() == 'a'
+    thread.join(1)
+    assert queue.get() == 'b'
+
+
+def test_metrics_per_dataset():
+    queue = TransferQueue()
+    queue.put('a', dataset='logs', deadline=0.0)
+    queue.put('b')
+    time.sleep(0.01)
+    queue.get()
+    metrics = queue.metrics()
+    assert (metrics['depth'], metrics['peak']) == (1, 2)
+    assert metrics['datasets']['logs']['late'] == 1
+    assert metrics['datasets'][DEFAULT] == {'queued': 1, 'started': 0, 'wait_mean': None, 'wait_max': 0.0,
+                                            'late': 0}
+
+
+def test_priorities_last_match_wins_and_covers_directories():
+    rules = Priorities(['# comment', 'manifests/ 10 2', '*.csv 3', 'hot/*.csv 7 30'], '/srv')
+    assert rules.classify('/srv/a/manifests/m.json') == (10, 2.0, 'manifests/')
+    assert rules.classify('/srv/x.csv') == (3, None, '*.csv')
+    assert rules.classify('/srv/hot/x.csv') == (7, 30.0, 'hot/*.csv')
+    assert rules.classify('/srv/other') == (0, None, DEFAULT)
+    rules.add('other', 1)
+    assert rules.classify('/srv/other')[0] == 1
+
+
+def test_priorities_reject_malformed_rules():
+    with pytest.raises(Exception):
+        Priorities(['just-a-pattern'])
@@ -0,0 +1,63 @@
+import io
+import pickle
+
+import pytest
+
+from sftpc.replies import (PermanentError, ProtocolError, Reply, ReplyReader, TransientError, error, parse150,
+                           parse227, parse229, parse257)
+
+
+def reader(data, limit=8192):
+    return ReplyReader(io.BufferedReader(io.BytesIO(data)), 'utf8', limit)
+
+
+def test_single_and_multiline_replies():
+    replies = reader(b'200 Type set to I\r\n211-Features:\r\n MDTM\r\n211 End\r\n226 Done\n')
+    first = replies.read()
+    assert first == '200 Type set to I' and isinstance(first, Reply) and first.code == 200
+    features = replies.read()
+    assert features.lines == ['211-Features:', ' MDTM', '211 End']
+    assert replies.read() == '226 Done'
+    with pytest.raises(EOFError):
+        replies.read()
+
+
+def test_multiline_ends_only_on_its_own_code():
+    replies = reader(b'150-a\r\n226 not the end\r\n150 end\r\n')
+    assert replies.read().lines == ['150-a', '226 not the end', '150 end']
+
+
+def test_overlong_line_is_a_protocol_error():
+    with pytest.raises(ProtocolError):
+        reader(b'200 ' + b'x' * 100 + b'\r\n', limit=50).read()
+
+
+def test_error_classes():
+    assert isinstance(error('421 Bye'), TransientError)
+    assert isinstance(error('550 No such file'), PermanentError)
+    assert isinstance(error('150 Opening'), ProtocolError)
+    assert error('550 No such file').reply == '550 No such file'
+
+
+def test_reply_pickles():
+    assert pickle.loads(pickle.dumps(Reply('200 OK'))) == '200 OK'
+
+
+def test_parsers():
+    assert parse150('150 Opening BINARY mode data connection for a (1048576 bytes)') == 1048576
+    assert parse150('150 Opening data connection') is None
+    assert parse227('227 Entering Passive Mode (127,0,0,1,200,10).') == ('127.0.0.1', 200 * 256 + 10)
+    assert parse229('229 Entering Extended Passive Mode (|||6446|)', ('10.0.0.1', 21)) == ('10.0.0.1', 6446)
+    assert parse257('257 "/a ""quoted"" dir" is current') == '/a "quoted" dir'
+    assert parse257('257 no quotes') == ''
+
+
+@pytest.mark.parametrize('parser, reply', [
+    (parse150, '550 No such file'),
+    (parse227, '227 Entering Passive Mode'),
+    (lambda resp: parse229(resp, ('h', 0)), '229 Entering Extended Passive Mode (|||x|)'),
+    (parse257, '550 Denied'),
+])
+def test_parsers_reject(parser, reply):
+    with pytest.raises((PermanentError, ProtocolError)):
+        parser(reply)
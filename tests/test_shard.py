@@ -0,0 +1,111 @@
+import pytest
+
+from bench.servers import FTPStandIn
+from sftpc import sync_ftp
+from sftpc.cli import parse
+from sftpc.filters import Filter
+from sftpc.ftpdirsync import PathIO
+from sftpc.shard import connect, partition, run_shard
+from sftpc.stats import StatCollector
+
+TREE = {
+    '/r': ['a/', 'b/', 'c/', 'top.txt', 'skip.tmp'],
+    '/r/a': ['x/', 'y/', 'a1'],
+    '/r/a/x': ['f'],
+    '/r/a/y': ['g'],
+    '/r/b': ['b1', 'b2'],
+    '/r/c': [],
+}
+
+
+class Lister:
+    def listdir(self, remote):
+        entries = [PathIO('.', remote, type='cdir')]
+        for name in TREE[remote]:
+            if name.endswith('/'):
+                entries.append(PathIO(name[:-1], remote, type='dir'))
+            else:
+                entries.append(PathIO(name, remote, type='file', size='1', modify='20240101000000'))
+        return entries
+
+
+def flat(parts):
+    return sorted(remote for part in parts for _, remote, _ in part)
+
+
+def test_top_deals_top_level_entries_round_robin():
+    parts = partition(Lister(), '/l', '/r', 2)
+    assert flat(parts) == ['/r/a', '/r/b', '/r/c', '/r/skip.tmp', '/r/top.txt']
+    assert [len(part) for part in parts] == [3, 2]
+    units = {remote: (local, entry) for part in parts for local, remote, entry in part}
+    # directories are listed by their shard, files carry their listing entry
+    assert units['/r/a'] == ('/l/a', None)
+    local, entry = units['/r/top.txt']
+    assert local == '/l/top.txt' and entry.path == '/r/top.txt' and entry.get_size() == '1'
+
+
+def test_hash_expands_directories_and_is_stable():
+    parts = partition(Lister(), '/l', '/r', 2, by='hash')
+    remotes = flat(parts)
+    # every file is covered once, whether as itself or inside a directory unit
+    assert len(remotes) == len(set(remotes))
+    assert '/r/a' not in remotes and '/r/a/a1' in remotes
+    assert set(remotes) >= {'/r/b/b1', '/r/b/b2', '/r/top.txt'}
+    again = partition(Lister(), '/l', '/r', 2, by='hash')
+    assert [[remote for _, remote, _ in part] for part in parts] == [[remote for _, remote, _ in part] for part in again]
+    for part in parts:
+        for local, remote, _ in part:
+            assert local == '/l' + remote[len('/r'):]
+
+
+def test_filter_prunes_units():
+    filter = Filter(['*.tmp', 'c/'])
+    filter.root = '/r'
+    assert flat(partition(Lister(), '/l', '/r', 3, filter=filter)) == ['/r/a', '/r/b', '/r/top.txt']
+
+
+def test_shard_streams_under_its_memory_cap(tmp_path):
+    remote = tmp_path / 'remote'
+    for name in ('a/x/1', 'a/x/2', 'a/y/3', 'b/4', 'top'):
+        (remote / name).parent.mkdir(parents=True, exist_ok=True)
+        (remote / name).write_bytes(name.encode())
+    (tmp_path / 'spill').mkdir()
+    server = FTPStandIn(str(remote))
+    host, port = server.start()
+    # a 1 MiB cap is always exceeded: every pending directory goes to the spill file
+    config = {'host': host, 'port': port, 'user': 'bench', 'passwd': 'bench', 'root': '/',
+              'stream': True, 'memory_cap': 1, 'spill': str(tmp_path / 'spill')}
+    try:
+        client = connect(config)
+        [units] = partition(client, str(tmp_path / 'local'), '/', 1)
+        client.quit()
+        report = run_shard(config, 0, units)
+    finally:
+        server.stop()
+    assert report['failures'] == [] and report['errors'] == []
+    assert report['rss_peak'] > 1 << 20 and report['backlog_peak'] == 0
+    for name in ('a/x/1', 'a/x/2', 'a/y/3', 'b/4', 'top'):
+        assert (tmp_path / 'local' / name).read_bytes() == name.encode()
+    assert list((tmp_path / 'spill').iterdir()) == []
+
+
+ARGS = ['sync', 'ftp', '/l', '/r', '--host', 'h', '--user', 'u', '--password', 'p', '--shards', '2']
+
+
+def test_sharded_run_forwards_streaming_options(monkeypatch, tmp_path):
+    seen = {}
+
+    def sync_sharded(config, local, remote, shards, by):
+        seen.update(config)
+        return StatCollector(), []
+
+    monkeypatch.setattr('sftpc.shard.sync_sharded', sync_sharded)
+    args = parse(ARGS + ['--memory-cap', '64', '--spill', str(tmp_path)], {})
+    assert sync_ftp.run(args) == 0
+    assert (seen['stream'], seen['memory_cap'], seen['spill']) == (True, 64, str(tmp_path))
+
+
+@pytest.mark.parametrize('option', [['--plan', 'plan.json'], ['--watch', '5']])
+def test_shards_reject_plan_and_watch(option):
+    with pytest.raises(SystemExit):
+        parse(ARGS + option, {})
@@ -0,0 +1,13 @@
+from sftpc.throttle import Limiter
+
+
+def test_servers_on_one_host_have_their_own_slots():
+    limiter = Limiter(host_connections=2)
+    limiter.acquire('h', 21)
+    limiter.acquire('h', 21)
+    assert limiter.host_slots('h', 21).try_acquire() is None
+    assert limiter.host_slots('h', 2121).try_acquire() == 0.0
+    # a refusal backs off only the server that refused
+    limiter.refused('h', 21)
+    assert limiter.host_slots('h', 21).try_acquire() > 0
+    assert limiter.host_slots('h', 2121).try_acquire() == 0.0
@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+
+from bench.servers import FTPStandIn
+from sftpc.ftpdirsync import Client
+from sftpc.watch import Watcher
+
+MINIMUM = 0.5
+
+
+def wait_for(path, timeout):
+    deadline = time.monotonic() + timeout
+    while not path.exists():
+        if time.monotonic() > deadline:
+            return None
+        time.sleep(0.05)
+    return time.monotonic()
+
+
+def test_new_file_in_existing_nested_directory_arrives_within_a_few_minimum_intervals(tmp_path):
+    remote = tmp_path / 'remote'
+    nested = remote / 'a' / 'b'
+    nested.mkdir(parents=True)
+    (nested / 'old').write_bytes(b'old')
+    # older than the watch, as a directory that was already there would be
+    past = time.time() - 3600
+    for path in (nested, nested.parent):
+        os.utime(path, (past, past))
+    local = tmp_path / 'local'
+    server = FTPStandIn(str(remote))
+    host, port = server.start()
+    client = Client()
+    client.connect(host, port)
+    client.login('bench', 'bench')
+    watcher = Watcher(client, str(local), '/', minimum=MINIMUM, maximum=60.0)
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+    try:
+        assert wait_for(local / 'a' / 'b' / 'old', 10.0)
+        # let the first cycles pass, so the directories are past their first poll
+        time.sleep(2 * MINIMUM)
+        created = time.monotonic()
+        (nested / 'new').write_bytes(b'new')
+        arrived = wait_for(local / 'a' / 'b' / 'new', 10.0)
+        assert arrived is not None and arrived - created < 6 * MINIMUM
+    finally:
+        watcher.stop()
+        thread.join(5)
+        client.quit()
+        server.stop()